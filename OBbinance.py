@@ -1,11 +1,13 @@
 import streamlit as st
-import streamlit.components.v1 as components
-import pandas as pd
 from binance.client import Client  # Assuming you have imported the Binance client
 from binance.enums import HistoricalKlinesType
-from highcharts_stock.chart import Chart
 from orderblockdetector import *
-import pprint
+from confluence import ConfluenceIndex
+from klinestore import KlineStore
+from ohlcv import kline_array_to_ohlcv
+from livechart import live_chart
+from obpool import detect_order_blocks_grid, detection_pool
+from datafeed import FetchCache, RateLimiter, fetch_concurrent, fetch_with_retry
     
 client = Client()
 
@@ -37,142 +39,103 @@ selected_ob_length = st.sidebar.multiselect(
 symbols = [selected_ticker]
 intervals = [selected_timeframe]
 
+# --- Define interval mapping ---
+# Map timeframe strings to their respective bar interval in milliseconds.
+interval_map = {
+    '30m': 30 * 60 * 1000,
+    '1h': 3600000,
+    '4h': 4 * 3600000,
+    '8h': 8 * 3600000,
+    '1d': 24 * 3600000,
+    '1w': 7 * 24 * 3600000,
+}
+
 # --- Retrieve Data ---
-def get_historical_data(symbols, intervals, limit=180, save_path=None):
+@st.cache_resource
+def get_kline_store():
     """
-    Retrieve historical data for a list of symbols from Binance API.
+    One local kline store per server process, shared by all reruns and sessions.
     """
-    client = Client()  # Initialize the Binance client with your API credentials
-    data = {}
-    for symbol in symbols:
-        placeholder.write(f"Fetching data for {symbol}...")
-        for inter in intervals:
-            klines = client.get_historical_klines(symbol, inter, klines_type=HistoricalKlinesType.SPOT, limit=limit)
-            df = pd.DataFrame(klines, columns=['datetime', 'open', 'high', 'low', 'close', 'volume',
-                                                'close_time', 'qav', 'num_trades', 'taker_base_vol',
-                                                'taker_quote_vol', 'ignore'])
-            df['datetime'] = pd.to_datetime(df['datetime'], unit='ms')
-            df.set_index('datetime', inplace=True)
-            data[symbol] = df
+    return KlineStore(client=client)
 
-            # Save the DataFrame to a pickle file if save_path is provided
-            if save_path:
-                df.to_pickle(f"{save_path}/{symbol}_{inter}_data.pkl")
-    return data
+@st.cache_resource
+def get_fetch_cache():
+    """
+    Memoized fetches shared by all reruns (entries expire with the bar of their interval).
+    """
+    return FetchCache()
 
-def get_combined_order_blocks(selected_ticker, intervals, n_bars):
+@st.cache_resource
+def get_rate_limiter():
+    """
+    Spaces out the Binance requests of every fetch thread.
     """
-    Retrieves historical data for each selected timeframe (interval), applies order block detection,
-    and then combines the bull and bear order block bands so that each interval’s order blocks are
-    extended (merged) with those from every other timeframe but not with its own.
+    return RateLimiter(rate=10)
 
-    Parameters:
-        selected_ticker (str): The ticker symbol (e.g., "BTCUSDT").
-        intervals (list): List of timeframes (e.g., ["1d", "8h", "4h", "1h"]).
-        n_bars (int): Number of bars to retrieve for each timeframe.
+@st.cache_resource
+def get_detection_pool():
+    """
+    Worker processes for large detection grids (see obpool.detect_order_blocks_grid).
+    """
+    return detection_pool()
+
+# Resolve the shared resources here: fetch_data also runs in worker threads without a Streamlit context.
+kline_store = get_kline_store()
+fetch_cache = get_fetch_cache()
+rate_limiter = get_rate_limiter()
 
-    Returns:
-        tuple: A tuple (bull_bands_combine, bear_bands_combine) where each is a dictionary with key 'plotBands'
-            containing the combined bull or bear order block bands.
+def fetch_data(symbol, interval, n_bars):
     """
-    # First, compute order blocks for each unique interval
-    OBs_by_interval = {}
-    unique_intervals = list(set(intervals))
-    for inter in unique_intervals:
-        historical_data = get_historical_data([selected_ticker], [inter], limit=n_bars, save_path=None)
-        data = historical_data[selected_ticker].astype(float)
-        data['time'] = data.index
-        
-        # detect_order_blocks returns: (df_with_ob, bull_OB, bear_OB)
-        _, bull_OB, bear_OB = detect_order_blocks(
-            data, length=3, bull_ext_last=3, bear_ext_last=3, mitigation='Wick'
-        )
-        OBs_by_interval[inter] = {"bull": bull_OB[-2:], "bear": bear_OB[-2:]}
-        
-    
-    # Now, for each interval, extend its order blocks with order blocks from all other intervals
-    merged_bull_OB = []
-    merged_bear_OB = []
-    for inter in unique_intervals:
-        # Copy the current interval's OB lists (without merging with itself)
-        bull_blocks = OBs_by_interval[inter]["bull"].copy()
-        bear_blocks = OBs_by_interval[inter]["bear"].copy()
-        # Extend with order blocks from other intervals
-        for other_inter in unique_intervals:
-            if other_inter == inter:
-                continue  # skip same interval
-            bull_blocks.extend(OBs_by_interval[other_inter]["bull"])
-            bear_blocks.extend(OBs_by_interval[other_inter]["bear"])
-        # Add the merged list to the final collection.
-        merged_bull_OB.extend(bull_blocks)
-        merged_bear_OB.extend(bear_blocks)
-        
-    
-    # Optionally remove duplicate order blocks (if your OB objects are dicts, this is one approach)
-    def remove_duplicates(ob_list):
-        seen = {}
-        for ob in ob_list:
-            # Using a frozenset of the items as a simple (hashable) key. 
-            key = frozenset(ob.items())
-            seen[key] = ob
-        return list(seen.values())
-    
-    merged_bull_OB = remove_duplicates(merged_bull_OB)
-    merged_bear_OB = remove_duplicates(merged_bear_OB)
-    
-    # Create plotbands from the merged order blocks.
-    bull_bands_combine = create_bull_plotbands(merged_bull_OB)
-    bear_bands_combine = create_bear_plotbands(merged_bear_OB)
-    
-    return bull_bands_combine, bear_bands_combine
+    Float64 OHLCV DataFrame with a 'time' column (see ohlcv.ohlcv_frame) for one symbol/interval. Identical requests
+    within a render and across reruns are served from the fetch cache; misses are rate limited
+    and retried up to 3 times. Returns None if every attempt failed.
+    """
+    def fetch():
+        klines = kline_store.get(symbol, interval, limit=n_bars, klines_type=HistoricalKlinesType.SPOT)
+        return kline_array_to_ohlcv(klines)
 
+    key = ('binance', symbol, 'BINANCE', interval, n_bars)
+    data = fetch_cache.get(
+        key, interval_map[interval], lambda: fetch_with_retry(fetch, label=symbol, rate_limiter=rate_limiter)
+    )
+    return None if data is None else data.copy()
 
 
 # --- Retrieve and preprocess historical data ---
 # Assuming variables such as symbols, intervals, n_bars, selected_ticker,
 # selected_timeframe, and selected_intervals are defined elsewhere.
 
+# Fetch every timeframe shown on this page concurrently; the results land in the fetch cache,
+# so the fetch_data calls below (and in the multi-timeframe loop) are served from memory.
+placeholder.write(f"Fetching data for {selected_ticker}...")
+fetch_concurrent([(selected_ticker, inter, n_bars) for inter in [selected_timeframe] + selected_intervals], fetch_data)
+
 # Fetch historical data only once.
-historical_data = get_historical_data(symbols, intervals, limit=n_bars, save_path=None)
-data = historical_data[selected_ticker].astype(float)
-data['time'] = data.index
+data = fetch_data(selected_ticker, selected_timeframe, n_bars)
+if data is None:
+    placeholder.empty()
+    st.error(f"Could not fetch {selected_ticker} {selected_timeframe} data, please try again later.")
+    st.stop()
 
 # # Detect order blocks on the fetched data.
 df_with_ob, active_bull_OB, active_bear_OB = detect_order_blocks(
-    data, length=3, bull_ext_last=3, bear_ext_last=3, mitigation='Wick'
+    data, length=3, bull_ext_last=3, bear_ext_last=3, mitigation='Wick', engine='numpy'
 )
 
 # # Determine the last candle time from the data.
 last_candle = data['time'].iloc[-1]
 
-# # --- Define interval mapping ---
-# # Map timeframe strings to their respective bar interval in milliseconds.
-interval_map = {
-    '30m': 30 * 60 * 1000,
-    '1h': 3600000,
-    '4h': 4 * 3600000,
-    '8h': 8 * 3600000,
-    '1d': 24 * 3600000,
-    '1w': 7 * 24 * 3600000,
-}
-
 # # --- Create default series for the selected timeframe ---
 bear_bands_series = create_bear_series(active_bear_OB, last_candle, bar_interval=interval_map[selected_timeframe])
 bull_bands_series = create_bull_series(active_bull_OB, last_candle, bar_interval=interval_map[selected_timeframe])
 
-# # --- Build output list for candlestick chart ---
-# # Each entry is [timestamp_millis, open, high, low, close, volume].
-output_list = []
-for idx, row in data.iterrows():
-    ts_millis = int(idx.timestamp() * 1000)
-    output_list.append([
-        ts_millis, row["open"], row["high"], row["low"], row["close"], row["volume"]
-    ])
-
 # --- Process additional intervals if provided ---
 if selected_intervals:
     bear_series_list = []
     bull_series_list = []
+    # The OBs drawn below; their tops/bottoms feed the stacking sweep directly.
+    bear_blocks = []
+    bull_blocks = []
     
     # Define color mapping for each interval for bear and bull series.
     bear_color_map = {
@@ -190,22 +153,27 @@ if selected_intervals:
         '30m': 'rgba(139, 0, 0, 0.5)' 
     }
     
+    # Detect the order blocks for every selected interval and OB length at once; large grids
+    # are spread over worker processes.
+    frames = {interval: fetch_data(selected_ticker, interval, n_bars) for interval in selected_intervals}
+    failed = [interval for interval, frame in frames.items() if frame is None]
+    if failed:
+        st.warning(f"No data for {selected_ticker} on {', '.join(failed)}; those timeframes are skipped.")
+        frames = {interval: frame for interval, frame in frames.items() if frame is not None}
+    OBs_grid = detect_order_blocks_grid(frames, lengths=selected_ob_length, mitigation='Wick', as_records=True,
+                                        executor=get_detection_pool())
+
     # Loop over the selected intervals to create series with unique visual properties.
     for idx, interval in enumerate(selected_intervals):
+        # Get the corresponding bar interval value.
+        bar_interval_val = interval_map[interval]
+    
+        if interval not in OBs_grid:
+            continue
+        OBs_by_length = OBs_grid[interval]
+    
         for ob_length in selected_ob_length:
-            # Get the corresponding bar interval value.
-            bar_interval_val = interval_map[interval]
-        
-            # Optionally, if your application requires data re-aggregation per timeframe,
-            # modify or aggregate 'data' here. Otherwise, you can reuse the same data.
-            historical_data_tf = get_historical_data(symbols, [interval], limit=n_bars, save_path=None)
-            data_tf = historical_data_tf[selected_ticker].astype(float)
-            data_tf['time'] = data_tf.index
-        
-            # Recalculate the order blocks using the same data_tf for demonstration.
-            df_with_ob_tf, active_bull_OB_tf, active_bear_OB_tf = detect_order_blocks(
-                data_tf, length=ob_length, bull_ext_last=3, bear_ext_last=3, mitigation='Wick'
-            )
+            active_bull_OB_tf, active_bear_OB_tf = OBs_by_length[ob_length]
         
             # Create bear and bull series for the current interval using the last 3 elements.
             bear_series = create_bear_series(active_bear_OB_tf[-3:], last_candle, bar_interval=bar_interval_val)
@@ -217,17 +185,16 @@ if selected_intervals:
         
             bear_series_list.append(bear_series)
             bull_series_list.append(bull_series)
+            bear_blocks.extend(active_bear_OB_tf[-3:])
+            bull_blocks.extend(active_bull_OB_tf[-3:])
 
-    all_stacked_bull = find_all_stacked_points(bull_series_list)
-    all_stacked_bull_1 = [(x, max(pair), c) for x, pair, c in all_stacked_bull]
+    # The 2 most stacked bands (at least 2 OBs) among the OBs live at the last candle.
+    last_candle_ms = int(last_candle.timestamp() * 1000)
+    counts, lower, upper = ConfluenceIndex.from_order_blocks(bull_blocks).top_bands(last_candle_ms, k=2, min_count=2)
+    all_stacked_bull_1 = list(zip(counts.tolist(), upper.tolist(), ((lower + upper) / 2).tolist()))
     
-    all_stacked_bear = find_all_stacked_points(bear_series_list)
-    all_stacked_bear_1 = [(x, min(pair), c) for x, pair, c in all_stacked_bear]
-
-
-    # Use the first 3 intervals.
-    all_stacked_bear_1 = [item for item in all_stacked_bear_1 if item[0] > 1][:2]
-    all_stacked_bull_1 = [item for item in all_stacked_bull_1 if item[0] > 1][:2]
+    counts, lower, upper = ConfluenceIndex.from_order_blocks(bear_blocks).top_bands(last_candle_ms, k=2, min_count=2)
+    all_stacked_bear_1 = list(zip(counts.tolist(), lower.tolist(), ((lower + upper) / 2).tolist()))
 
     # Build the plotLines dictionary using a list comprehension.
     plotLines_bear = {
@@ -275,7 +242,6 @@ if selected_intervals:
     chart_series = [{
             'type': 'candlestick',
             'name': selected_ticker,
-            'data': output_list,
             'enableMouseTracking': False,
             'dataGrouping': {
                 'enabled': False 
@@ -290,7 +256,6 @@ else:
         {
             'type': 'candlestick',
             'name': selected_ticker,
-            'data': output_list,
             'enableMouseTracking': False,
             'dataGrouping': {
                 'enabled': False 
@@ -355,35 +320,9 @@ chart_options = {
     'series': chart_series
 }
 
-# Build the Highcharts chart object
-# Build your chart object and generate its JS literal from your chart_options.
-chart = Chart.from_options(chart_options)
-js_code = chart.to_js_literal()
-
-# Modify the JS code to bind the chart to the container div
-js_code = js_code.replace("Highcharts.stockChart(null", "Highcharts.stockChart('container'")
-
-html_template = f"""
-                    <!DOCTYPE html>
-                    <html>
-                        <head>
-                            <meta charset="utf-8" />
-                            <!-- Load Highcharts, Highstock, and required modules from CDN -->
-                            <script src="https://code.highcharts.com/stock/highstock.js"></script>
-                            <script src="https://code.highcharts.com/highcharts.js"></script>
-                            <script src="https://code.highcharts.com/highcharts-more.js"></script>
-                        </head>
-                            <body>
-                                <div id="container" style="width: 100%; height: 600px;"></div>
-                                <script>
-                                {js_code}
-                                </script>
-                            </body>
-                    </html>
-"""
-
-# Embed the chart in Streamlit
-components.html(html_template, height=700, scrolling=False)
+# Embed the chart in Streamlit. The chart stays mounted across reruns and only receives the
+# changes: new or updated candles (taken from 'data'), added or removed OBs and plotLines.
+live_chart(chart_options, data, key='ob_chart', height=700)
 
 
 placeholder.empty()
\ No newline at end of file
@@ -1,14 +1,25 @@
 import streamlit as st
-import streamlit.components.v1 as components
-import pandas as pd
 from tvDatafeed import TvDatafeed, Interval
-from highcharts_stock.chart import Chart
 from orderblockdetector import *
+from confluence import ConfluenceIndex
+from ohlcv import tv_to_ohlcv
+from livechart import live_chart
+from obpool import detect_order_blocks_grid, detection_pool
+from datafeed import FetchCache, RateLimiter, fetch_concurrent, fetch_with_retry
 # import pprint
-import time
+import threading
     
 tv = TvDatafeed()
 
+# A TvDatafeed session holds a single websocket, so every fetch thread reuses its own session.
+_tv_sessions = threading.local()
+_tv_sessions.tv = tv
+
+def get_tv():
+    if not hasattr(_tv_sessions, 'tv'):
+        _tv_sessions.tv = TvDatafeed()
+    return _tv_sessions.tv
+
 
 # Use full browser width (or centered layout as desired)
 st.set_page_config(layout="wide")
@@ -43,26 +54,65 @@ interval_tvmap = {
     "1w": Interval.in_weekly,
     "1M": Interval.in_monthly
 }
+
+# --- Define interval mapping ---
+# Map timeframe strings to their respective bar interval in milliseconds.
+interval_map = {
+    '30m': 30 * 60 * 1000,
+    '1h': 3600000,
+    '4h': 4 * 3600000,
+    '8h': 8 * 3600000,
+    '1d': 24 * 3600000,
+    '1w': 7 * 24 * 3600000,
+}
     
 
 # --- Retrieve and preprocess historical data ---
 # Assuming variables such as symbols, intervals, n_bars, selected_ticker,
 # selected_timeframe, and selected_intervals are defined elsewhere.
 
-# Fetch historical data only once.
-attempt = 0
-historical_data = None
 max_retries = 3
-while attempt < max_retries:
-    try:
-        historical_data = tv.get_hist(
-            symbol=selected_ticker,
+
+@st.cache_resource
+def get_fetch_cache():
+    """
+    Memoized fetches shared by all reruns (entries expire with the bar of their interval).
+    """
+    return FetchCache()
+
+@st.cache_resource
+def get_rate_limiter():
+    """
+    Spaces out the TradingView requests of every fetch thread.
+    """
+    return RateLimiter(rate=2)
+
+@st.cache_resource
+def get_detection_pool():
+    """
+    Worker processes for large detection grids (see obpool.detect_order_blocks_grid).
+    """
+    return detection_pool()
+
+# Resolve the shared resources here: fetch_data also runs in worker threads without a Streamlit context.
+fetch_cache = get_fetch_cache()
+rate_limiter = get_rate_limiter()
+
+def fetch_data(symbol, exchange, interval, n_bars):
+    """
+    Float64 OHLCV DataFrame with a 'time' column (see ohlcv.ohlcv_frame) from TradingView, retried up to max_retries times.
+    Identical requests within a render and across reruns are served from the fetch cache.
+    Returns None if every attempt failed.
+    """
+    def fetch():
+        data = get_tv().get_hist(
+            symbol=symbol,
             exchange=exchange,
-            interval=interval_tvmap[selected_timeframe],
+            interval=interval_tvmap[interval],
             n_bars=n_bars
         )
-        if selected_timeframe == '8h':
-            historical_data = historical_data.resample('8h', origin='07:00').agg({
+        if interval == '8h':
+            data = data.resample('8h', origin='07:00').agg({
                                     'symbol': 'first',
                                     'open': 'first',
                                     'high': 'max',
@@ -70,52 +120,48 @@ while attempt < max_retries:
                                     'close': 'last',
                                     'volume': 'sum'
                                 })
-        
-        historical_data['time'] = historical_data.index
-        break
-    except Exception as e:
-        attempt += 1
-        print(f"Attempt {attempt} for {selected_ticker} failed: {e}")
-        time.sleep(1)
+        return tv_to_ohlcv(data)
+
+    key = ('tradingview', symbol, exchange, interval, n_bars)
+    data = fetch_cache.get(
+        key, interval_map[interval],
+        lambda: fetch_with_retry(fetch, label=symbol, max_retries=max_retries, rate_limiter=rate_limiter)
+    )
+    return None if data is None else data.copy()
+
+# Fetch every timeframe shown on this page concurrently; the results land in the fetch cache,
+# so the fetch_data calls below (and in the multi-timeframe loop) are served from memory.
+fetch_concurrent([(selected_ticker, exchange, inter, n_bars) for inter in [selected_timeframe] + selected_intervals],
+                 fetch_data)
+
+# Fetch historical data only once.
+historical_data = fetch_data(selected_ticker, exchange, selected_timeframe, n_bars)
+if historical_data is None:
+    placeholder.empty()
+    st.error(f"Could not fetch {selected_ticker} {selected_timeframe} data, please try again later.")
+    st.stop()
 
 data = historical_data  # no volume data
 
 # Detect order blocks on the fetched data.
 df_with_ob, active_bull_OB, active_bear_OB = detect_order_blocks(
-    data, length=2, bull_ext_last=3, bear_ext_last=3, mitigation='Wick'
+    data, length=2, bull_ext_last=3, bear_ext_last=3, mitigation='Wick', engine='numpy'
 )
 # Determine the last candle time from the data.
 last_candle = data['time'].iloc[-1]
 
-# --- Define interval mapping ---
-# Map timeframe strings to their respective bar interval in milliseconds.
-interval_map = {
-    '30m': 30 * 60 * 1000,
-    '1h': 3600000,
-    '4h': 4 * 3600000,
-    '8h': 8 * 3600000,
-    '1d': 24 * 3600000,
-    '1w': 7 * 24 * 3600000,
-}
-
 # --- Create default series for the selected timeframe ---
 
 bear_bands_series = create_bear_series(active_bear_OB, last_candle, bar_interval=interval_map[selected_timeframe])
 bull_bands_series = create_bull_series(active_bull_OB, last_candle, bar_interval=interval_map[selected_timeframe])
 
-# --- Build output list for candlestick chart ---
-# Each entry is [timestamp_millis, open, high, low, close, volume].
-output_list = []
-for idx, row in data.iterrows():
-    ts_millis = int(idx.timestamp() * 1000)
-    output_list.append([
-        ts_millis, row["open"], row["high"], row["low"], row["close"], row["volume"]
-    ])
-
 # --- Process additional intervals if provided ---
 if selected_intervals:
     bear_series_list = []
     bull_series_list = []
+    # The OBs drawn below; their tops/bottoms feed the stacking sweep directly.
+    bear_blocks = []
+    bull_blocks = []
     
     # Define color mapping for each interval for bear and bull series.
     bear_color_map = {
@@ -133,44 +179,27 @@ if selected_intervals:
         '30m': 'rgba(45, 107, 6, 0.2)' 
     }
     
+    # Detect the order blocks for every selected interval and OB length at once; large grids
+    # are spread over worker processes.
+    frames = {interval: fetch_data(selected_ticker, exchange, interval, n_bars) for interval in selected_intervals}
+    failed = [interval for interval, frame in frames.items() if frame is None]
+    if failed:
+        st.warning(f"No data for {selected_ticker} on {', '.join(failed)}; those timeframes are skipped.")
+        frames = {interval: frame for interval, frame in frames.items() if frame is not None}
+    OBs_grid = detect_order_blocks_grid(frames, lengths=selected_ob_length, mitigation='Wick', as_records=True,
+                                        executor=get_detection_pool())
+
     # Loop over the selected intervals to create series with unique visual properties.
     for idx, interval in enumerate(selected_intervals):
+        # Get the corresponding bar interval value.
+        bar_interval_val = interval_map[interval]
+        
+        if interval not in OBs_grid:
+            continue
+        OBs_by_length = OBs_grid[interval]
+        
         for ob_length in selected_ob_length:
-            # Get the corresponding bar interval value.
-            bar_interval_val = interval_map[interval]
-            
-            # Optionally, if your application requires data re-aggregation per timeframe,
-            # modify or aggregate 'data' here. Otherwise, you can reuse the same data.
-            attempt = 0
-            data_tf = None
-            while attempt < max_retries:
-                try:
-                    data_tf = tv.get_hist(
-                        symbol=selected_ticker,
-                        exchange=exchange,
-                        interval=interval_tvmap[interval],
-                        n_bars=n_bars
-                    )
-                    if interval == '8h':
-                        data_tf = historical_data.resample('8h', origin='07:00').agg({
-                                                'symbol': 'first',
-                                                'open': 'first',
-                                                'high': 'max',
-                                                'low': 'min',
-                                                'close': 'last',
-                                                'volume': 'sum'
-                                            })
-                    data_tf['time'] = data_tf.index
-                    break
-                except Exception as e:
-                    attempt += 1
-                    print(f"Attempt {attempt} for {selected_ticker} failed: {e}")
-                    time.sleep(1)
-            
-            # Recalculate the order blocks using the same data_tf for demonstration.
-            df_with_ob_tf, active_bull_OB_tf, active_bear_OB_tf = detect_order_blocks(
-                data_tf, length=ob_length, bull_ext_last=ob_length, bear_ext_last=ob_length, mitigation='Wick'
-            )
+            active_bull_OB_tf, active_bear_OB_tf = OBs_by_length[ob_length]
             
             # Create bear and bull series for the current interval using the last 3 elements.
             bear_series = create_bear_series(active_bear_OB_tf[-3:], last_candle, bar_interval=bar_interval_val)
@@ -182,17 +211,16 @@ if selected_intervals:
             
             bear_series_list.append(bear_series)
             bull_series_list.append(bull_series)
+            bear_blocks.extend(active_bear_OB_tf[-3:])
+            bull_blocks.extend(active_bull_OB_tf[-3:])
         
-    all_stacked_bull = find_all_stacked_points(bull_series_list)
-    all_stacked_bull_1 = [(x, max(pair), c) for x, pair, c in all_stacked_bull]
+    # The 2 most stacked bands (at least 2 OBs) among the OBs live at the last candle.
+    last_candle_ms = int(last_candle.timestamp() * 1000)
+    counts, lower, upper = ConfluenceIndex.from_order_blocks(bull_blocks).top_bands(last_candle_ms, k=2, min_count=2)
+    all_stacked_bull_1 = list(zip(counts.tolist(), upper.tolist(), ((lower + upper) / 2).tolist()))
     
-    all_stacked_bear = find_all_stacked_points(bear_series_list)
-    all_stacked_bear_1 = [(x, min(pair), c) for x, pair, c in all_stacked_bear]
-
-
-    # Use the first 3 intervals.
-    all_stacked_bear_1 = [item for item in all_stacked_bear_1 if item[0] > 1][:2]
-    all_stacked_bull_1 = [item for item in all_stacked_bull_1 if item[0] > 1][:2]
+    counts, lower, upper = ConfluenceIndex.from_order_blocks(bear_blocks).top_bands(last_candle_ms, k=2, min_count=2)
+    all_stacked_bear_1 = list(zip(counts.tolist(), lower.tolist(), ((lower + upper) / 2).tolist()))
 
     # Build the plotLines dictionary using a list comprehension.
     plotLines_bear = {
@@ -240,7 +268,6 @@ if selected_intervals:
     chart_series = [{
             'type': 'candlestick',
             'name': selected_ticker,
-            'data': output_list,
             'enableMouseTracking': False,
             'dataGrouping': {
                 'enabled': False 
@@ -255,7 +282,6 @@ else:
         {
             'type': 'candlestick',
             'name': selected_ticker,
-            'data': output_list,
             'enableMouseTracking': False,
             'dataGrouping': {
                 'enabled': False 
@@ -321,35 +347,9 @@ chart_options = {
     'series': chart_series
 }
 
-# Build the Highcharts chart object
-# Build your chart object and generate its JS literal from your chart_options.
-chart = Chart.from_options(chart_options)
-js_code = chart.to_js_literal()
-
-# Modify the JS code to bind the chart to the container div
-js_code = js_code.replace("Highcharts.stockChart(null", "Highcharts.stockChart('container'")
-
-html_template = f"""
-                    <!DOCTYPE html>
-                    <html>
-                        <head>
-                            <meta charset="utf-8" />
-                            <!-- Load Highcharts, Highstock, and required modules from CDN -->
-                            <script src="https://code.highcharts.com/stock/highstock.js"></script>
-                            <script src="https://code.highcharts.com/highcharts.js"></script>
-                            <script src="https://code.highcharts.com/highcharts-more.js"></script>
-                        </head>
-                            <body>
-                                <div id="container" style="width: 100%; height: 600px;"></div>
-                                <script>
-                                {js_code}
-                                </script>
-                            </body>
-                    </html>
-"""
-
-# Embed the chart in Streamlit
-components.html(html_template, height=700, scrolling=False)
+# Embed the chart in Streamlit. The chart stays mounted across reruns and only receives the
+# changes: new or updated candles (taken from 'data'), added or removed OBs and plotLines.
+live_chart(chart_options, data, key='ob_chart', height=700)
 
 
 placeholder.empty()
@@ -363,21 +363,23 @@ pcs = token_info[selected_ticker].get('pricePrecision')
 
 def display_ob_values(title, ob_list, keys, color, ac):
     col1, col2, col3 = st.columns(3)
+    # Leverage of every displayed OB in one call to the compiled bracket table (NaN if none fits).
+    shown = [ob if ob and isinstance(ob, dict) else {} for ob in ob_list[:3]]
+    leverages = leverage_for(
+        [ob.get(keys[0], math.nan) for ob in shown],
+        [ob.get(keys[1], math.nan) for ob in shown],
+        side=ac,
+        wallet_balance=1000,
+        symbol=selected_ticker,
+        bracket_data=futures_bracket
+    ).tolist()
     # Display up to 3 OBs, one per column
     for i, col in enumerate([col1, col2, col3]):
         if i < len(ob_list):
             ob = ob_list[i]
             if ob and isinstance(ob, dict):
                 val = ob.get(keys[0], 'No data')
-                sl = ob.get(keys[1], 'No data')
-                L = int(binance_leverage_custom(
-                    liq_price=sl,
-                    entry_price=val,
-                    wallet_balance=1000,
-                    side=ac,
-                    symbol=selected_ticker,
-                    bracket_data=futures_bracket
-                ))
+                L = int(leverages[i]) if math.isfinite(leverages[i]) else 'n/a'
                 with col:
                     st.markdown(f"###### <span style='color:{color}'>{title}</span> | SL ({i}) -x{L}", unsafe_allow_html=True)
                     
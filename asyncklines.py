@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from klinestore import _market_name, kline_array_to_frame, klines_to_array
+
+# Kline endpoint and page size per market type (see HistoricalKlinesType).
+_KLINE_METHODS = {
+    'SPOT': ('get_klines', 1000),
+    'FUTURES': ('futures_klines', 1500),
+    'FUTURES_COIN': ('futures_coin_klines', 1500),
+}
+
+# Binance answers 429 when the request weight limit is exceeded and 418 once an IP keeps
+# hammering after 429s; -1003 is the matching API error code.
+_RATE_LIMIT_STATUS = (429, 418)
+_RATE_LIMIT_CODE = -1003
+
+
+def _klines_weight(market, limit):
+    """
+    Request weight of one klines call ('market' as returned by _market_name).
+    """
+    if market == 'SPOT':
+        return 2
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightLimiter:
+    """
+    Asyncio limiter for Binance's request weight budget ('limit' weight per 'window' seconds).
+
+    Every request reserves its weight before it is sent and waits while the budget of the
+    sliding window is used up. The used weight reported by the exchange (X-MBX-USED-WEIGHT-1M)
+    is fed back through observe(), so requests made by other processes on the same IP are
+    accounted for as well. pause() holds back every request, e.g. for a Retry-After.
+    """
+
+    def __init__(self, limit=1200, window=60, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._spent = deque()  # (time, weight)
+        self._used = 0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, weight):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._expire(now)
+                wait = self._paused_until - now
+                if wait <= 0 and self._used + weight > self.limit and self._spent:
+                    wait = self._spent[0][0] + self.window - now
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._spent.append((now, weight))
+            self._used += weight
+
+    def observe(self, used_weight):
+        """
+        Raises the local count to the used weight reported by the exchange.
+        """
+        missing = used_weight - self._used
+        if missing > 0:
+            self._spent.append((self._clock(), missing))
+            self._used += missing
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def _expire(self, now):
+        while self._spent and self._spent[0][0] + self.window <= now:
+            self._used -= self._spent.popleft()[1]
+
+
+def _is_rate_limited(error):
+    return (getattr(error, 'status_code', None) in _RATE_LIMIT_STATUS
+            or getattr(error, 'code', None) == _RATE_LIMIT_CODE)
+
+
+def _retry_after(error):
+    """
+    Seconds from the Retry-After header of a rate limited response, or None.
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _observe_used_weight(client, limiter):
+    headers = getattr(getattr(client, 'response', None), 'headers', None) or {}
+    used = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('x-mbx-used-weight-1m')
+    if used is not None:
+        try:
+            limiter.observe(int(used))
+        except ValueError:
+            pass
+
+
+async def _call(client, limiter, weight, method, max_retries=5, backoff=1.0, **params):
+    """
+    Calls client.<method>(**params) within the weight budget. Rate limit answers pause every
+    request for Retry-After seconds (or an exponential backoff) and are retried; other
+    failures are retried with the same backoff. The last error is raised.
+    """
+    for attempt in range(max_retries):
+        await limiter.acquire(weight)
+        try:
+            result = await getattr(client, method)(**params)
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise
+            delay = backoff * 2 ** attempt
+            if _is_rate_limited(e):
+                delay = _retry_after(e) or delay
+                limiter.pause(delay)
+            logging.warning("%s %s failed (attempt %d), retrying in %.1fs: %s",
+                            method, params.get('symbol', ''), attempt + 1, delay, e)
+            await asyncio.sleep(delay)
+        else:
+            _observe_used_weight(client, limiter)
+            return result
+
+
+async def fetch_klines(client, limiter, symbol, interval, limit, klines_type=None, max_retries=5, backoff=1.0):
+    """
+    Last 'limit' klines of one symbol/interval as a structured array of KLINE_DTYPE. Requests
+    above the page size of the endpoint are paged backwards from the latest bar.
+    """
+    market = _market_name(klines_type)
+    method, page_size = _KLINE_METHODS[market]
+    pages = []
+    remaining = limit
+    end_time = None
+    while remaining > 0:
+        page_limit = min(remaining, page_size)
+        params = {'symbol': symbol, 'interval': interval, 'limit': page_limit}
+        if end_time is not None:
+            params['endTime'] = end_time
+        page = await _call(client, limiter, _klines_weight(market, page_limit), method,
+                           max_retries=max_retries, backoff=backoff, **params)
+        if not page:
+            break
+        pages.append(page)
+        remaining -= len(page)
+        if len(page) < page_limit:
+            break
+        end_time = page[0][0] - 1
+    klines = [k for page in reversed(pages) for k in page]
+    return klines_to_array(klines)
+
+
+async def _create_client(client_kwargs):
+    from binance import AsyncClient
+    return AsyncClient(**(client_kwargs or {}))
+
+
+async def get_historical_data_async(symbols, intervals, limit=180, klines_type=None, max_concurrency=8,
+                                    client=None, client_kwargs=None, limiter=None, max_retries=5, backoff=1.0):
+    """
+    Asyncio counterpart of get_historical_data: fetches every (symbol, interval) pair
+    concurrently, at most 'max_concurrency' requests in flight, within the weight budget of
+    'limiter' (a WeightLimiter with Binance's default 1200/min when not given).
+
+    Parameters:
+        symbols, intervals: lists of Binance symbols and kline intervals.
+        limit: number of bars per pair.
+        client: an AsyncClient (or anything with the same coroutine kline methods); when None one
+            is created from 'client_kwargs' and closed afterwards. Point its API_URL/FUTURES_URL at a
+            local server to replay or benchmark.
+
+    Returns:
+        dict mapping (symbol, interval) to the kline DataFrame built by kline_array_to_frame, in
+        request order. Pairs that still fail after max_retries attempts map to None.
+    """
+    own_client = client is None
+    if own_client:
+        client = await _create_client(client_kwargs)
+    if limiter is None:
+        limiter = WeightLimiter()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pairs = list(dict.fromkeys((symbol, inter) for symbol in symbols for inter in intervals))
+
+    async def fetch(symbol, inter):
+        async with semaphore:
+            try:
+                klines = await fetch_klines(client, limiter, symbol, inter, limit, klines_type,
+                                            max_retries=max_retries, backoff=backoff)
+            except Exception as e:
+                logging.warning("Skipping %s %s due to error: %s", symbol, inter, e)
+                return None
+        return kline_array_to_frame(klines)
+
+    try:
+        frames = await asyncio.gather(*(fetch(symbol, inter) for symbol, inter in pairs))
+    finally:
+        if own_client:
+            await client.close_connection()
+    return dict(zip(pairs, frames))
+
+
+def get_historical_data_concurrent(symbols, intervals, limit=180, **kwargs):
+    """
+    Synchronous wrapper around get_historical_data_async for scripts without an event loop.
+    """
+    return asyncio.run(get_historical_data_async(symbols, intervals, limit=limit, **kwargs))
+
+
+async def fetch_futures_brackets_async(client, max_concurrency=8, limiter=None):
+    """
+    Asyncio counterpart of update_bracket.fetch_futures_brackets: leverage brackets for all
+    futures symbols, requested concurrently. Symbols that fail are skipped.
+    """
+    if limiter is None:
+        limiter = WeightLimiter(limit=2400)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    exchange_info = await _call(client, limiter, 1, 'futures_exchange_info')
+    symbols = [s["symbol"] for s in exchange_info["symbols"]]
+
+    async def fetch(symbol):
+        async with semaphore:
+            try:
+                return await _call(client, limiter, 1, 'futures_leverage_bracket', symbol=symbol)
+            except Exception as e:
+                logging.warning("Skipping symbol %s due to error: %s", symbol, e)
+                return None
+
+    brackets = await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+    return {symbol: data for symbol, data in zip(symbols, brackets) if data is not None}
@@ -0,0 +1,183 @@
+"""
+Highcharts scripts for the embedded charts, from the CDN or from a local bundle.
+
+Set HIGHCHARTS_ASSETS=local to serve one deduplicated bundle (highstock plus
+highcharts-more; highstock already contains the Highcharts core, so highcharts.js is not
+loaded again) from this machine instead of code.highcharts.com. Build it once on a machine
+with network access and copy the static/ directory over:
+
+    python chartassets.py                      # download from code.highcharts.com
+    python chartassets.py --source ./vendor    # or bundle files copied by hand
+
+The bundle is named after its content hash and served by a small HTTP server with a one
+year immutable Cache-Control, so browsers fetch it once per version.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+HIGHCHARTS_CDN = 'https://code.highcharts.com/'
+HIGHCHARTS_MODULES = ('stock/highstock.js', 'highcharts-more.js')
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST = 'highcharts-bundle.json'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_SOURCE_MAP = re.compile(rb'^//# sourceMappingURL=.*$', re.MULTILINE)
+_server = None
+_server_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+def _read_module(source, module):
+    """
+    Minified module 'module' from a base URL or a local directory (either with the CDN layout
+    or with all files side by side, as in the highcharts npm package).
+    """
+    if re.match(r'https?://', source):
+        with urllib.request.urlopen(source.rstrip('/') + '/' + module, timeout=30) as response:
+            return response.read()
+    for path in (os.path.join(source, module), os.path.join(source, os.path.basename(module))):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+    raise FileNotFoundError(f"{module} not found in {source}")
+
+
+def build_bundle(source=HIGHCHARTS_CDN, modules=HIGHCHARTS_MODULES, dest=ASSET_DIR):
+    """
+    Concatenates the minified modules (duplicates dropped, source map references stripped)
+    into dest/highcharts-<hash>.min.js and records it in the manifest. Older bundles are
+    removed. Returns the path of the bundle.
+    """
+    modules = list(dict.fromkeys(modules))
+    parts = [_SOURCE_MAP.sub(b'', _read_module(source, module)).strip() for module in modules]
+    bundle = b'\n;\n'.join(parts) + b'\n'
+    digest = hashlib.sha256(bundle).hexdigest()
+    name = f'highcharts-{digest[:12]}.min.js'
+
+    os.makedirs(dest, exist_ok=True)
+    path = os.path.join(dest, name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(bundle)
+    os.replace(tmp_path, path)
+    manifest = {'file': name, 'sha256': digest, 'modules': modules, 'source': source}
+    with open(os.path.join(dest, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    for old in os.listdir(dest):
+        if old.startswith('highcharts-') and old.endswith('.min.js') and old != name:
+            os.remove(os.path.join(dest, old))
+    return path
+
+
+def load_manifest(dest=ASSET_DIR):
+    try:
+        with open(os.path.join(dest, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(os.path.join(dest, manifest.get('file', ''))):
+        return None
+    return manifest
+
+
+class _AssetHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the bundle directory read-only. Hashed bundles never change, so they are cached
+    for a year; anything else (the manifest) is revalidated.
+    """
+
+    def end_headers(self):
+        name = os.path.basename(self.path.split('?', 1)[0])
+        if name.startswith('highcharts-') and name.endswith('.min.js'):
+            self.send_header('Cache-Control', CACHE_CONTROL)
+        else:
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def list_directory(self, path):
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_asset_server(directory=ASSET_DIR, host='127.0.0.1', port=8765):
+    """
+    Starts (once per process) the HTTP server for the bundle in a daemon thread and returns it.
+    It listens on the loopback interface unless another host (e.g. '0.0.0.0') is given.
+    Raises OSError if the port cannot be bound (e.g. taken by another Streamlit instance).
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            handler = partial(_AssetHandler, directory=directory)
+            _server = ThreadingHTTPServer((host, port), handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='highcharts-assets', daemon=True).start()
+    return _server
+
+
+def highcharts_scripts(browser_host='localhost', mode=None, asset_dir=ASSET_DIR):
+    """
+    Script URLs the chart pages load, in order.
+
+    Parameters:
+        browser_host: host name the browser reaches this machine by (see browser_host()).
+        mode: 'cdn' or 'local'; defaults to the HIGHCHARTS_ASSETS environment variable
+            ('cdn' when unset). In local mode HIGHCHARTS_ASSET_PORT (8765) sets the port of
+            the asset server, HIGHCHARTS_ASSET_HOST the interface it listens on (127.0.0.1;
+            set 0.0.0.0 when the app is opened from other machines) and HIGHCHARTS_ASSET_URL
+            replaces its URL, e.g. when the bundle is served behind a reverse proxy. If the
+            asset server cannot be started, the CDN URLs are returned (with a warning).
+        asset_dir: directory holding the bundle and its manifest.
+    """
+    mode = mode or os.environ.get('HIGHCHARTS_ASSETS', 'cdn')
+    if mode == 'cdn':
+        return tuple(HIGHCHARTS_CDN + module for module in HIGHCHARTS_MODULES)
+    if mode != 'local':
+        raise ValueError(f"Unknown HIGHCHARTS_ASSETS mode: {mode!r}")
+    manifest = load_manifest(asset_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No Highcharts bundle in {asset_dir}; run 'python chartassets.py' first")
+    base_url = os.environ.get('HIGHCHARTS_ASSET_URL')
+    if base_url is None:
+        port = int(os.environ.get('HIGHCHARTS_ASSET_PORT', 8765))
+        try:
+            server = start_asset_server(asset_dir, host=os.environ.get('HIGHCHARTS_ASSET_HOST', '127.0.0.1'),
+                                        port=port)
+        except OSError as e:
+            log.warning('Highcharts asset server could not listen on port %s (%s); loading from the CDN', port, e)
+            return highcharts_scripts(mode='cdn')
+        base_url = f'http://{browser_host}:{server.server_address[1]}/'
+    return (base_url.rstrip('/') + '/' + manifest['file'],)
+
+
+def browser_host():
+    """
+    Host name of the Streamlit server as the browser addressed it (from the Host header).
+    """
+    import streamlit as st
+    try:
+        host = st.context.headers.get('Host') or 'localhost'
+    except Exception:
+        return 'localhost'
+    return host.rsplit(':', 1)[0] if not host.startswith('[') else host.split(']')[0] + ']'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the local Highcharts bundle.')
+    parser.add_argument('--source', default=HIGHCHARTS_CDN,
+                        help='base URL or directory holding the minified modules')
+    parser.add_argument('--dest', default=ASSET_DIR)
+    args = parser.parse_args()
+    print(build_bundle(args.source, dest=args.dest))
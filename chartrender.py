@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from chartassets import highcharts_scripts
+from ohlcv import candlestick_json, index_ms
+
+_CHART_JS_PLACEHOLDER = '/*__CHART_JS__*/'
+
+_HTML_SHELL = """<!DOCTYPE html>
+<html>
+    <head>
+        <meta charset="utf-8" />
+{scripts}
+    </head>
+    <body>
+        <div id="{container}" style="width: 100%; height: {height};"></div>
+        <script>
+{placeholder}
+        </script>
+    </body>
+</html>
+"""
+
+
+class RawJS:
+    """
+    JavaScript (or pre-serialized JSON) source that render_options emits verbatim instead of
+    as a string literal, e.g. a cached candle series or a formatter function.
+    """
+
+    __slots__ = ('js',)
+
+    def __init__(self, js):
+        self.js = js
+
+    def __repr__(self):
+        return f'RawJS({self.js[:40]!r})'
+
+
+def render_options(options):
+    """
+    Serializes a Highcharts options dict straight to a JS object literal (JSON plus the
+    RawJS fragments) without going through highcharts-stock's object model. Floats are
+    written as JSON numbers and NaN as JS NaN, which Highcharts treats like null.
+    """
+    raw = []
+
+    def placeholder(obj):
+        if isinstance(obj, RawJS):
+            raw.append(obj.js)
+            return f'@@rawjs:{len(raw) - 1}@@'
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    js = json.dumps(options, default=placeholder, separators=(',', ':'))
+    for i, fragment in enumerate(raw):
+        js = js.replace(f'"@@rawjs:{i}@@"', fragment, 1)
+    return js
+
+
+@lru_cache(maxsize=16)
+def html_shell(scripts, container='container', height='600px'):
+    """
+    The static page around a chart, split at the spot where the chart script goes.
+    Returns (head, tail); it is built once per (scripts, container, height).
+    """
+    tags = '\n'.join(f'        <script src="{src}"></script>' for src in scripts)
+    page = _HTML_SHELL.format(scripts=tags, container=container, height=height,
+                              placeholder=_CHART_JS_PLACEHOLDER)
+    head, tail = page.split(_CHART_JS_PLACEHOLDER)
+    return head, tail
+
+
+def render_stock_chart(options, container='container', scripts=None, height='600px'):
+    """
+    Complete HTML page drawing 'options' with Highcharts.stockChart into the 'container' div
+    once the page is loaded (the same page the apps built around Chart.to_js_literal()).
+    'scripts' defaults to highcharts_scripts() (CDN or local bundle, see chartassets).
+    """
+    if scripts is None:
+        scripts = highcharts_scripts()
+    head, tail = html_shell(tuple(scripts), container, height)
+    return ''.join([
+        head,
+        "document.addEventListener('DOMContentLoaded', function() {\n",
+        f"Highcharts.stockChart('{container}', ",
+        render_options(options),
+        ");\n});\n",
+        tail,
+    ])
+
+
+class SeriesCache:
+    """
+    Serialized candle series keyed by a content hash of the frame's index and columns, so a
+    rerun with unchanged data reuses the JSON text instead of serializing it again.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, df, columns):
+        key = _content_hash(df, columns)
+        with self._lock:
+            js = self._entries.get(key)
+            if js is not None:
+                self._entries.move_to_end(key)
+                return RawJS(js)
+        js = candlestick_json(df, columns)
+        with self._lock:
+            self._entries[key] = js
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return RawJS(js)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_series_cache = SeriesCache()
+
+
+def candlestick_data(df, columns=('open', 'high', 'low', 'close')):
+    """
+    Candle series data for render_options: the [ts_ms, *columns] rows of 'df' as RawJS JSON,
+    served from the content-hash cache when the data is unchanged. The default columns are
+    the OHLC values a candlestick series reads (highcharts-stock dropped volume as well).
+    """
+    return _series_cache.get(df, tuple(columns))
+
+
+def _content_hash(df, columns):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(columns).encode())
+    h.update(index_ms(df.index).tobytes())
+    for name in columns:
+        h.update(np.ascontiguousarray(df[name].to_numpy(dtype=np.float64)).tobytes())
+    return h.digest()
@@ -0,0 +1,244 @@
+import heapq
+from bisect import bisect_right
+
+import numpy as np
+
+from orderblockdetector import ACTIVE_UNTIL, order_blocks_to_array
+
+
+class _PersistentCounts:
+    """
+    Persistent segment trees over 'm' elementary price bands sharing one node pool.
+
+    Every update adds a value to a range of bands and returns a new root; the old roots stay
+    valid (only the O(log m) nodes on the update path are copied). Nodes keep their pending
+    add plus the max of their subtree. Node 0 is the empty tree (all zeros) and serves as the
+    child of every untouched subtree.
+    """
+
+    def __init__(self, m):
+        self.m = m
+        self.add = [0]
+        self.mx = [0]
+        self.left = [0]
+        self.right = [0]
+
+    def _node(self, add, mx, left, right):
+        self.add.append(add)
+        self.mx.append(mx)
+        self.left.append(left)
+        self.right.append(right)
+        return len(self.add) - 1
+
+    def update(self, node, l, r, value, lo=0, hi=None):
+        """
+        New root with 'value' added to bands [l, r) of the tree rooted at 'node'.
+        """
+        if hi is None:
+            hi = self.m
+        if l <= lo and hi <= r:
+            return self._node(self.add[node] + value, self.mx[node] + value, self.left[node], self.right[node])
+        mid = (lo + hi) // 2
+        left, right = self.left[node], self.right[node]
+        if l < mid:
+            left = self.update(left, l, r, value, lo, mid)
+        if r > mid:
+            right = self.update(right, l, r, value, mid, hi)
+        add = self.add[node]
+        return self._node(add, add + max(self.mx[left], self.mx[right]), left, right)
+
+    def point(self, node, band):
+        """
+        Value of one band in the tree rooted at 'node'.
+        """
+        lo, hi = 0, self.m
+        total = 0
+        while True:
+            total += self.add[node]
+            if hi - lo == 1:
+                return total
+            mid = (lo + hi) // 2
+            if band < mid:
+                node, hi = self.left[node], mid
+            else:
+                node, lo = self.right[node], mid
+
+    def top(self, node, k, min_count):
+        """
+        Up to k (value, band) pairs with the largest values >= min_count in the tree rooted at
+        'node', highest band first among equal values: a best-first walk on the subtree maxima,
+        O(k log m).
+        """
+        add, mx, left, right = self.add, self.mx, self.left, self.right
+        found = []
+        # Entries: (-subtree max, -end of the band range, node, lo, hi, adds of the ancestors).
+        heap = [(-mx[node], -self.m, node, 0, self.m, 0)]
+        while heap and len(found) < k:
+            neg_max, _, node, lo, hi, acc = heapq.heappop(heap)
+            if -neg_max < min_count:
+                break
+            if hi - lo == 1:
+                found.append((-neg_max, lo))
+                continue
+            acc += add[node]
+            mid = (lo + hi) // 2
+            heapq.heappush(heap, (-(acc + mx[left[node]]), -mid, left[node], lo, mid, acc))
+            heapq.heappush(heap, (-(acc + mx[right[node]]), -hi, right[node], mid, hi, acc))
+        return found
+
+
+class _Versions:
+    """
+    Roots of a persistent tree after each event time: version(t) sees every event with a
+    time <= t. Events must be pushed in time order.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.times = []
+        self.roots = [0]
+
+    def push(self, t, l, r, value=1):
+        root = self.tree.update(self.roots[-1], l, r, value)
+        if self.times and self.times[-1] == t:
+            self.roots[-1] = root
+        else:
+            self.times.append(t)
+            self.roots.append(root)
+
+    def version(self, t):
+        return self.roots[bisect_right(self.times, t)]
+
+
+class ConfluenceIndex:
+    """
+    Index over order blocks as (time, price) rectangles: an OB covers prices
+    [bottom, top) from its start time until (excluding) its end time.
+
+    Persistent segment trees over the elementary price bands (the gaps between the distinct
+    OB edges of the whole index) are versioned by time, so any point in a long history is
+    queried without rescanning it:
+      - count_window: one tree counts the OBs started by t, another the OBs ended by t; the
+        OBs covering a price during [t0, t1] are started(t1) - ended(t0), two O(log n) walks.
+      - top_bands: a tree of the OBs alive at t, whose subtree maxima lead a best-first walk
+        to the k most stacked bands in O(k log n). An OB overlaps the window [t1 - w, t1]
+        exactly when it is alive at t1 with its end pushed back by w, so one such tree is
+        built (once, on first use) per window width w.
+    Building a tree takes O(n log n).
+    """
+
+    def __init__(self, tops, bottoms, starts, ends=None):
+        """
+        Parameters:
+            tops, bottoms: price edges of the OBs (either order; NaN rows are ignored).
+            starts: time each OB becomes active, e.g. its left edge or formation time in ms.
+            ends: time each OB stops counting (mitigation time); ACTIVE_UNTIL / None = active.
+        """
+        tops = np.asarray(tops, dtype=np.float64)
+        bottoms = np.asarray(bottoms, dtype=np.float64)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.full(len(starts), ACTIVE_UNTIL, dtype=np.int64) if ends is None else np.asarray(ends, dtype=np.int64)
+        valid = ~(np.isnan(tops) | np.isnan(bottoms))
+        lower = np.minimum(tops, bottoms)[valid]
+        upper = np.maximum(tops, bottoms)[valid]
+
+        self.edges = np.unique(np.concatenate([lower, upper]))
+        self.size = len(lower)
+        self._tree = _PersistentCounts(max(len(self.edges) - 1, 1))
+        band_lo = np.searchsorted(self.edges, lower)
+        band_hi = np.searchsorted(self.edges, upper)
+        # Zero-height OBs cover no band.
+        keep = band_lo < band_hi
+        self._bands = (band_lo[keep].tolist(), band_hi[keep].tolist())
+        self._starts = starts[valid][keep]
+        self._ends = ends[valid][keep]
+        n = len(self._starts)
+        ended = np.flatnonzero(self._ends != ACTIVE_UNTIL)
+        self._started = self._build(np.arange(n), self._starts, np.ones(n, dtype=np.int64))
+        self._ended = self._build(ended, self._ends[ended], np.ones(len(ended), dtype=np.int64))
+        self._alive = {}
+
+    def _build(self, rows, times, values):
+        """
+        Versions of the tree after adding values[j] to the bands of OB rows[j] at times[j].
+        """
+        band_lo, band_hi = self._bands
+        order = np.argsort(times, kind='stable')
+        versions = _Versions(self._tree)
+        for t, i, value in zip(times[order].tolist(), rows[order].tolist(), values[order].tolist()):
+            versions.push(t, band_lo[i], band_hi[i], value)
+        return versions
+
+    def _alive_versions(self, width):
+        """
+        Versions counting the OBs alive at t with their end pushed back by 'width'.
+        """
+        versions = self._alive.get(width)
+        if versions is None:
+            n = len(self._starts)
+            ended = np.flatnonzero(self._ends != ACTIVE_UNTIL)
+            versions = self._alive[width] = self._build(
+                np.concatenate([np.arange(n), ended]),
+                np.concatenate([self._starts, self._ends[ended] + width]),
+                np.concatenate([np.ones(n, dtype=np.int64), np.full(len(ended), -1, dtype=np.int64)]),
+            )
+        return versions
+
+    @classmethod
+    def from_order_blocks(cls, obs, ends=None):
+        """
+        Index over OrderBlock records (or OB dicts, or an ORDER_BLOCK_DTYPE array) starting at
+        their left edge, active unless 'ends' says otherwise.
+        """
+        arr = obs if isinstance(obs, np.ndarray) else order_blocks_to_array(obs)
+        return cls(arr['top'], arr['bottom'], arr['left'], ends)
+
+    @classmethod
+    def from_history(cls, history, start='formed'):
+        """
+        Index over the output of order_block_history. 'start' picks the start time: 'formed'
+        (when the OB is known, for backtests without look-ahead) or 'left' (the pivot bar, as
+        the boxes are drawn).
+        """
+        return cls(history['top'], history['bottom'], history[start], history['mitigated'])
+
+    def __len__(self):
+        return self.size
+
+    def _band(self, price):
+        band = int(np.searchsorted(self.edges, price, side='right')) - 1
+        return band if 0 <= band < len(self.edges) - 1 else None
+
+    def count(self, price, t):
+        """
+        Number of OBs covering 'price' at time 't'.
+        """
+        return self.count_window(price, t, t)
+
+    def count_window(self, price, t0, t1):
+        """
+        Number of OBs covering 'price' at any time in [t0, t1].
+        """
+        band = self._band(price)
+        if band is None:
+            return 0
+        return self._tree.point(self._started.version(t1), band) - self._tree.point(self._ended.version(t0), band)
+
+    def top_bands(self, t0, t1=None, k=2, min_count=2):
+        """
+        The k most stacked price bands at time t0 (or over the window [t0, t1]) with at least
+        'min_count' OBs, sorted like find_stacked_levels: count descending, then price
+        descending. Bands are the gaps between the edges of all indexed OBs, so over a long
+        history a stacked zone may be split at the edge of an OB that is not alive in the window.
+
+        Returns:
+            (counts, lower, upper) arrays.
+        """
+        if t1 is None:
+            t1 = t0
+        found = []
+        if len(self.edges) > 1:
+            found = self._tree.top(self._alive_versions(t1 - t0).version(t1), k, min_count)
+        counts = np.array([count for count, _ in found], dtype=np.int64)
+        bands = np.array([band for _, band in found], dtype=np.int64)
+        return counts, self.edges[bands], self.edges[bands + 1]
@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def next_bar_close(interval_ms, now_ms):
+    """
+    Time (ms since the epoch) at which the bar of 'interval_ms' containing 'now_ms' closes.
+    """
+    return (int(now_ms) // interval_ms + 1) * interval_ms
+
+
+class FetchCache:
+    """
+    Memoizes data fetches keyed by (source, symbol, exchange, interval, n_bars).
+
+    An entry stays valid until the current bar of its interval closes (a new bar changes the
+    data) but at most 'max_age' seconds, so the still-forming candle keeps refreshing. Identical
+    requests made while a fetch is in flight wait for it instead of fetching again. Failed
+    fetches (None) are not cached.
+
+    Keep one instance per process (e.g. with st.cache_resource) to share it across reruns.
+    """
+
+    def __init__(self, max_age=60, clock=time.time):
+        self.max_age = max_age
+        self._clock = clock
+        self._entries = {}  # key -> (expires_at_ms, value)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, interval_ms, fetch):
+        """
+        Returns the cached value for 'key', calling fetch() when it is missing or expired.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+        with self._key_lock(key):
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            value = fetch()
+            if value is not None:
+                now_ms = self._clock() * 1000
+                expires_at = min(next_bar_close(interval_ms, now_ms), now_ms + self.max_age * 1000)
+                with self._lock:
+                    self._purge(now_ms)
+                    self._entries[key] = (expires_at, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > self._clock() * 1000:
+            return entry[1]
+        return None
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _purge(self, now_ms):
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now_ms]
+        for key in expired:
+            del self._entries[key]
+            self._key_locks.pop(key, None)
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls to one data source at most 'rate' per second.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+def fetch_with_retry(fetch, label='', max_retries=3, retry_delay=1, rate_limiter=None, sleep=time.sleep):
+    """
+    Calls fetch() up to max_retries times, sleeping retry_delay seconds after each failure
+    (the retry loop the apps used inline). Every attempt first waits for the rate limiter.
+    Returns None if every attempt failed.
+    """
+    attempt = 0
+    while attempt < max_retries:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fetch()
+        except Exception as e:
+            attempt += 1
+            print(f"Attempt {attempt} for {label} failed: {e}")
+            sleep(retry_delay)
+    return None
+
+
+def fetch_concurrent(requests, fetch, max_workers=4):
+    """
+    Calls fetch(*request) for every request through a bounded thread pool and returns the
+    results in the order of 'requests', so the output is deterministic whatever the completion
+    order. Duplicate requests are fetched once. A request whose fetch raises gets None, like
+    an exhausted fetch_with_retry, without affecting the others. Rate limiting and retries
+    belong to 'fetch' (see RateLimiter and fetch_with_retry), which should reuse one client
+    per source.
+    """
+    def isolated(*request):
+        try:
+            return fetch(*request)
+        except Exception as e:
+            print(f"Fetch {request} failed: {e}")
+            return None
+
+    requests = [tuple(request) for request in requests]
+    unique = list(dict.fromkeys(requests))
+    if not unique:
+        return []
+    if len(unique) == 1 or max_workers <= 1:
+        results = {request: isolated(*request) for request in unique}
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as executor:
+            futures = {request: executor.submit(isolated, *request) for request in unique}
+            results = {request: future.result() for request, future in futures.items()}
+    return [results[request] for request in requests]
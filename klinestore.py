@@ -0,0 +1,242 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+# Numeric kline fields as returned by the Binance API (the trailing 'ignore' field is dropped).
+KLINE_DTYPE = np.dtype([
+    ('open_time', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+    ('close_time', 'i8'),
+    ('qav', 'f8'),
+    ('num_trades', 'i8'),
+    ('taker_base_vol', 'f8'),
+    ('taker_quote_vol', 'f8'),
+])
+
+
+def klines_to_array(klines):
+    """
+    Converts raw Binance klines (lists of 12 values, prices as strings) into a
+    structured array of KLINE_DTYPE, one np.fromiter per field (no tuple per kline).
+    """
+    n = len(klines)
+    arr = np.empty(n, dtype=KLINE_DTYPE)
+    for i, name in enumerate(KLINE_DTYPE.names):
+        arr[name] = np.fromiter(map(itemgetter(i), klines), dtype=KLINE_DTYPE[name], count=n)
+    return arr
+
+
+def kline_array_to_frame(arr):
+    """
+    Builds the DataFrame shape used by get_historical_data: one column per kline field,
+    indexed by the open time ('datetime').
+    """
+    df = pd.DataFrame({name: arr[name] for name in KLINE_DTYPE.names[1:]})
+    df.index = pd.DatetimeIndex(pd.to_datetime(arr['open_time'], unit='ms'), name='datetime')
+    return df
+
+
+def _merge(cached, fresh):
+    """
+    Appends freshly fetched klines to the cached ones. Cached bars at or after the first fresh
+    open time are replaced (the last cached bar may have been still forming). If the fresh bars
+    do not connect to the cached ones, the cache is discarded to avoid a gap in the history.
+    """
+    if cached is None or len(cached) == 0:
+        return fresh
+    if len(fresh) == 0:
+        return cached
+    first_new = fresh['open_time'][0]
+    if first_new > cached['close_time'][-1] + 1:
+        return fresh
+    keep = cached[cached['open_time'] < first_new]
+    return np.concatenate([keep, fresh])
+
+
+def _adds_nothing(cached, fresh):
+    """
+    True if merging 'fresh' into 'cached' would change no bar (nothing new, and the refetched
+    tail, e.g. a still-forming candle, is as cached).
+    """
+    if len(fresh) == 0:
+        return True
+    start = np.searchsorted(cached['open_time'], fresh['open_time'][0])
+    tail = cached[start:]
+    return len(tail) == len(fresh) and bool(np.all(tail == fresh))
+
+
+class KlineStore:
+    """
+    Persistent local kline cache keyed by (symbol, interval, market type).
+
+    Each key is stored as a .npy file of KLINE_DTYPE under 'root' and read back through a
+    memory map. On every request only the bars newer than the last cached one are downloaded
+    (starting at the last cached open time, so a still-forming candle is refreshed) and merged
+    in. Recently used keys are also kept in an in-process LRU so repeated reads skip the disk.
+    Each key keeps at most 'keep_factor' times the largest 'limit' requested for it in this
+    process, so the files do not grow with every appended bar.
+
+    'client' is anything with a python-binance compatible get_historical_klines(), which makes
+    it possible to replay recorded klines through a fake client. By default a
+    binance.client.Client is created on first use.
+    """
+
+    def __init__(self, root='.kline_cache', client=None, lru_size=32, keep_factor=4):
+        self.root = root
+        self.lru_size = lru_size
+        self.keep_factor = keep_factor
+        self._client = client
+        self._lru = OrderedDict()
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from binance.client import Client
+            self._client = Client()
+        return self._client
+
+    def get(self, symbol, interval, limit, klines_type=None):
+        """
+        Returns the last 'limit' klines for (symbol, interval, klines_type) as a structured
+        array of KLINE_DTYPE, fetching only what is missing from the local store. The file is
+        only rewritten when the fetched bars change it.
+        """
+        key = (symbol, interval, _market_name(klines_type))
+        with self._lock:
+            cached = self._read(key)
+            self._limits[key] = max(limit, self._limits.get(key, 0))
+        if cached is None or len(cached) < limit:
+            fresh = self._fetch(symbol, interval, klines_type, limit=limit)
+        else:
+            fresh = self._fetch(symbol, interval, klines_type, start_str=int(cached['open_time'][-1]))
+            if _adds_nothing(cached, fresh):
+                return cached[-limit:]
+        merged = _merge(cached, fresh)
+        with self._lock:
+            keep = self.keep_factor * self._limits[key]
+            if len(merged) > keep:
+                merged = merged[-keep:]
+            self._write(key, merged)
+        return merged[-limit:]
+
+    def _fetch(self, symbol, interval, klines_type, **kwargs):
+        if klines_type is not None:
+            kwargs['klines_type'] = klines_type
+        return klines_to_array(self.client.get_historical_klines(symbol, interval, **kwargs))
+
+    def _path(self, key):
+        return os.path.join(self.root, '_'.join(key) + '.npy')
+
+    def _read(self, key):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            mapped = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            # Corrupted or partially written file: fetch from scratch
+            return None
+        if mapped.dtype != KLINE_DTYPE:
+            return None
+        # Copy out of the map so the file can be replaced on the next write (Windows keeps
+        # mapped files locked).
+        arr = np.array(mapped)
+        del mapped
+        self._remember(key, arr)
+        return arr
+
+    def _write(self, key, arr):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+        self._remember(key, arr)
+
+    def _remember(self, key, arr):
+        self._lru[key] = arr
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+
+def _market_name(klines_type):
+    """
+    Name of the market type used in the cache key (HistoricalKlinesType.SPOT -> 'SPOT').
+    """
+    if klines_type is None:
+        return 'SPOT'
+    return getattr(klines_type, 'name', str(klines_type))
+
+
+def _synthetic_klines(n, start=1_700_000_000_000, step=60_000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    return [[start + i * step, f'{c:.2f}', f'{c + 1:.2f}', f'{c - 1:.2f}', f'{c + 0.5:.2f}', f'{v:.3f}',
+             start + (i + 1) * step - 1, f'{v * c:.4f}', int(v), f'{v / 2:.3f}', f'{v * c / 2:.4f}', '0']
+            for i, (c, v) in enumerate(zip(close, rng.uniform(1, 1000, n)))]
+
+
+def benchmark(symbols=100, n=1000, repeat=3):
+    """
+    Seconds to turn 'symbols' x 'n' raw klines into detector input: the old object DataFrame
+    plus astype(float), the old per-kline tuple conversion, and klines_to_array followed by
+    ohlcv.kline_array_to_ohlcv. Returns [(label, best of 'repeat' seconds)].
+    """
+    from ohlcv import kline_array_to_ohlcv
+
+    batches = [_synthetic_klines(n, seed=i) for i in range(symbols)]
+    columns = ['datetime', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'qav', 'num_trades',
+               'taker_base_vol', 'taker_quote_vol', 'ignore']
+
+    def dataframe(klines):
+        df = pd.DataFrame(klines, columns=columns)
+        df['datetime'] = pd.to_datetime(df['datetime'], unit='ms')
+        df = df.set_index('datetime').astype(float)
+        df['time'] = df.index
+        return df
+
+    def tuples(klines):
+        return kline_array_to_ohlcv(np.array([tuple(k[:11]) for k in klines], dtype=KLINE_DTYPE))
+
+    def columnar(klines):
+        return kline_array_to_ohlcv(klines_to_array(klines))
+
+    results = []
+    for label, convert in (('DataFrame + astype', dataframe), ('tuple per kline', tuples),
+                           ('klines_to_array', columnar)):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for klines in batches:
+                convert(klines)
+            best = min(best, time.perf_counter() - started)
+        results.append((label, best))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the kline parsing paths.')
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('-n', type=int, default=1000, help='klines per symbol')
+    args = parser.parse_args()
+    if args.bench:
+        for label, seconds in benchmark(args.symbols, args.n):
+            print(f'{label:>20}: {seconds * 1000:8.1f} ms')
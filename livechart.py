@@ -0,0 +1,233 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from chartassets import highcharts_scripts
+from ohlcv import index_ms, point_rows
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'livechart_frontend')
+_CANDLE_COLUMNS = ('open', 'high', 'low', 'close')
+_component = None
+
+
+def _clean(obj):
+    """
+    Copy of a (small) options structure that JSON accepts: numpy scalars become Python
+    numbers and NaN becomes None.
+    """
+    if isinstance(obj, dict):
+        return {k: _clean(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_clean(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and math.isnan(obj):
+        return None
+    return obj
+
+
+def _parse_boxes(data):
+    """
+    Splits the data of an OB polygon series (create_bull_series/create_bear_series: 5 points
+    per box, [left, bottom], [right, bottom], [right, top], [left, top], [right, None]) into
+    the shared right edge and a {box_id: [left, bottom, top]} mapping.
+    Returns None when the data does not have that shape.
+    """
+    if len(data) % 5:
+        return None
+    right = None
+    boxes = {}
+    for i in range(0, len(data), 5):
+        (l0, b0), (r0, b1), (r1, t0), (l1, t1), (r2, brk) = data[i:i + 5]
+        if not (l0 == l1 and r0 == r1 == r2 and b0 == b1 and t0 == t1 and brk is None):
+            return None
+        if right is not None and r0 != right:
+            return None
+        right = r0
+        box = _clean([l0, b0, t0])
+        boxes[f'{box[0]}:{box[1]}:{box[2]}'] = box
+    return right, boxes
+
+
+class LiveChartState:
+    """
+    What the browser-side chart of one live_chart key currently shows, and the delta that
+    brings it to a new set of options.
+
+    The options are split into:
+      - the frame: everything but the series data and the yAxis plotLines; any change here
+        (or in the set of series) redraws the chart from scratch,
+      - the candles of the candlestick series, diffed by timestamp (upserted rows, removed
+        timestamps),
+      - the other series: OB polygon series as boxes with a shared right edge (added and
+        removed boxes, moved edge), any other series as a whole data array,
+      - the plotLines of the first yAxis, sent again when they change.
+
+    Every message carries 'rev' and the 'base_rev' it applies to. The browser asks for a full
+    redraw (see live_chart) when the base does not match what it shows, e.g. after the
+    component was remounted or a rerun was interrupted before its delta reached it.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rev = 0
+        self.frame = None
+        self.times = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(_CANDLE_COLUMNS)))
+        self.series = []
+        self.plot_lines = None
+        self.message = None
+        self.resync_token = getattr(self, 'resync_token', None)
+
+    def update(self, options, candles, scripts=()):
+        """
+        Returns the message for 'options' (whose candlestick series takes its data from the
+        OHLC frame 'candles'). The message is unchanged, rev included, when nothing changed.
+        Full redraws also carry the Highcharts 'scripts', which the browser loads once.
+        """
+        frame, series, plot_lines = _split_options(options)
+        full = frame != self.frame or [s['opts'] for s in series] != [s['opts'] for s in self.series]
+        if full:
+            base = self.rev
+            self.reset()
+            self.rev = base
+        delta = {}
+
+        candle_delta = self._candle_delta(candles)
+        if candle_delta:
+            delta['candles'] = candle_delta
+
+        series_deltas = []
+        for i, new in enumerate(series):
+            old = self.series[i] if i < len(self.series) else {'opts': new['opts'], 'right': None, 'boxes': {}, 'data': None}
+            change = _series_delta(old, new)
+            if change:
+                change['id'] = i
+                series_deltas.append(change)
+        if series_deltas:
+            delta['series'] = series_deltas
+        self.series = series
+
+        if plot_lines != self.plot_lines:
+            delta['plotLines'] = plot_lines
+            self.plot_lines = plot_lines
+
+        if full:
+            self.frame = frame
+            delta['frame'] = frame
+            delta['series_opts'] = [s['opts'] for s in series]
+            delta['scripts'] = list(scripts)
+        if delta or self.message is None:
+            delta['base_rev'] = None if full else self.rev
+            self.rev += 1
+            delta['rev'] = self.rev
+            self.message = json.dumps(delta, separators=(',', ':'), allow_nan=False)
+        return self.message
+
+    def _candle_delta(self, candles):
+        times = index_ms(candles.index)
+        values = np.column_stack([candles[name].to_numpy(dtype=np.float64) for name in _CANDLE_COLUMNS])
+        removed = self.times[~np.isin(self.times, times)]
+        pos = np.searchsorted(self.times, times)
+        pos_clipped = np.minimum(pos, max(len(self.times) - 1, 0))
+        if len(self.times):
+            known = self.times[pos_clipped] == times
+            old = self.values[pos_clipped]
+            same = (old == values) | (np.isnan(old) & np.isnan(values))
+            changed = ~known | ~same.all(axis=1)
+        else:
+            changed = np.ones(len(times), dtype=bool)
+        self.times, self.values = times, values
+        delta = {}
+        if changed.any():
+            delta['upsert'] = point_rows(times[changed], values[changed].T)
+        if len(removed):
+            delta['remove'] = removed.tolist()
+        return delta
+
+
+def _split_options(options):
+    options = dict(options)
+    series = []
+    for s in options.pop('series', []):
+        opts = {k: v for k, v in s.items() if k != 'data'}
+        if s.get('type') == 'candlestick':
+            opts['candles'] = True
+            series.append({'opts': _clean(opts), 'right': None, 'boxes': {}, 'data': None})
+            continue
+        data = s.get('data', [])
+        parsed = _parse_boxes(data) if s.get('type') == 'polygon' else None
+        if parsed is None:
+            series.append({'opts': _clean(opts), 'right': None, 'boxes': {}, 'data': _clean(data)})
+        else:
+            opts['boxes'] = True
+            right, boxes = parsed
+            series.append({'opts': _clean(opts), 'right': _clean(right), 'boxes': boxes, 'data': None})
+    y_axis = options.get('yAxis')
+    plot_lines = []
+    if isinstance(y_axis, dict) and 'plotLines' in y_axis:
+        plot_lines = _clean(y_axis['plotLines'])
+        options['yAxis'] = {k: v for k, v in y_axis.items() if k != 'plotLines'}
+    return _clean(options), series, plot_lines
+
+
+def _series_delta(old, new):
+    if new['opts'].get('candles'):
+        return {}
+    delta = {}
+    if new['opts'].get('boxes'):
+        if new['right'] != old['right']:
+            delta['right'] = new['right']
+        added = {key: box for key, box in new['boxes'].items() if key not in old['boxes']}
+        removed = [key for key in old['boxes'] if key not in new['boxes']]
+        if added:
+            delta['add'] = added
+        if removed:
+            delta['remove'] = removed
+    elif new['data'] != old['data']:
+        delta['data'] = new['data']
+    return delta
+
+
+def _declare_component():
+    global _component
+    if _component is None:
+        import streamlit.components.v1 as components
+        _component = components.declare_component('livechart', path=_FRONTEND_DIR)
+    return _component
+
+
+def live_chart(options, candles, key='live_chart', height=700, scripts=None):
+    """
+    Draws a Highcharts stock chart in a component that stays mounted across reruns and is
+    updated in place: only new or changed candles, added or removed OB boxes and changed
+    plotLines are sent to the browser (see LiveChartState).
+
+    Parameters:
+        options: Highcharts options as for render_stock_chart. The data of the candlestick
+            series is taken from 'candles' instead of the options.
+        candles: frame with a DatetimeIndex and open/high/low/close columns.
+        key: Streamlit key; one chart (and one diff state) per key and session.
+        height: component height in pixels.
+        scripts: Highcharts script URLs, highcharts_scripts() by default.
+    """
+    import streamlit as st
+
+    state_key = f'{key}__livechart'
+    state = st.session_state.get(state_key)
+    if state is None:
+        state = st.session_state[state_key] = LiveChartState()
+    # The browser answers a delta it cannot apply with a resync request (the component value).
+    request = st.session_state.get(key)
+    if isinstance(request, dict) and request.get('resync') != state.resync_token:
+        state.resync_token = request.get('resync')
+        state.reset()
+    if scripts is None:
+        from chartassets import browser_host
+        scripts = highcharts_scripts(browser_host())
+    message = state.update(options, candles, scripts)
+    return _declare_component()(message=message, height=height, key=key, default=None)
@@ -0,0 +1,213 @@
+// Browser side of livechart.live_chart: keeps one Highcharts stock chart alive across
+// Streamlit reruns and applies the deltas built by livechart.LiveChartState.
+(function () {
+    'use strict';
+
+    var chart = null;
+    var model = null;      // what the chart shows: candles, per-series boxes/data, plotLines
+    var rev = 0;           // revision of the last applied message
+    var resyncFor = null;  // message revision a resync was already requested for
+    var frameHeight = null;
+    var scriptsLoaded = null;       // Promise of the Highcharts scripts
+    var queue = Promise.resolve();  // render messages are handled one after the other
+
+    function send(type, data) {
+        var message = {isStreamlitMessage: true, type: type};
+        for (var k in data) {
+            message[k] = data[k];
+        }
+        window.parent.postMessage(message, '*');
+    }
+
+    function setFrameHeight(height) {
+        if (height !== frameHeight) {
+            frameHeight = height;
+            send('streamlit:setFrameHeight', {height: height});
+        }
+    }
+
+    function requestResync(msg) {
+        if (resyncFor === msg.rev) {
+            return;
+        }
+        resyncFor = msg.rev;
+        send('streamlit:setComponentValue', {
+            value: {resync: Date.now() + ':' + Math.random(), rev: rev},
+            dataType: 'json'
+        });
+    }
+
+    function loadScripts(urls) {
+        if (!scriptsLoaded) {
+            scriptsLoaded = urls.reduce(function (chain, url) {
+                return chain.then(function () {
+                    return new Promise(function (resolve, reject) {
+                        var script = document.createElement('script');
+                        script.src = url;
+                        script.onload = resolve;
+                        script.onerror = function () { reject(new Error('Failed to load ' + url)); };
+                        document.head.appendChild(script);
+                    });
+                });
+            }, Promise.resolve()).catch(function (err) {
+                scriptsLoaded = null;  // retry with the next full message
+                throw err;
+            });
+        }
+        return scriptsLoaded;
+    }
+
+    // Index of the first candle row with a timestamp >= x.
+    function bisect(rows, x) {
+        var lo = 0, hi = rows.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            if (rows[mid][0] < x) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return lo;
+    }
+
+    function applyCandles(delta) {
+        var rows = model.candles;
+        if (delta.remove) {
+            var gone = new Set(delta.remove);
+            rows = rows.filter(function (row) { return !gone.has(row[0]); });
+        }
+        (delta.upsert || []).forEach(function (row) {
+            var i = bisect(rows, row[0]);
+            if (i < rows.length && rows[i][0] === row[0]) {
+                rows[i] = row;
+            } else {
+                rows.splice(i, 0, row);
+            }
+        });
+        model.candles = rows;
+    }
+
+    function applySeries(delta) {
+        var s = model.series[delta.id];
+        if ('right' in delta) {
+            s.right = delta.right;
+        }
+        (delta.remove || []).forEach(function (key) { s.boxes.delete(key); });
+        var added = delta.add || {};
+        for (var key in added) {
+            s.boxes.set(key, added[key]);
+        }
+        if ('data' in delta) {
+            s.data = delta.data;
+        }
+    }
+
+    // Same 5-point polygons as create_bull_series/create_bear_series.
+    function boxPoints(s) {
+        var points = [];
+        s.boxes.forEach(function (box) {
+            points.push([box[0], box[1]], [s.right, box[1]], [s.right, box[2]], [box[0], box[2]], [s.right, null]);
+        });
+        return points;
+    }
+
+    function seriesData(i) {
+        var opts = model.opts[i];
+        if (opts.candles) {
+            return model.candles.slice();
+        }
+        if (opts.boxes) {
+            return boxPoints(model.series[i]);
+        }
+        return model.series[i].data;
+    }
+
+    function seriesOptions(i) {
+        var opts = {};
+        for (var k in model.opts[i]) {
+            if (k !== 'candles' && k !== 'boxes') {
+                opts[k] = model.opts[i][k];
+            }
+        }
+        opts.id = 'livechart-' + i;
+        opts.data = seriesData(i);
+        return opts;
+    }
+
+    function drawFull(msg) {
+        model = {
+            candles: [],
+            opts: msg.series_opts,
+            series: msg.series_opts.map(function () {
+                return {right: null, boxes: new Map(), data: []};
+            }),
+            plotLines: msg.plotLines || []
+        };
+        if (msg.candles) {
+            applyCandles(msg.candles);
+        }
+        (msg.series || []).forEach(applySeries);
+
+        var options = JSON.parse(JSON.stringify(msg.frame));
+        options.series = model.opts.map(function (_, i) { return seriesOptions(i); });
+        if (model.plotLines.length) {
+            options.yAxis = Object.assign({}, options.yAxis || {}, {plotLines: model.plotLines});
+        }
+        if (chart) {
+            chart.destroy();
+        }
+        chart = Highcharts.stockChart('container', options);
+    }
+
+    function drawDelta(msg) {
+        if (msg.candles) {
+            applyCandles(msg.candles);
+            model.opts.forEach(function (opts, i) {
+                if (opts.candles) {
+                    // updatePoints: points are matched by x and updated in place
+                    chart.get('livechart-' + i).setData(seriesData(i), false, false, true);
+                }
+            });
+        }
+        (msg.series || []).forEach(function (delta) {
+            applySeries(delta);
+            chart.get('livechart-' + delta.id).setData(seriesData(delta.id), false, false, false);
+        });
+        if (msg.plotLines) {
+            model.plotLines = msg.plotLines;
+            chart.yAxis[0].update({plotLines: msg.plotLines}, false);
+        }
+        chart.redraw();
+    }
+
+    function onRender(args) {
+        setFrameHeight(args.height);
+        var msg = JSON.parse(args.message);
+        if (msg.rev === rev && model) {
+            return;  // same message as the last rerun
+        }
+        if (msg.base_rev === null) {
+            return loadScripts(msg.scripts).then(function () {
+                drawFull(msg);
+                rev = msg.rev;
+            });
+        }
+        if (model && msg.base_rev === rev) {
+            drawDelta(msg);
+            rev = msg.rev;
+        } else {
+            requestResync(msg);
+        }
+    }
+
+    window.addEventListener('message', function (event) {
+        if (event.data && event.data.type === 'streamlit:render') {
+            var args = event.data.args;
+            queue = queue.then(function () { return onRender(args); }).catch(function (err) {
+                console.error(err);
+            });
+        }
+    });
+    send('streamlit:componentReady', {apiVersion: 1});
+})();
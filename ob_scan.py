@@ -0,0 +1,259 @@
+"""
+Headless order block scan over a whole symbol universe (by default every trading USDT-M
+perpetual in the symbol metadata store, see src/metastore.py):
+
+    python ob_scan.py --intervals 1d 4h 1h --out ob_scan.csv
+    python ob_scan.py --symbols BTCUSDT ETHUSDT SOLUSDT --out ob_scan.parquet
+
+Klines come from the local KlineStore (only bars newer than the cache are downloaded),
+fetched a chunk of symbols at a time through a rate-limited thread pool. Each symbol whose
+klines are in is handed to a process pool (one worker per core) while the next chunk is
+fetched. For every symbol and side the nearest active OB over all intervals and OB lengths
+is reported with its stacking count, its distance from the last price and the leverage that
+puts the liquidation price at the far edge of the OB. The rows are ranked by distance.
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from datafeed import RateLimiter, fetch_concurrent, fetch_with_retry
+from klinestore import KlineStore
+from ohlcv import kline_array_to_ohlcv
+from orderblockdetector import detect_order_blocks_multi
+
+SCAN_COLUMNS = ['rank', 'symbol', 'side', 'interval', 'length', 'price', 'entry', 'stop',
+                'distance_pct', 'stack', 'leverage', 'ob_time']
+
+
+def load_universe(path=None, quote_asset='USDT'):
+    """
+    Symbols of the trading perpetual contracts in the metadata store (or in a token_info
+    pickle of exchangeInfo by symbol at 'path'), optionally restricted to one quote asset.
+    """
+    if path is None:
+        from src.lev import token_info
+    else:
+        with open(path, 'rb') as f:
+            token_info = pickle.load(f)
+    return sorted(
+        symbol for symbol, info in token_info.items()
+        if info.get('contractType') == 'PERPETUAL' and info.get('status') == 'TRADING'
+        and (quote_asset is None or info.get('quoteAsset') == quote_asset)
+    )
+
+
+def scan_symbol(symbol, klines_by_interval, lengths=(1, 2, 3, 4, 5, 6, 7), mitigation='Wick'):
+    """
+    Detects the active OBs of every interval and length for one symbol and returns one row
+    (dict) per side for the OB nearest to the last price:
+      - bull: entry at the top of the block, stop at its bottom (as in display_ob_values),
+      - bear: entry at the bottom, stop at the top,
+      - distance_pct: distance from the last price to the entry in % of the price (negative
+        when the price is already inside the block),
+      - stack: number of active OBs of that side, over all intervals and lengths, covering the
+        middle of the block.
+
+    Parameters:
+        symbol: symbol name, copied to the rows.
+        klines_by_interval: {interval: KLINE_DTYPE array}.
+        lengths: OB lengths passed to detect_order_blocks_multi.
+        mitigation: 'Wick' or 'Close'.
+    """
+    price = None
+    last_time = None
+    blocks = {'bull': [], 'bear': []}
+    for interval, klines in klines_by_interval.items():
+        if klines is None or len(klines) == 0:
+            continue
+        # The last close of the interval with the most recent bar is the current price.
+        if last_time is None or klines['close_time'][-1] > last_time:
+            last_time = klines['close_time'][-1]
+            price = float(klines['close'][-1])
+        OBs_by_length = detect_order_blocks_multi(kline_array_to_ohlcv(klines), lengths=lengths,
+                                                  mitigation=mitigation, as_records=True)
+        for length, (bull_OB, bear_OB) in OBs_by_length.items():
+            blocks['bull'].extend((ob, interval, length) for ob in bull_OB)
+            blocks['bear'].extend((ob, interval, length) for ob in bear_OB)
+
+    rows = []
+    for side, found in blocks.items():
+        if not found or not price:
+            continue
+        tops = np.array([ob.top for ob, _, _ in found])
+        bottoms = np.array([ob.bottom for ob, _, _ in found])
+        if side == 'bull':
+            entries, stops = tops, bottoms
+            distance = (price - entries) / price * 100
+        else:
+            entries, stops = bottoms, tops
+            distance = (entries - price) / price * 100
+        distance = np.where(np.isnan(distance), np.inf, distance)
+        i = int(np.argmin(np.abs(distance)))
+        ob, interval, length = found[i]
+        rows.append({
+            'symbol': symbol,
+            'side': side,
+            'interval': interval,
+            'length': length,
+            'price': price,
+            'entry': float(entries[i]),
+            'stop': float(stops[i]),
+            'distance_pct': float(distance[i]),
+            'stack': int(((bottoms <= ob.avg) & (ob.avg < tops)).sum()),
+            'ob_time': ob.left,
+        })
+    return rows
+
+
+def _scan_task(args):
+    return scan_symbol(*args)
+
+
+def implied_leverage(rows, brackets, wallet_balance=1000):
+    """
+    Leverage whose liquidation price is the stop of each row (leverage_for with the symbol's
+    compiled brackets, one call per symbol); NaN when the symbol has no brackets or no tier fits.
+    """
+    from src.lev import leverage_for
+    leverage = np.full(len(rows), np.nan)
+    by_symbol = {}
+    for i, row in enumerate(rows):
+        by_symbol.setdefault(row['symbol'], []).append(i)
+    for symbol, idx in by_symbol.items():
+        if not brackets.get(symbol):
+            continue
+        leverage[idx] = leverage_for(
+            [rows[i]['entry'] for i in idx],
+            [rows[i]['stop'] for i in idx],
+            side=['BUY' if rows[i]['side'] == 'bull' else 'SELL' for i in idx],
+            wallet_balance=wallet_balance,
+            symbol=symbol,
+            bracket_data=brackets,
+        )
+    return leverage.tolist()
+
+
+def rank_results(rows):
+    """
+    Scan rows as a DataFrame ranked by absolute distance to the entry, the most stacked OB
+    first on ties.
+    """
+    df = pd.DataFrame(rows, columns=[c for c in SCAN_COLUMNS if c != 'rank'])
+    if len(df):
+        df['ob_time'] = pd.to_datetime(df['ob_time'], unit='ms')
+        order = np.lexsort((-df['stack'].to_numpy(), df['distance_pct'].abs().to_numpy()))
+        df = df.iloc[order].reset_index(drop=True)
+    df.insert(0, 'rank', np.arange(1, len(df) + 1))
+    return df
+
+
+def write_results(df, path):
+    """
+    Writes the ranked rows to CSV, or to Parquet for a .parquet path (needs pyarrow or
+    fastparquet).
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def run_scan(symbols, intervals, n_bars=500, lengths=(1, 2, 3, 4, 5, 6, 7), mitigation='Wick',
+             store=None, klines_type=None, workers=None, fetch_workers=8, rate=10, chunk_size=32,
+             progress=None):
+    """
+    Scans 'symbols' over 'intervals' and returns the rows of scan_symbol (unranked).
+
+    Parameters:
+        store: KlineStore to read klines from (one with the default cache directory by default).
+        klines_type: market of the klines, HistoricalKlinesType.FUTURES by default.
+        workers: detection processes, os.cpu_count() by default; 1 runs detection inline.
+        fetch_workers, rate: threads and requests per second for the kline downloads.
+        chunk_size: symbols fetched per batch; detection of a batch overlaps the next fetch.
+        progress: callable(done, total) called as symbols complete.
+    """
+    if klines_type is None:
+        from binance.enums import HistoricalKlinesType
+        klines_type = HistoricalKlinesType.FUTURES
+    store = store or KlineStore()
+    workers = workers or os.cpu_count() or 1
+    rate_limiter = RateLimiter(rate=rate)
+
+    def fetch(symbol, interval):
+        return fetch_with_retry(lambda: store.get(symbol, interval, limit=n_bars, klines_type=klines_type),
+                                label=f'{symbol} {interval}', rate_limiter=rate_limiter)
+
+    def tasks():
+        for start in range(0, len(symbols), chunk_size):
+            chunk = symbols[start:start + chunk_size]
+            klines = fetch_concurrent([(s, i) for s in chunk for i in intervals], fetch, max_workers=fetch_workers)
+            for j, symbol in enumerate(chunk):
+                by_interval = dict(zip(intervals, klines[j * len(intervals):(j + 1) * len(intervals)]))
+                yield symbol, by_interval, tuple(lengths), mitigation
+
+    rows = []
+    done = 0
+    if workers <= 1:
+        for task in tasks():
+            rows.extend(_scan_task(task))
+            done += 1
+            if progress:
+                progress(done, len(symbols))
+        return rows
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_scan_task, task) for task in tasks()]
+        for future in as_completed(futures):
+            rows.extend(future.result())
+            done += 1
+            if progress:
+                progress(done, len(symbols))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan a symbol universe for the nearest active order blocks.')
+    parser.add_argument('--symbols', nargs='+', help='symbols to scan (default: perpetuals in --token-info)')
+    parser.add_argument('--token-info', help='token_info pickle (default: the metadata store)')
+    parser.add_argument('--brackets', help='futures_bracket pickle (default: the metadata store)')
+    parser.add_argument('--quote', default='USDT', help="quote asset of the universe ('' for all)")
+    parser.add_argument('--intervals', nargs='+', default=['1d', '8h', '4h', '1h'])
+    parser.add_argument('--bars', type=int, default=500)
+    parser.add_argument('--lengths', nargs='+', type=int, default=[1, 2, 3, 4, 5, 6, 7])
+    parser.add_argument('--mitigation', choices=['Wick', 'Close'], default='Wick')
+    parser.add_argument('--workers', type=int, default=None, help='detection processes (default: one per core)')
+    parser.add_argument('--fetch-workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=10, help='kline requests per second')
+    parser.add_argument('--cache', default='.kline_cache', help='kline store directory')
+    parser.add_argument('--out', default='ob_scan.csv', help='.csv or .parquet')
+    args = parser.parse_args(argv)
+
+    symbols = args.symbols or load_universe(args.token_info, args.quote or None)
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f'\r{done}/{total} symbols', end='', file=sys.stderr, flush=True)
+
+    rows = run_scan(symbols, args.intervals, n_bars=args.bars, lengths=args.lengths, mitigation=args.mitigation,
+                    store=KlineStore(root=args.cache), workers=args.workers, fetch_workers=args.fetch_workers,
+                    rate=args.rate, progress=progress)
+    if args.brackets:
+        with open(args.brackets, 'rb') as f:
+            brackets = pickle.load(f)
+    else:
+        from src.lev import futures_bracket as brackets
+    for row, leverage in zip(rows, implied_leverage(rows, brackets)):
+        row['leverage'] = leverage
+    df = rank_results(rows)
+    write_results(df, args.out)
+    print(f'\n{len(df)} rows for {len(symbols)} symbols in {time.perf_counter() - started:.1f}s -> {args.out}',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
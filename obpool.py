@@ -0,0 +1,243 @@
+"""
+Order block detection over a grid of frames (symbols x timeframes) x OB lengths on a pool of
+worker processes, with the OHLCV arrays shipped through shared memory.
+
+The detection loop is CPU-bound Python, so threads do not help. Pickling DataFrames to the
+workers would copy every frame into each task; instead the columns the detector reads are
+packed once into one multiprocessing.shared_memory block, and a task only carries the block
+name and its row range. Workers return the active OBs as ORDER_BLOCK_DTYPE arrays.
+
+    python obpool.py --bench              # scaling over 1, 2, 4, ... workers
+    python obpool.py --bench --threshold  # inline vs pool by grid size (min_parallel)
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from orderblockdetector import (_detect_multi_arrays, _ohlcv_arrays, order_blocks_from_array,
+                                order_blocks_to_array)
+
+# Columns packed into the shared block, in this order (float64 bit patterns for 'left_ms').
+_SHARED_COLUMNS = ('high', 'low', 'close', 'volume', 'left_ms')
+
+
+def detection_pool(max_workers=None):
+    """
+    Process pool for detect_order_blocks_grid. Workers are spawned rather than forked, which
+    is safe from multithreaded servers such as Streamlit. Keep one per process (e.g. with
+    st.cache_resource); starting the workers costs far more than a small grid.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=get_context('spawn'))
+
+
+def _grid_task(name, total, start, stop, lengths, mitigation):
+    """
+    Worker side: detects the OBs of rows [start, stop) of the shared block for 'lengths' and
+    returns {length: (bull array, bear array)} of ORDER_BLOCK_DTYPE.
+    """
+    # The pool's workers share the parent's resource tracker, so attaching here registers
+    # nothing new and the block lives until the parent unlinks it.
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        block = np.ndarray((len(_SHARED_COLUMNS), total), dtype=np.float64, buffer=shm.buf)
+        arrays = {column: block[i, start:stop] for i, column in enumerate(_SHARED_COLUMNS)}
+        arrays['left_ms'] = arrays['left_ms'].view(np.int64)
+        result = _detect_multi_arrays(arrays, lengths, mitigation)
+        out = {length: (order_blocks_to_array(bull), order_blocks_to_array(bear))
+               for length, (bull, bear) in result.items()}
+        del block, arrays, result
+        return out
+    finally:
+        shm.close()
+
+
+def _split(items, parts):
+    """
+    'items' cut into 'parts' contiguous chunks of near-equal size (no empty chunks).
+    """
+    parts = max(1, min(parts, len(items)))
+    bounds = np.linspace(0, len(items), parts + 1).round().astype(int)
+    return [items[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def detect_order_blocks_grid(frames, lengths=(1, 2, 3, 4, 5, 6, 7), mitigation='Wick', as_records=False,
+                             executor=None, max_workers=None, min_parallel=100_000):
+    """
+    detect_order_blocks_multi for several frames at once, spread over worker processes.
+
+    Parameters:
+      frames       : {key: OHLCV DataFrame} (e.g. keyed by (symbol, interval)).
+      lengths      : Iterable of volume pivot lengths, run for every frame.
+      mitigation   : Either 'Wick' or 'Close'.
+      as_records   : Return OrderBlock records instead of dicts.
+      executor     : Pool to run on (see detection_pool); a temporary one is created otherwise.
+      max_workers  : Workers of the temporary pool, os.cpu_count() by default.
+      min_parallel : Grids with fewer bar-lengths (bars x lengths, summed over the frames) run
+                     inline, where starting processes would cost more than it saves
+                     (`python obpool.py --bench --threshold` measures the crossover).
+
+    Returns:
+      {key: {length: (active_bull_OB, active_bear_OB)}}, each entry identical to
+      detect_order_blocks_multi(frames[key], lengths, mitigation, as_records).
+    """
+    for df in frames.values():
+        for col in ['time', 'open', 'high', 'low', 'close', 'volume']:
+            if col not in df.columns:
+                raise ValueError(f"Column '{col}' not found in DataFrame")
+    lengths = list(dict.fromkeys(lengths))
+    if not frames or not lengths:
+        return {key: {} for key in frames}
+    if min(lengths) < 1:
+        raise ValueError("lengths must be at least 1")
+
+    keys = list(frames)
+    arrays = {key: _ohlcv_arrays(frames[key]) for key in keys}
+    workers = getattr(executor, '_max_workers', None) or max_workers or os.cpu_count() or 1
+    work = sum(len(a['high']) for a in arrays.values()) * len(lengths)
+    if workers <= 1 or work < min_parallel:
+        results = {key: _detect_multi_arrays(arrays[key], lengths, mitigation) for key in keys}
+    else:
+        results = _run_shared(keys, arrays, lengths, mitigation, executor, workers)
+
+    if not as_records:
+        results = {
+            key: {length: ([ob.to_dict(arrays[key]['tz']) for ob in bull],
+                           [ob.to_dict(arrays[key]['tz']) for ob in bear])
+                  for length, (bull, bear) in by_length.items()}
+            for key, by_length in results.items()
+        }
+    return results
+
+
+def _run_shared(keys, arrays, lengths, mitigation, executor, workers):
+    offsets = np.cumsum([0] + [len(arrays[key]['high']) for key in keys])
+    total = int(offsets[-1])
+    shm = shared_memory.SharedMemory(create=True, size=max(len(_SHARED_COLUMNS) * total * 8, 1))
+    own_executor = executor is None
+    try:
+        block = np.ndarray((len(_SHARED_COLUMNS), total), dtype=np.float64, buffer=shm.buf)
+        for i, column in enumerate(_SHARED_COLUMNS):
+            target = block[i].view(np.int64) if column == 'left_ms' else block[i]
+            for key, start, stop in zip(keys, offsets[:-1], offsets[1:]):
+                target[start:stop] = arrays[key][column]
+        del block, target
+
+        # Enough tasks to keep every worker busy: frames with few of them are split by length
+        # (each task still batches its lengths through _detect_multi_arrays).
+        per_frame = -(-2 * workers // len(keys))
+        tasks = [(key, int(start), int(stop), chunk)
+                 for key, start, stop in zip(keys, offsets[:-1], offsets[1:])
+                 for chunk in _split(lengths, per_frame)]
+        if own_executor:
+            executor = detection_pool(min(workers, len(tasks)))
+        futures = [executor.submit(_grid_task, shm.name, total, start, stop, chunk, mitigation)
+                   for _, start, stop, chunk in tasks]
+        results = {key: {} for key in keys}
+        for (key, *_), future in zip(tasks, futures):
+            for length, (bull, bear) in future.result().items():
+                results[key][length] = (order_blocks_from_array(bull), order_blocks_from_array(bear))
+        # Same length order as the input.
+        return {key: {length: results[key][length] for length in lengths} for key in keys}
+    finally:
+        if own_executor and executor is not None:
+            executor.shutdown()
+        shm.close()
+        shm.unlink()
+
+
+def _random_frames(n_frames, n_bars, seed=0):
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for i in range(n_frames):
+        close = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+        frames[i] = pd.DataFrame({
+            'time': pd.to_datetime(np.arange(n_bars) * 3_600_000, unit='ms'),
+            'open': close, 'high': close + rng.uniform(0, 1, n_bars), 'low': close - rng.uniform(0, 1, n_bars),
+            'close': close, 'volume': rng.uniform(1, 100, n_bars),
+        })
+    return frames
+
+
+def benchmark(n_frames=24, n_bars=5000, lengths=(1, 2, 3, 4, 5, 6, 7), workers=None, seed=0):
+    """
+    Times detect_order_blocks_grid on random-walk frames for 1, 2, 4, ... workers (up to
+    os.cpu_count()) against the serial detect_order_blocks_multi loop. Returns
+    [(workers, seconds, speedup)].
+    """
+    from orderblockdetector import detect_order_blocks_multi
+
+    frames = _random_frames(n_frames, n_bars, seed)
+
+    started = time.perf_counter()
+    for df in frames.values():
+        detect_order_blocks_multi(df, lengths=lengths, as_records=True)
+    serial = time.perf_counter() - started
+    timings = [(0, serial, 1.0)]
+
+    max_workers = workers or os.cpu_count() or 1
+    counts = sorted({1, max_workers} | {2 ** i for i in range(1, max_workers.bit_length()) if 2 ** i <= max_workers})
+    for count in counts:
+        with detection_pool(count) as pool:
+            detect_order_blocks_grid(frames, lengths, as_records=True, executor=pool, min_parallel=0)  # warm up
+            started = time.perf_counter()
+            detect_order_blocks_grid(frames, lengths, as_records=True, executor=pool, min_parallel=0)
+            elapsed = time.perf_counter() - started
+        timings.append((count, elapsed, serial / elapsed))
+    return timings
+
+
+def threshold_sweep(n_frames=4, bar_counts=(100, 360, 1000, 3000, 10_000), lengths=(1, 2, 3, 4, 5, 6, 7),
+                    workers=None, repeat=3, seed=0):
+    """
+    Where the pool starts to pay off, i.e. the data behind the min_parallel default: for
+    grids of n_frames x bars x lengths, the best-of-'repeat' seconds of detect_order_blocks_grid
+    inline and on an already started pool of 'workers' (default max(2, os.cpu_count())).
+    Returns [(work, inline seconds, pool seconds)], work being bars x lengths as in
+    detect_order_blocks_grid.
+    """
+    workers = workers or max(2, os.cpu_count() or 1)
+    timings = []
+    with detection_pool(workers) as pool:
+        for n_bars in bar_counts:
+            frames = _random_frames(n_frames, n_bars, seed)
+            best = {}
+            for mode, min_parallel in (('inline', float('inf')), ('pool', 0)):
+                detect_order_blocks_grid(frames, lengths, as_records=True, executor=pool,
+                                         min_parallel=min_parallel)  # warm up
+                best[mode] = float('inf')
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    detect_order_blocks_grid(frames, lengths, as_records=True, executor=pool,
+                                             min_parallel=min_parallel)
+                    best[mode] = min(best[mode], time.perf_counter() - started)
+            timings.append((n_frames * n_bars * len(lengths), best['inline'], best['pool']))
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the process-pool OB detection.')
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('--threshold', action='store_true',
+                        help='with --bench, time inline vs pool over growing grids (min_parallel)')
+    parser.add_argument('--frames', type=int, default=None)
+    parser.add_argument('--bars', type=int, nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    if args.bench and args.threshold:
+        n_frames = args.frames or 4
+        bar_counts = args.bars or [100, 360, 1000, 3000, 10_000]
+        print(f'{os.cpu_count()} CPUs, {n_frames} frames x 7 lengths, inline vs pool')
+        for work, inline, pooled in threshold_sweep(n_frames, bar_counts, workers=args.workers):
+            print(f'{work:>9} bar-lengths: inline {inline:7.3f}s  pool {pooled:7.3f}s  x{inline / pooled:.2f}')
+    elif args.bench:
+        n_frames, n_bars = args.frames or 24, (args.bars or [5000])[0]
+        print(f'{os.cpu_count()} CPUs, {n_frames} frames x {n_bars} bars x 7 lengths')
+        for count, elapsed, speedup in benchmark(n_frames, n_bars, workers=args.workers):
+            label = 'serial' if count == 0 else f'{count} workers'
+            print(f'{label:>10}: {elapsed:7.3f}s  x{speedup:.2f}')
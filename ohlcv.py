@@ -0,0 +1,129 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+# Columns every data source is normalized to (plus the 'time' column used by the detector).
+OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def ohlcv_frame(times_ms, columns):
+    """
+    Wraps int64 ms open times and float64 column arrays in a DataFrame without copying them.
+
+    The index ('datetime') and the 'time' column are datetime64[ms] views of 'times_ms', so
+    they hold the epoch milliseconds as is; each OHLCV column keeps its own contiguous array.
+    """
+    times = np.ascontiguousarray(times_ms, dtype=np.int64).view('datetime64[ms]')
+    data = {name: np.ascontiguousarray(columns[name], dtype=np.float64) for name in OHLCV_COLUMNS}
+    data['time'] = times
+    index = pd.DatetimeIndex(times, copy=False, name='datetime')
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def kline_array_to_ohlcv(arr):
+    """
+    OHLCV DataFrame (see ohlcv_frame) from a KLINE_DTYPE structured array, copying out only
+    the needed fields.
+    """
+    return ohlcv_frame(arr['open_time'], {name: arr[name] for name in OHLCV_COLUMNS})
+
+
+def tv_to_ohlcv(df):
+    """
+    Normalizes a TvDatafeed frame (naive DatetimeIndex, 'symbol' and OHLCV columns) to the
+    same OHLCV DataFrame as the Binance paths.
+    """
+    return ohlcv_frame(index_ms(df.index), {name: df[name].to_numpy(dtype=np.float64) for name in OHLCV_COLUMNS})
+
+
+def index_ms(index):
+    """
+    Epoch milliseconds of a DatetimeIndex as int64 (tz-aware indexes are taken in UTC), the
+    vectorized form of int(idx.timestamp() * 1000).
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    return np.asarray(index.to_numpy(), dtype='datetime64[ms]').view(np.int64)
+
+
+def candlestick_rows(df, columns=OHLCV_COLUMNS):
+    """
+    Highcharts point rows [ts_ms, *columns] for every bar of 'df', built from the index and
+    the column arrays in one pass (no iterrows). NaN values become None (null, i.e. a gap).
+    """
+    return point_rows(index_ms(df.index), [df[name].to_numpy(dtype=np.float64) for name in columns])
+
+
+def point_rows(times_ms, arrays):
+    """
+    Rows [ts_ms, *values] from an int64 ms array and float64 value arrays of the same length,
+    with NaN values as None.
+    """
+    values = []
+    for col in arrays:
+        nan = np.isnan(col)
+        if nan.any():
+            col = col.astype(object)
+            col[nan] = None
+        values.append(col.tolist())
+    return list(map(list, zip(np.asarray(times_ms).tolist(), *values)))
+
+
+def candlestick_json(df, columns=OHLCV_COLUMNS):
+    """
+    candlestick_rows as compact JSON (no whitespace, NaN as null).
+    """
+    return json.dumps(candlestick_rows(df, columns), separators=(',', ':'))
+
+
+def _iterrows_rows(df, columns=OHLCV_COLUMNS):
+    # The per-row loop candlestick_rows replaced in the apps, kept for benchmark().
+    rows = []
+    for idx, row in df.iterrows():
+        rows.append([int(idx.timestamp() * 1000), *(row[name] for name in columns)])
+    return rows
+
+
+def benchmark(n_bars=10_000, repeat=5, seed=0):
+    """
+    Best-of-'repeat' seconds to build the candlestick rows of an n_bars OHLCV frame with
+    iterrows and with candlestick_rows, as rows and as JSON text.
+    Returns {name: seconds}.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+    df = ohlcv_frame(1_600_000_000_000 + np.arange(n_bars, dtype=np.int64) * 3_600_000, {
+        'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+        'volume': rng.uniform(1, 100, n_bars),
+    })
+    assert _iterrows_rows(df) == candlestick_rows(df)
+    runs = {
+        'iterrows': lambda: _iterrows_rows(df),
+        'candlestick_rows': lambda: candlestick_rows(df),
+        'iterrows + json': lambda: json.dumps(_iterrows_rows(df)),
+        'candlestick_json': lambda: candlestick_json(df),
+    }
+    results = {}
+    for name, run in runs.items():
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - started)
+        results[name] = best
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark candlestick row building.')
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('--bars', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if args.bench:
+        for name, seconds in benchmark(args.bars, args.repeat).items():
+            print(f'{name:>18}: {seconds * 1000:8.1f} ms')
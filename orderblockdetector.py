@@ -1,5 +1,124 @@
+import argparse
+import time
+
 import pandas as pd
 import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class OrderBlock:
+    """
+    Compact record for one order block. Hashing and equality use the plain field values,
+    which makes de-duplication cheap (no Timestamp hashing as with frozenset(ob.items())).
+
+    Fields:
+      side   : 'bull' or 'bear'
+      top    : upper edge of the block (bull: hl2 of the pivot bar, bear: its high)
+      bottom : lower edge of the block (bull: low of the pivot bar, bear: hl2)
+      avg    : middle of the block
+      left   : time of the pivot bar in ms since the epoch (left edge of the drawn box)
+      index  : position of the pivot bar in the DataFrame
+    """
+    side: str
+    top: float
+    bottom: float
+    avg: float
+    left: int
+    index: int
+
+    @property
+    def value(self):
+        """
+        OB value as in the dicts: the pivot low for bull OBs, the pivot high for bear OBs.
+        """
+        return self.bottom if self.side == 'bull' else self.top
+
+    def to_dict(self, tz=None):
+        """
+        Returns the dict form used by detect_order_blocks (e.g. 'bull_top', 'bull_left', ...).
+        'bull_left'/'bear_left' is rebuilt as a pd.Timestamp, converted to 'tz' when given.
+        """
+        if tz is None:
+            left = pd.Timestamp(self.left, unit='ms')
+        else:
+            left = pd.Timestamp(self.left, unit='ms', tz='UTC').tz_convert(tz)
+        return {
+            'index': self.index,
+            f'{self.side}_top': self.top,
+            f'{self.side}_btm': self.bottom,
+            f'{self.side}_avg': self.avg,
+            f'{self.side}_left': left,
+            'value': self.value
+        }
+
+    @classmethod
+    def from_dict(cls, ob):
+        """
+        Builds an OrderBlock from the dict form (bull or bear).
+        """
+        side = 'bull' if 'bull_top' in ob else 'bear'
+        return cls(side, float(ob[f'{side}_top']), float(ob[f'{side}_btm']), float(ob[f'{side}_avg']),
+                   _timestamp_ms(ob[f'{side}_left']), int(ob['index']))
+
+
+# Bulk form of OrderBlock for large scans: side is 1 for bull and 0 for bear (as os_state).
+ORDER_BLOCK_DTYPE = np.dtype([
+    ('side', 'i1'),
+    ('top', 'f8'),
+    ('bottom', 'f8'),
+    ('avg', 'f8'),
+    ('left', 'i8'),
+    ('index', 'i8'),
+])
+
+def order_blocks_to_array(obs):
+    """
+    Packs a list of OrderBlock records (or OB dicts) into a structured array of ORDER_BLOCK_DTYPE.
+    """
+    obs = [_as_order_block(ob) for ob in obs]
+    return np.array(
+        [(ob.side == 'bull', ob.top, ob.bottom, ob.avg, ob.left, ob.index) for ob in obs],
+        dtype=ORDER_BLOCK_DTYPE
+    )
+
+def order_blocks_from_array(arr):
+    """
+    Unpacks a structured array of ORDER_BLOCK_DTYPE into OrderBlock records.
+    """
+    return [
+        OrderBlock('bull' if side else 'bear', top, bottom, avg, left, index)
+        for side, top, bottom, avg, left, index in arr.tolist()
+    ]
+
+def _as_order_block(ob):
+    """
+    Accepts either an OrderBlock or the legacy dict form.
+    """
+    return ob if isinstance(ob, OrderBlock) else OrderBlock.from_dict(ob)
+
+def _timestamp_ms(ts):
+    """
+    Milliseconds since the epoch for a timestamp; naive timestamps are taken as UTC,
+    like pd.Timestamp.timestamp().
+    """
+    ts = pd.Timestamp(ts)
+    if ts.tz is not None:
+        ts = ts.tz_convert(None)
+    return ts.value // 1_000_000
+
+def _times_to_ms(times):
+    """
+    Vectorized _timestamp_ms for a Series of timestamps. Returns (int64 array, tz).
+    """
+    times = pd.to_datetime(times)
+    tz = times.dt.tz
+    if tz is not None:
+        times = times.dt.tz_convert(None)
+    return times.to_numpy().astype('datetime64[ms]').astype(np.int64), tz
+
 
 def is_pivot_high(series, idx, left, right):
     """
@@ -18,7 +137,8 @@ def is_pivot_high(series, idx, left, right):
         return False
     return True
 
-def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigation='Wick'):
+def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigation='Wick', engine='loop',
+                        as_records=False):
     """
     Detects bullish and bearish order blocks in a DataFrame (which must include 
     'time', 'open', 'high', 'low', 'close', and 'volume' columns). 
@@ -31,6 +151,10 @@ def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigati
       bull_ext_last  : Number of bullish OB boxes to “extend” (for drawing; not used in DF output)
       bear_ext_last  : Number of bearish OB boxes to “extend” 
       mitigation     : Either 'Wick' or 'Close'. When 'Close', target values are computed from the close.
+      engine         : 'loop' walks the DataFrame bar by bar (reference implementation);
+                       'numpy' computes the rolling windows and volume pivots on plain arrays
+                       and returns identical results much faster.
+      as_records     : Return the active OBs as OrderBlock records instead of dicts.
     
     Returns:
       A copy of df with extra columns:
@@ -38,12 +162,18 @@ def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigati
          - 'bear_ob'       : bearish OB value 
          - 'bull_mitigated': Boolean flag that is set to True when a bullish OB is removed
          - 'bear_mitigated': Boolean flag for bearish OB mitigation
+      followed by the lists of active (unmitigated) bullish and bearish OBs.
     """
     
     # Verify required columns exist
     for col in ['time', 'open', 'high', 'low', 'close', 'volume']:
         if col not in df.columns:
             raise ValueError(f"Column '{col}' not found in DataFrame")
+
+    if engine == 'numpy':
+        return _detect_order_blocks_numpy(df, length, mitigation, as_records)
+    if engine != 'loop':
+        raise ValueError(f"Unknown engine '{engine}' (expected 'loop' or 'numpy')")
     
     # Work on a copy and initialize output columns
     df = df.copy()
@@ -141,8 +271,589 @@ def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigati
         if bear_mitigated_flag:
             df.at[df.index[i], 'bear_mitigated'] = True
 
+    if as_records:
+        active_bull_OB = [OrderBlock.from_dict(ob) for ob in active_bull_OB]
+        active_bear_OB = [OrderBlock.from_dict(ob) for ob in active_bear_OB]
+    return df, active_bull_OB, active_bear_OB
+
+
+def _rolling_max(values, length):
+    """
+    Max of the last 'length' values at every bar (NaN values are skipped, like pandas).
+    Element i covers values[i - length + 1 : i + 1]; the first length-1 bars are NaN.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= length:
+        windows = np.lib.stride_tricks.sliding_window_view(values, length)
+        out[length - 1:] = np.fmax.reduce(windows, axis=1)
+    return out
+
+def _rolling_min(values, length):
+    """
+    Min counterpart of _rolling_max.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= length:
+        windows = np.lib.stride_tricks.sliding_window_view(values, length)
+        out[length - 1:] = np.fmin.reduce(windows, axis=1)
+    return out
+
+def _pivot_high_mask(series, left, right):
+    """
+    Vectorized is_pivot_high: returns a boolean array that is True at every index
+    where is_pivot_high(series, idx, left, right) would return True.
+    The comparisons are written exactly like is_pivot_high so NaN values behave the same.
+    """
+    n = len(series)
+    mask = np.zeros(n, dtype=bool)
+    if n - left - right <= 0:
+        return mask
+    pivots = series[left:n - right, None]
+    if left > 0:
+        left_windows = np.lib.stride_tricks.sliding_window_view(series[:n - right - 1], left)
+        mask[left:n - right] = ~(left_windows >= pivots).any(axis=1)
+    else:
+        mask[left:n - right] = True
+    if right > 0:
+        right_windows = np.lib.stride_tricks.sliding_window_view(series[left + 1:], right)
+        mask[left:n - right] &= ~(right_windows > pivots).any(axis=1)
+    return mask
+
+def _os_states(high, low, upper, lower, length):
+    """
+    Returns the os_state in effect at every bar i (for i >= length), computed the same way as
+    the loop: 0 when the pivot bar's high breaks above the window, 1 when its low breaks below,
+    otherwise the previous state carries forward (starting from 0).
+    """
+    n = len(high)
+    states = np.zeros(n, dtype=np.int8)
+    if n <= length:
+        return states
+    pivot_high = high[:n - length]
+    pivot_low = low[:n - length]
+    events = np.where(pivot_high > upper[length:], 0,
+                      np.where(pivot_low < lower[length:], 1, -1))
+    # Forward-fill the last event (a leading run without events keeps the initial state 0)
+    last_event = np.maximum.accumulate(np.where(events >= 0, np.arange(len(events)), -1))
+    states[length:] = np.where(last_event >= 0, events[np.maximum(last_event, 0)], 0)
+    return states
+
+def _ohlcv_arrays(df):
+    """
+    Extracts the columns used by the detector once, as float64 arrays, plus the 'time' column
+    in ms since the epoch ('left_ms') and its timezone ('tz', None for naive timestamps).
+    """
+    left_ms, tz = _times_to_ms(df['time'])
+    return {
+        'high': df['high'].to_numpy(dtype=float),
+        'low': df['low'].to_numpy(dtype=float),
+        'close': df['close'].to_numpy(dtype=float),
+        'volume': df['volume'].to_numpy(dtype=float),
+        'left_ms': left_ms,
+        'tz': tz,
+    }
+
+class _ActiveOrderBlocks:
+    """
+    Active OrderBlocks of one side, kept sorted by the level that mitigates them (bottom for
+    bull OBs, top for bear OBs). Every OB mitigated by a target is then removed with one
+    bisect and one slice instead of scanning (and copying) the whole list on every bar.
+    OBs with a NaN level can never be mitigated and are kept aside.
+    """
+
+    def __init__(self, side):
+        self.side = side
+        self._levels = []
+        self._obs = []
+        self._unmitigable = []
+
+    def __len__(self):
+        return len(self._obs) + len(self._unmitigable)
+
+    def _level(self, ob):
+        return ob.bottom if self.side == 'bull' else ob.top
+
+    def add(self, ob):
+        level = self._level(ob)
+        if level != level:
+            self._unmitigable.append(ob)
+            return
+        pos = bisect_right(self._levels, level)
+        self._levels.insert(pos, level)
+        self._obs.insert(pos, ob)
+
+    def discard(self, ob):
+        """
+        Removes one specific OB (used to roll back an update).
+        """
+        level = self._level(ob)
+        if level != level:
+            self._unmitigable.remove(ob)
+            return
+        pos = bisect_left(self._levels, level)
+        while self._obs[pos] is not ob:
+            pos += 1
+        del self._levels[pos]
+        del self._obs[pos]
+
+    def mitigate(self, target):
+        """
+        Removes and returns (in formation order) every OB mitigated by 'target':
+        bull OBs with target < bull_btm, bear OBs with target > bear_top.
+        A NaN target mitigates nothing, as in the loop engine.
+        """
+        if self.side == 'bull':
+            pos = bisect_right(self._levels, target)
+            removed = self._obs[pos:]
+            del self._levels[pos:]
+            del self._obs[pos:]
+        else:
+            pos = bisect_left(self._levels, target)
+            removed = self._obs[:pos]
+            del self._levels[:pos]
+            del self._obs[:pos]
+        if len(removed) > 1:
+            removed.sort(key=lambda ob: ob.index)
+        return removed
+
+    def to_list(self):
+        """
+        Active OBs in formation order, like the lists returned by detect_order_blocks.
+        """
+        return sorted(self._obs + self._unmitigable, key=lambda ob: ob.index)
+
+def _scan_order_blocks(arrays, length, upper, lower, target_bull, target_bear, pivots, history=None,
+                       store=_ActiveOrderBlocks):
+    """
+    Sequential part of the numpy engine for one OB length. 'upper'/'lower' and the mitigation
+    targets are the rolling window values at every bar, 'pivots' the volume pivot-high mask.
+    When a dict is passed as 'history', every OB formed is recorded in it as
+    {OrderBlock: [formed_bar, mitigated_bar]} (mitigated_bar -1 while still active).
+    'store' is the container class of the active OBs (replaced by benchmark()).
+
+    Returns (bull_ob, bear_ob, bull_mitigated, bear_mitigated, active_bull_OB, active_bear_OB),
+    the first four being per-bar arrays matching the DataFrame columns of the loop engine and
+    the OB lists holding OrderBlock records.
+    """
+    high = arrays['high']
+    low = arrays['low']
+    left_ms = arrays['left_ms']
+    n = len(high)
+
+    states = _os_states(high, low, upper, lower, length)
+
+    bull_ob = np.full(n, np.nan)
+    bear_ob = np.full(n, np.nan)
+    bull_mitigated = np.zeros(n, dtype=bool)
+    bear_mitigated = np.zeros(n, dtype=bool)
+    active_bull = store('bull')
+    active_bear = store('bear')
+
+    # Bars at which an OB is formed: the pivot bar (i - length) is a volume pivot high.
+    formed = np.zeros(n, dtype=bool)
+    if n > length:
+        formed[length:] = pivots[:n - length]
+    formed_list = formed.tolist()
+    states_list = states.tolist()
+    target_bull_list = target_bull.tolist()
+    target_bear_list = target_bear.tolist()
+
+    for i in range(length, n):
+        if formed_list[i]:
+            pivot_idx = i - length
+            pivot_high = float(high[pivot_idx])
+            pivot_low = float(low[pivot_idx])
+            hl2 = (pivot_high + pivot_low) / 2
+            if states_list[i] == 1:
+                ob = OrderBlock('bull', hl2, pivot_low, (hl2 + pivot_low) / 2, int(left_ms[pivot_idx]), pivot_idx)
+                active_bull.add(ob)
+                bull_ob[i] = pivot_low
+            else:
+                ob = OrderBlock('bear', pivot_high, hl2, (pivot_high + hl2) / 2, int(left_ms[pivot_idx]), pivot_idx)
+                active_bear.add(ob)
+                bear_ob[i] = pivot_high
+            if history is not None:
+                history[ob] = [i, -1]
+
+        if active_bull:
+            removed = active_bull.mitigate(target_bull_list[i])
+            if removed:
+                bull_mitigated[i] = True
+                if history is not None:
+                    for ob in removed:
+                        history[ob][1] = i
+        if active_bear:
+            removed = active_bear.mitigate(target_bear_list[i])
+            if removed:
+                bear_mitigated[i] = True
+                if history is not None:
+                    for ob in removed:
+                        history[ob][1] = i
+
+    return bull_ob, bear_ob, bull_mitigated, bear_mitigated, active_bull.to_list(), active_bear.to_list()
+
+def _detect_order_blocks_numpy(df, length, mitigation, as_records=False):
+    """
+    Array implementation behind detect_order_blocks(engine='numpy').
+    Everything except the mitigation of active OBs is computed in bulk; the mitigation
+    pass remains a loop over plain Python floats.
+    """
+    if length < 1:
+        raise ValueError("length must be at least 1 for the numpy engine")
+
+    arrays = _ohlcv_arrays(df)
+    upper = _rolling_max(arrays['high'], length)
+    lower = _rolling_min(arrays['low'], length)
+    if mitigation == 'Close':
+        target_bull = _rolling_min(arrays['close'], length)
+        target_bear = _rolling_max(arrays['close'], length)
+    else:
+        target_bull = lower
+        target_bear = upper
+    pivots = _pivot_high_mask(arrays['volume'], length, length)
+
+    bull_ob, bear_ob, bull_mitigated, bear_mitigated, active_bull_OB, active_bear_OB = _scan_order_blocks(
+        arrays, length, upper, lower, target_bull, target_bear, pivots
+    )
+
+    df = df.copy()
+    df['bull_ob'] = bull_ob
+    df['bear_ob'] = bear_ob
+    df['bull_mitigated'] = bull_mitigated
+    df['bear_mitigated'] = bear_mitigated
+    if not as_records:
+        active_bull_OB = [ob.to_dict(arrays['tz']) for ob in active_bull_OB]
+        active_bear_OB = [ob.to_dict(arrays['tz']) for ob in active_bear_OB]
     return df, active_bull_OB, active_bear_OB
 
+def _rolling_max_all(values, max_length):
+    """
+    Rolling max for every window length 1..max_length in one batched operation.
+    Column k-1 of the result holds the max of the last k values at each bar; like
+    _rolling_max, entries before a full window is available are not meaningful.
+    """
+    if len(values) == 0:
+        return np.empty((0, max_length))
+    padded = np.concatenate([np.full(max_length - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, max_length)[:, ::-1]
+    return np.fmax.accumulate(windows, axis=1)
+
+def _rolling_min_all(values, max_length):
+    """
+    Min counterpart of _rolling_max_all.
+    """
+    if len(values) == 0:
+        return np.empty((0, max_length))
+    padded = np.concatenate([np.full(max_length - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, max_length)[:, ::-1]
+    return np.fmin.accumulate(windows, axis=1)
+
+def _pivot_high_mask_all(series, max_length):
+    """
+    Volume pivot-high masks for every length 1..max_length (left == right == length) at once.
+    Column k-1 equals _pivot_high_mask(series, k, k).
+    """
+    n = len(series)
+    padded = np.concatenate([np.full(max_length, np.nan), series, np.full(max_length, np.nan)])
+    pivots = series[:, None]
+    offsets = np.arange(1, max_length + 1)
+    # Out-of-range neighbours are NaN and never block a pivot; the range check is applied below.
+    left_hits = padded[max_length + np.arange(n)[:, None] - offsets] >= pivots
+    right_hits = padded[max_length + np.arange(n)[:, None] + offsets] > pivots
+    blocked = np.logical_or.accumulate(left_hits, axis=1) | np.logical_or.accumulate(right_hits, axis=1)
+    idx = np.arange(n)[:, None]
+    in_range = (idx - offsets >= 0) & (idx + offsets < n)
+    return ~blocked & in_range
+
+def detect_order_blocks_multi(df, lengths=(1, 2, 3, 4, 5, 6, 7), mitigation='Wick', as_records=False):
+    """
+    Runs the numpy engine of detect_order_blocks for several OB lengths on the same DataFrame.
+    The OHLCV columns are extracted and validated once and the rolling windows / volume pivots
+    are computed for every length in a single batched operation, so the multi-length overlay
+    costs little more than one detection.
+
+    Parameters:
+      df         : pandas DataFrame with OHLCV data (same columns as detect_order_blocks).
+      lengths    : Iterable of volume pivot lengths.
+      mitigation : Either 'Wick' or 'Close'.
+      as_records : Return OrderBlock records instead of dicts.
+
+    Returns:
+      A dict mapping each length to (active_bull_OB, active_bear_OB), identical to
+      detect_order_blocks(df, length=length, mitigation=mitigation)[1:].
+    """
+    for col in ['time', 'open', 'high', 'low', 'close', 'volume']:
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' not found in DataFrame")
+    lengths = list(dict.fromkeys(lengths))
+    if not lengths:
+        return {}
+    if min(lengths) < 1:
+        raise ValueError("lengths must be at least 1")
+
+    arrays = _ohlcv_arrays(df)
+    result = _detect_multi_arrays(arrays, lengths, mitigation)
+    if not as_records:
+        result = {
+            length: ([ob.to_dict(arrays['tz']) for ob in bull], [ob.to_dict(arrays['tz']) for ob in bear])
+            for length, (bull, bear) in result.items()
+        }
+    return result
+
+def _multi_length_windows(arrays, max_length, mitigation):
+    """
+    Rolling windows, mitigation targets and volume pivot masks for every length 1..max_length
+    (column k-1 for length k): (upper, lower, target_bull, target_bear, pivots).
+    """
+    upper_all = _rolling_max_all(arrays['high'], max_length)
+    lower_all = _rolling_min_all(arrays['low'], max_length)
+    if mitigation == 'Close':
+        target_bull_all = _rolling_min_all(arrays['close'], max_length)
+        target_bear_all = _rolling_max_all(arrays['close'], max_length)
+    else:
+        target_bull_all = lower_all
+        target_bear_all = upper_all
+    pivots_all = _pivot_high_mask_all(arrays['volume'], max_length)
+    return upper_all, lower_all, target_bull_all, target_bear_all, pivots_all
+
+def _detect_multi_arrays(arrays, lengths, mitigation):
+    """
+    Body of detect_order_blocks_multi on the arrays of _ohlcv_arrays (only 'high', 'low',
+    'close', 'volume' and 'left_ms' are read): {length: (active bull, active bear)} as
+    OrderBlock records. 'lengths' must be validated, non-empty and free of duplicates.
+    """
+    windows = _multi_length_windows(arrays, max(lengths), mitigation)
+    result = {}
+    for length in lengths:
+        k = length - 1
+        *_, active_bull_OB, active_bear_OB = _scan_order_blocks(
+            arrays, length, *(w[:, k] for w in windows)
+        )
+        result[length] = (active_bull_OB, active_bear_OB)
+    return result
+
+# ORDER_BLOCK_DTYPE plus the lifetime of the OB: the time of the bar at which it was formed
+# (pivot bar + length, when it becomes known) and of the bar that mitigated it, in ms.
+# 'mitigated' is ACTIVE_UNTIL for OBs that are still active at the last bar.
+ORDER_BLOCK_HISTORY_DTYPE = np.dtype(ORDER_BLOCK_DTYPE.descr + [('formed', 'i8'), ('mitigated', 'i8')])
+ACTIVE_UNTIL = np.iinfo(np.int64).max
+
+def order_block_history(df, lengths=(3,), mitigation='Wick'):
+    """
+    Every order block formed over the whole DataFrame (not only the active ones), with the
+    times it was formed and mitigated, for backtests over long histories (see
+    confluence.ConfluenceIndex). Uses the numpy engine; the OBs are the ones
+    detect_order_blocks_multi tracks for each length.
+
+    Parameters:
+      df         : pandas DataFrame with OHLCV data (same columns as detect_order_blocks).
+      lengths    : Iterable of volume pivot lengths; the OBs of all lengths are concatenated.
+      mitigation : Either 'Wick' or 'Close'.
+
+    Returns:
+      Structured array of ORDER_BLOCK_HISTORY_DTYPE in formation order (per length).
+    """
+    for col in ['time', 'open', 'high', 'low', 'close', 'volume']:
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' not found in DataFrame")
+    lengths = list(dict.fromkeys(lengths))
+    if not lengths:
+        return np.empty(0, dtype=ORDER_BLOCK_HISTORY_DTYPE)
+    if min(lengths) < 1:
+        raise ValueError("lengths must be at least 1")
+
+    arrays = _ohlcv_arrays(df)
+    windows = _multi_length_windows(arrays, max(lengths), mitigation)
+
+    rows = []
+    for length in lengths:
+        k = length - 1
+        history = {}
+        _scan_order_blocks(arrays, length, *(w[:, k] for w in windows), history=history)
+        rows.extend((ob.side == 'bull', ob.top, ob.bottom, ob.avg, ob.left, ob.index, formed, mitigated)
+                    for ob, (formed, mitigated) in history.items())
+
+    out = np.array(rows, dtype=ORDER_BLOCK_HISTORY_DTYPE)
+    if len(out):
+        # Bar positions to bar times.
+        times = arrays['left_ms']
+        active = out['mitigated'] < 0
+        out['formed'] = times[out['formed']]
+        out['mitigated'] = np.where(active, ACTIVE_UNTIL, times[np.where(active, 0, out['mitigated'])])
+    return out
+
+def _nan_max(values):
+    """
+    max() that skips NaN values like pandas (NaN if nothing is left).
+    """
+    values = [v for v in values if v == v]
+    return max(values) if values else np.nan
+
+def _nan_min(values):
+    """
+    min() that skips NaN values like pandas (NaN if nothing is left).
+    """
+    values = [v for v in values if v == v]
+    return min(values) if values else np.nan
+
+
+class OrderBlockDetector:
+    """
+    Stateful, incremental counterpart of detect_order_blocks.
+
+    Carries os_state, the active bull/bear OB lists and a ring buffer of the last 2*length+1
+    bars, so every new candle is processed in O(length) instead of re-running the detection
+    from bar zero. Feeding the bars of a DataFrame one by one produces the same active OB lists
+    as detect_order_blocks(df, length=length, mitigation=mitigation).
+
+    Calling update() again with the same 'time' as the previous bar replaces that bar (the
+    previous update is rolled back first), so the still-forming last candle can be re-sent on
+    every refresh.
+
+    OBs are returned as dicts, or as OrderBlock records when as_records=True.
+
+    Usage:
+      detector = OrderBlockDetector.from_dataframe(data, length=3)
+      events = detector.update({'time': t, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v})
+    """
+
+    def __init__(self, length=5, mitigation='Wick', as_records=False):
+        if length < 1:
+            raise ValueError("length must be at least 1")
+        self.length = length
+        self.mitigation = mitigation
+        self.as_records = as_records
+        self.tz = None  # timezone of the bar times, used to rebuild the dict form
+        self.os_state = 0
+        self._active = {'bull': _ActiveOrderBlocks('bull'), 'bear': _ActiveOrderBlocks('bear')}
+        self.n_bars = 0  # number of bars processed so far (index of the next bar)
+        # Ring buffer of (time in ms, high, low, close, volume) for the last 2*length+1 bars
+        self.bars = deque(maxlen=2 * length + 1)
+        self._undo = None
+
+    @property
+    def active_bull_OB(self):
+        return self._output(self._active['bull'].to_list())
+
+    @property
+    def active_bear_OB(self):
+        return self._output(self._active['bear'].to_list())
+
+    def _output(self, obs):
+        return obs if self.as_records else [ob.to_dict(self.tz) for ob in obs]
+
+    @classmethod
+    def from_dataframe(cls, df, length=5, mitigation='Wick', as_records=False):
+        """
+        Seeds a detector from a historical DataFrame (same columns as detect_order_blocks).
+        The history is processed with the numpy engine; the last bar goes through update()
+        so that it can still be replaced by a newer version of the same candle.
+        """
+        detector = cls(length, mitigation, as_records)
+        if len(df) == 0:
+            return detector
+        history = df.iloc[:-1]
+        _, active_bull_OB, active_bear_OB = detect_order_blocks(
+            history, length=length, mitigation=mitigation, engine='numpy', as_records=True
+        )
+        for ob in active_bull_OB:
+            detector._active['bull'].add(ob)
+        for ob in active_bear_OB:
+            detector._active['bear'].add(ob)
+        arrays = _ohlcv_arrays(history)
+        detector.tz = arrays['tz']
+        n = len(history)
+        if n > length:
+            upper = _rolling_max(arrays['high'], length)
+            lower = _rolling_min(arrays['low'], length)
+            detector.os_state = int(_os_states(arrays['high'], arrays['low'], upper, lower, length)[-1])
+        for j in range(max(n - detector.bars.maxlen, 0), n):
+            detector.bars.append((int(arrays['left_ms'][j]), float(arrays['high'][j]), float(arrays['low'][j]),
+                                  float(arrays['close'][j]), float(arrays['volume'][j])))
+        detector.n_bars = n
+        detector.update(df.iloc[-1])
+        return detector
+
+    def update(self, bar):
+        """
+        Processes one candle (a dict or pandas Series with 'time', 'high', 'low', 'close' and
+        'volume') and returns the changes it caused:
+          {'bull_formed': [...], 'bear_formed': [...], 'bull_mitigated': [...], 'bear_mitigated': [...]}
+        """
+        time_ms = _timestamp_ms(bar['time'])
+        if self.n_bars == 0:
+            self.tz = pd.Timestamp(bar['time']).tz
+        if self._undo is not None and self.bars and time_ms == self.bars[-1][0]:
+            self._rollback()
+
+        dropped = self.bars[0] if len(self.bars) == self.bars.maxlen else None
+        self.bars.append((time_ms, float(bar['high']), float(bar['low']),
+                          float(bar['close']), float(bar['volume'])))
+        i = self.n_bars
+        self.n_bars += 1
+        events = {'bull_formed': [], 'bear_formed': [], 'bull_mitigated': [], 'bear_mitigated': []}
+        self._undo = {'dropped': dropped, 'os_state': self.os_state, 'events': events}
+
+        length = self.length
+        if i < length:
+            return {key: [] for key in events}
+
+        bars = list(self.bars)
+        window = bars[-length:]
+        upper = _nan_max(b[1] for b in window)
+        lower = _nan_min(b[2] for b in window)
+        if self.mitigation == 'Close':
+            target_bull = _nan_min(b[3] for b in window)
+            target_bear = _nan_max(b[3] for b in window)
+        else:
+            target_bull = lower
+            target_bear = upper
+
+        pivot_idx = i - length
+        pivot_time, pivot_high, pivot_low, _, pivot_volume = bars[-(length + 1)]
+        if pivot_high > upper:
+            self.os_state = 0
+        elif pivot_low < lower:
+            self.os_state = 1
+
+        if i >= 2 * length:
+            left = bars[-(2 * length + 1):-(length + 1)]
+            is_pivot = (not any(b[4] >= pivot_volume for b in left)
+                        and not any(b[4] > pivot_volume for b in window))
+            if is_pivot:
+                hl2 = (pivot_high + pivot_low) / 2
+                if self.os_state == 1:
+                    ob = OrderBlock('bull', hl2, pivot_low, (hl2 + pivot_low) / 2, pivot_time, pivot_idx)
+                    self._active['bull'].add(ob)
+                    events['bull_formed'].append(ob)
+                else:
+                    ob = OrderBlock('bear', pivot_high, hl2, (pivot_high + hl2) / 2, pivot_time, pivot_idx)
+                    self._active['bear'].add(ob)
+                    events['bear_formed'].append(ob)
+
+        events['bull_mitigated'] = self._active['bull'].mitigate(target_bull)
+        events['bear_mitigated'] = self._active['bear'].mitigate(target_bear)
+        return {key: self._output(obs) for key, obs in events.items()}
+
+    def _rollback(self):
+        """
+        Undoes the last update() (used when the same candle is sent again).
+        """
+        undo = self._undo
+        self._undo = None
+        self.bars.pop()
+        if undo['dropped'] is not None:
+            self.bars.appendleft(undo['dropped'])
+        self.n_bars -= 1
+        self.os_state = undo['os_state']
+        events = undo['events']
+        for side in ('bull', 'bear'):
+            for ob in events[f'{side}_mitigated']:
+                self._active[side].add(ob)
+            for ob in events[f'{side}_formed']:
+                self._active[side].discard(ob)
+
+
 # --- Example usage ---
 
 # Suppose you have a DataFrame 'data' with columns: 
@@ -151,11 +862,55 @@ def detect_order_blocks(df, length=5, bull_ext_last=3, bear_ext_last=3, mitigati
 #
 # df_with_ob, active_bull_OB, active_bear_OB = detect_order_blocks(data, length=3, bull_ext_last=3, bear_ext_last=3, mitigation='Wick')
 #
+# Pass engine='numpy' for the vectorized implementation (same results, much faster).
+#
 # Now, df_with_ob will include the new columns that correspond to the Pine code’s output.
 
 
 
 
+def find_stacked_levels(tops, bottoms):
+    """
+    Vectorized sweep line over the vertical intervals [bottom, top] of many order blocks.
+
+    The interval ends are sorted once (np.argsort) and the overlap count after each end is a
+    cumulative sum of +1 (lower end) / -1 (upper end) steps; the count between two distinct
+    consecutive ends is the cumulative sum at the last step of the first one. Intervals with
+    a NaN end are ignored; top and bottom may be given in either order.
+
+    Parameters:
+      tops (array-like): Upper edges of the blocks (e.g. the 'top' field of an ORDER_BLOCK_DTYPE array).
+      bottoms (array-like): Lower edges of the blocks.
+
+    Returns:
+      tuple: (counts, lower, upper) arrays, one entry per contiguous interval between two
+             distinct ends with its overlap count, sorted like find_all_stacked_points
+             (count descending, then midpoint descending).
+    """
+    tops = np.asarray(tops, dtype=np.float64)
+    bottoms = np.asarray(bottoms, dtype=np.float64)
+    valid = ~(np.isnan(tops) | np.isnan(bottoms))
+    tops, bottoms = tops[valid], bottoms[valid]
+    coords = np.concatenate([np.minimum(tops, bottoms), np.maximum(tops, bottoms)])
+    if len(coords) == 0:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty
+
+    steps = np.concatenate([np.ones(len(tops), dtype=np.int64), np.full(len(tops), -1, dtype=np.int64)])
+    order = np.argsort(coords, kind='stable')
+    coords = coords[order]
+    counts = np.cumsum(steps[order])
+
+    # Last step at each distinct coordinate; the interval to the next coordinate has its count.
+    last = np.flatnonzero(coords[1:] != coords[:-1])
+    counts = counts[last]
+    lower = coords[last]
+    upper = coords[last + 1]
+
+    rank = np.lexsort((-(lower + upper), -counts))
+    return counts[rank], lower[rank], upper[rank]
+
+
 def find_all_stacked_points(resp):
     """
     Finds all vertical intervals (with their overlap counts and intercepts)
@@ -166,8 +921,8 @@ def find_all_stacked_points(resp):
     a two-element list [x, y]. A y-value of None indicates a break between segments.
     
     For each contiguous segment, the vertical interval is defined as the minimum 
-    and maximum y-values. Then, a sweep-line algorithm is used to compute the overlap
-    count for every contiguous vertical interval.
+    and maximum y-values. The overlap counts come from find_stacked_levels; when the
+    order blocks themselves are at hand, call that directly with their tops and bottoms.
     
     The function returns a list of tuples:
          (overlap_count, (start, end), intercept)
@@ -182,71 +937,39 @@ def find_all_stacked_points(resp):
       list: Sorted list of tuples (overlap_count, interval, intercept). If no intervals
             are found, returns an empty list.
     """
-    intervals = []
+    tops = []
+    bottoms = []
     
     # Extract vertical intervals from each polygon's data segments.
     for band in resp:
         segment_points = []
-        for point in band.get('data', []):
-            # A point with None indicates a break between segments.
+        for point in band.get('data', []) + [[None, None]]:
+            # A point with None indicates a break between segments (one is appended for a trailing segment).
             if point[1] is None:
                 if segment_points:
                     ys = [pt[1] for pt in segment_points]
-                    lower, upper = min(ys), max(ys)
-                    intervals.append({'from': lower, 'to': upper})
+                    tops.append(max(ys))
+                    bottoms.append(min(ys))
                     segment_points = []
             else:
                 segment_points.append(point)
-        # Process any trailing segment if not terminated by a None.
-        if segment_points:
-            ys = [pt[1] for pt in segment_points]
-            lower, upper = min(ys), max(ys)
-            intervals.append({'from': lower, 'to': upper})
-    
-    if not intervals:
-        return []
-    
-    # Build events for the sweep-line algorithm.
-    # Each interval contributes a +1 event at its lower bound and a -1 event at its upper bound.
-    events = []
-    for interval in intervals:
-        lower = min(interval['from'], interval['to'])
-        upper = max(interval['from'], interval['to'])
-        events.append((lower, 1))
-        events.append((upper, -1))
     
-    # Sort events by coordinate; for ties, start events (+1) come before end events (-1)
-    events.sort(key=lambda x: (x[0], -x[1]))
-    
-    # Sweep-line: record every contiguous interval where the overlap count is constant.
-    result = []
-    current_count = 0
-    prev_coordinate = events[0][0]
-    
-    for coordinate, delta in events:
-        if coordinate != prev_coordinate:
-            interval_segment = (prev_coordinate, coordinate)
-            intercept = (prev_coordinate + coordinate) / 2
-            result.append((current_count, interval_segment, intercept))
-            prev_coordinate = coordinate
-        current_count += delta
-    
-    # Sort the results:
-    # First by overlap_count in descending order, then by intercept (also descending).
-    result.sort(key=lambda x: (x[0], x[2]), reverse=True)
-    
-    return result
+    counts, lower, upper = find_stacked_levels(tops, bottoms)
+    intercepts = (lower + upper) / 2
+    return [(count, (start, end), intercept) for count, start, end, intercept
+            in zip(counts.tolist(), lower.tolist(), upper.tolist(), intercepts.tolist())]
 
 
 def create_bear_plotbands(bear_list):
+    # bear_list may hold OrderBlock records or OB dicts.
     plotbands = []
-    for bear in bear_list:
+    for bear in map(_as_order_block, bear_list):
         plotband = {
             'color': '#f8cdcd',
             'borderColor': 'red',
             'borderWidth': 0.2,
-            'from': bear['bear_top'],
-            'to': bear['bear_btm'],
+            'from': bear.top,
+            'to': bear.bottom,
             'zIndex': 2,
             'label': {
                 # 'text': "OB"
@@ -256,14 +979,15 @@ def create_bear_plotbands(bear_list):
     return {'plotBands': plotbands}
 
 def create_bull_plotbands(bull_list):
+    # bull_list may hold OrderBlock records or OB dicts.
     plotbands = []
-    for bull in bull_list:
+    for bull in map(_as_order_block, bull_list):
         plotband = {
             'color': '#cdf8d0',
             'borderColor': 'green',
             'borderWidth': 0.2,
-            'from': bull['bull_top'],
-            'to': bull['bull_btm'],
+            'from': bull.top,
+            'to': bull.bottom,
             'zIndex': 2,
             'label': {
                 # 'text': "OB"
@@ -276,17 +1000,17 @@ def create_bear_series(bear_list, last_candle, bar_interval=3600000):
     # Compute the common right boundary from the last bear's timestamp plus margin.
     right_boundary = int(last_candle.timestamp() * 1000)
     series_data = []
-    for bear in bear_list:
-        # Convert the bear_left timestamp to milliseconds for the left boundary.
-        left = int(bear['bear_left'].timestamp() * 1000)
+    for bear in map(_as_order_block, bear_list):
+        # The left boundary is the OB's pivot time in milliseconds.
+        left = bear.left
         
         # Build the polygon points:
         # 1. Bottom left, 2. Bottom right, 3. Top right, 4. Top left, 5. A break marker
         polygon = [
-            [left, bear['bear_btm']],
-            [right_boundary, bear['bear_btm']],
-            [right_boundary, bear['bear_top']],
-            [left, bear['bear_top']],
+            [left, bear.bottom],
+            [right_boundary, bear.bottom],
+            [right_boundary, bear.top],
+            [left, bear.top],
             [right_boundary, None]
         ]
         series_data.extend(polygon)
@@ -309,17 +1033,17 @@ def create_bull_series(bull_list, last_candle, bar_interval=3600000):
     right_boundary = int(last_candle.timestamp() * 1000)
     
     series_data = []
-    for bull in bull_list:
-        # Convert the bull_left timestamp to milliseconds for the left boundary.
-        left = int(bull['bull_left'].timestamp() * 1000)
+    for bull in map(_as_order_block, bull_list):
+        # The left boundary is the OB's pivot time in milliseconds.
+        left = bull.left
         
         # Build the polygon points:
         # 1. Bottom left, 2. Bottom right, 3. Top right, 4. Top left, 5. A break marker
         polygon = [
-            [left, bull['bull_btm']],
-            [right_boundary, bull['bull_btm']],
-            [right_boundary, bull['bull_top']],
-            [left, bull['bull_top']],
+            [left, bull.bottom],
+            [right_boundary, bull.bottom],
+            [right_boundary, bull.top],
+            [left, bull.top],
             [right_boundary, None]
         ]
         series_data.extend(polygon)
@@ -335,4 +1059,79 @@ def create_bull_series(bull_list, last_candle, bar_interval=3600000):
         'tooltip': {
             'pointFormat': 'Polygon area'
         }
-    }
\ No newline at end of file
+    }
+
+
+class _ListOrderBlocks:
+    """
+    Plain-list store of active OBs scanned on every bar (the mitigation pass before
+    _ActiveOrderBlocks), kept for benchmark().
+    """
+
+    def __init__(self, side):
+        self.side = side
+        self._obs = []
+
+    def __len__(self):
+        return len(self._obs)
+
+    def add(self, ob):
+        self._obs.append(ob)
+
+    def mitigate(self, target):
+        if self.side == 'bull':
+            removed = [ob for ob in self._obs if target < ob.bottom]
+        else:
+            removed = [ob for ob in self._obs if target > ob.top]
+        if removed:
+            self._obs = [ob for ob in self._obs if ob not in removed]
+        return removed
+
+    def to_list(self):
+        return list(self._obs)
+
+
+def _random_walk_frame(n_bars, drift=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(drift, 1, n_bars))
+    return pd.DataFrame({
+        'time': pd.to_datetime(np.arange(n_bars) * 3_600_000, unit='ms'),
+        'open': close, 'high': close + rng.uniform(0, 1, n_bars), 'low': close - rng.uniform(0, 1, n_bars),
+        'close': close, 'volume': rng.uniform(1, 100, n_bars),
+    })
+
+
+def benchmark(sizes=(10_000, 30_000, 100_000), length=3, loop_max=10_000, seed=0):
+    """
+    Seconds for detect_order_blocks on a trending random walk of each size: the loop engine
+    (up to 'loop_max' bars), the numpy engine with the plain-list mitigation pass, and the
+    numpy engine as it is. Returns [(bars, engine, seconds, active OBs)].
+    """
+    results = []
+    for n in sizes:
+        df = _random_walk_frame(n, seed=seed)
+        arrays = _ohlcv_arrays(df)
+        windows = (_rolling_max(arrays['high'], length), _rolling_min(arrays['low'], length))
+        targets = windows[::-1]
+        pivots = _pivot_high_mask(arrays['volume'], length, length)
+        runs = [('numpy, list', lambda: _scan_order_blocks(arrays, length, *windows, *targets, pivots,
+                                                           store=_ListOrderBlocks)[4:]),
+                ('numpy', lambda: detect_order_blocks(df, length=length, engine='numpy', as_records=True)[1:])]
+        if n <= loop_max:
+            runs.insert(0, ('loop', lambda: detect_order_blocks(df, length=length, as_records=True)[1:]))
+        for engine, run in runs:
+            started = time.perf_counter()
+            bull, bear = run()
+            results.append((n, engine, time.perf_counter() - started, len(bull) + len(bear)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the order block engines.')
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 30_000, 100_000])
+    parser.add_argument('--length', type=int, default=3)
+    args = parser.parse_args()
+    if args.bench:
+        for n, engine, seconds, active in benchmark(args.sizes, args.length):
+            print(f'{n:>8} bars  {engine:>12}: {seconds:8.3f}s  ({active} active OBs)')
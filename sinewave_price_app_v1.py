@@ -1,11 +1,11 @@
 import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
-import json
 
 # Highcharts / tvDatafeed imports
 from tvDatafeed import TvDatafeed, Interval
-from highcharts_stock.chart import Chart
+from chartassets import browser_host, highcharts_scripts
+from chartrender import candlestick_data, render_stock_chart
 
 # Use full browser width
 st.set_page_config(layout="wide")
@@ -136,16 +136,8 @@ with col_plots:
         n_bars=n_bars
     )
 
-    # Build output list: [timestamp_millis, close]
-    output_list = []
-    for idx, row in data.iterrows():
-        ts_millis = int(idx.timestamp() * 1000)
-        close_val = row["close"]
-        ohlc = [ts_millis, close_val]
-        output_list.append(ohlc)
-
-    # Convert to JSON string
-    json_string = json.dumps(output_list)
+    # [timestamp_millis, close] points as JSON, reused across reruns while the data is unchanged
+    series_data = candlestick_data(data, columns=('close',))
 
     # Highcharts config
     as_dict = {
@@ -165,33 +157,12 @@ with col_plots:
             {
                 'type': 'spline',
                 'name': f'{symbol}',
-                'data': json_string
+                'data': series_data
             }
         ]
     }
 
-    # Construct Highcharts object
-    chart = Chart.from_options(as_dict)
-
-    # Use to_js_literal and embed manually
-    js_code = chart.to_js_literal()
-    js_code = js_code.replace("Highcharts.stockChart(null", "Highcharts.stockChart('container'")
-
-    html_template = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8" />
-        <!-- Load Highcharts/Highstock from CDN or your own hosting -->
-        <script src="https://code.highcharts.com/stock/highstock.js"></script>
-    </head>
-    <body>
-        <div id="container" style="width: 100%; height: 600px;"></div>
-        <script>
-        {js_code}
-        </script>
-    </body>
-    </html>
-    """
+    # Serialize the options straight into the chart page (Highcharts from the CDN or the local bundle)
+    html_template = render_stock_chart(as_dict, scripts=highcharts_scripts(browser_host()))
 
     st.components.v1.html(html_template, height=700, scrolling=True)
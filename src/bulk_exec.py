@@ -0,0 +1,223 @@
+"""
+Bulk execution of MT5 order removals and position closes.
+
+By default the requests run one after the other on the calling thread. With max_workers > 1
+they are queued on a dedicated pool of worker threads, so up to max_workers round trips to
+the terminal are in flight at once; only use that with a terminal known to accept concurrent
+calls (the MetaTrader5 module is not documented as thread-safe). Every ticket gets a TicketResult with its retcode,
+attempts and latency. Only clearly transient retcodes (requote, timeout, connection, ...) are
+retried, with exponential backoff; after a call without response the ticket is looked up first
+and only sent again if it is still open.
+"""
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Retcodes worth retrying, with their MQL5 values for terminals (or fakes) that lack the
+# constants.
+TRANSIENT_RETCODES = {
+    'TRADE_RETCODE_REQUOTE': 10004,
+    'TRADE_RETCODE_TIMEOUT': 10012,
+    'TRADE_RETCODE_PRICE_CHANGED': 10020,
+    'TRADE_RETCODE_PRICE_OFF': 10021,
+    'TRADE_RETCODE_TOO_MANY_REQUESTS': 10024,
+    'TRADE_RETCODE_LOCKED': 10028,
+    'TRADE_RETCODE_CONNECTION': 10031,
+}
+
+# Exceptions standing for a failed terminal call (IPC errors); they are recorded on the ticket's
+# result. Anything else, e.g. a TypeError or AttributeError from a bad request, propagates to
+# the caller.
+TERMINAL_ERRORS = (OSError,)
+
+
+@dataclass
+class TicketResult:
+    """
+    Outcome of one remove/close request.
+
+    kind: 'remove' (pending order) or 'close' (position).
+    ok: the terminal confirmed it.
+    retcode, comment: from the last order_send result (None/'' for Close or no response).
+    error: terminal last_error() after a call without response, the TERMINAL_ERRORS exception
+        raised by the call, or the failure reported by Close.
+    attempts: calls made, retries included.
+    latency: seconds spent in the terminal calls (backoff excluded).
+    result: raw result of the last call.
+    """
+    kind: str
+    symbol: str
+    ticket: int
+    ok: bool = False
+    retcode: int = None
+    comment: str = ''
+    error: object = None
+    attempts: int = 0
+    latency: float = 0.0
+    result: object = None
+
+
+@dataclass
+class BatchReport:
+    """
+    TicketResults of a batch in submission order, and its wall-clock duration in seconds.
+    """
+    results: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def stats(self):
+        """
+        Counts and latency percentiles (seconds) of the batch.
+        """
+        latencies = sorted(r.latency for r in self.results)
+        n = len(latencies)
+        return {
+            'requests': n,
+            'ok': len(self.ok),
+            'failed': n - len(self.ok),
+            'retried': sum(r.attempts > 1 for r in self.results),
+            'elapsed': self.elapsed,
+            'latency_sum': sum(latencies),
+            'latency_mean': statistics.fmean(latencies) if n else 0.0,
+            'latency_p50': latencies[(n - 1) // 2] if n else 0.0,
+            'latency_p95': latencies[min(n - 1, int(0.95 * n))] if n else 0.0,
+            'latency_max': latencies[-1] if n else 0.0,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"{s['ok']}/{s['requests']} ok, {s['retried']} retried, {s['elapsed'] * 1000:.0f} ms "
+                f"(terminal {s['latency_sum'] * 1000:.0f} ms, p50 {s['latency_p50'] * 1000:.1f} ms, "
+                f"p95 {s['latency_p95'] * 1000:.1f} ms)")
+
+
+class BulkExecutor:
+    """
+    Runs remove/close requests against 'terminal', in sequence or on a pool of worker threads.
+    """
+
+    def __init__(self, terminal, send=None, close=None, max_workers=1, retries=2, backoff=0.05):
+        """
+        Parameters:
+            terminal: the MetaTrader5 module (or a fake one) for its constants, last_error and
+                the orders_get/positions_get lookups after a call without response.
+            send: order_send to call (terminal.order_send by default).
+            close: close(symbol, ticket) to call (terminal.Close by default).
+            max_workers: requests in flight at once (1: in sequence on the calling thread).
+            retries: extra attempts after a transient failure.
+            backoff: seconds before the first retry, doubled for each next one.
+        """
+        self.terminal = terminal
+        self._send = send or terminal.order_send
+        self._close = close or (lambda symbol, ticket: terminal.Close(symbol=symbol, ticket=ticket))
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.transient = {getattr(terminal, name, value) for name, value in TRANSIENT_RETCODES.items()}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='mt5-bulk')
+            return self._pool
+
+    def _still_open(self, kind, ticket):
+        """
+        Whether the pending order ('remove') or position ('close') 'ticket' is still open; None
+        if the terminal could not tell.
+        """
+        getter = self.terminal.orders_get if kind == 'remove' else self.terminal.positions_get
+        found = getter(ticket=ticket)
+        return None if found is None else len(found) > 0
+
+    def _call(self, kind, symbol, ticket):
+        """
+        One attempt: (ok, retry, retcode, comment, error, result).
+        """
+        if kind == 'remove':
+            result = self._send({
+                "action": self.terminal.TRADE_ACTION_REMOVE,
+                "symbol": symbol,
+                "order": ticket,
+            })
+            if result is not None:
+                retcode = result.retcode
+                return (retcode == self.terminal.TRADE_RETCODE_DONE, retcode in self.transient, retcode,
+                        getattr(result, 'comment', ''), None, result)
+        else:
+            result = self._close(symbol, ticket)
+            if result is True:
+                return True, False, None, '', None, result
+            if result is not None:
+                # Close failed (False, or a result with a retcode): only a transient retcode is retried.
+                retcode = getattr(result, 'retcode', None)
+                return (False, retcode in self.transient, retcode, getattr(result, 'comment', ''),
+                        getattr(result, 'comment', result), result)
+        # No response: the request may have gone through anyway, so look the ticket up before
+        # sending it again. Gone means done; still open means retry; unknown means give up.
+        error = self.terminal.last_error()
+        still_open = self._still_open(kind, ticket)
+        if still_open is False:
+            return True, False, None, 'no response, ticket no longer open', error, result
+        return False, still_open is True, None, '', error, result
+
+    def _execute(self, kind, symbol, ticket):
+        outcome = TicketResult(kind, symbol, ticket)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            started = time.perf_counter()
+            try:
+                ok, retry, outcome.retcode, outcome.comment, outcome.error, outcome.result = self._call(
+                    kind, symbol, ticket)
+            except TERMINAL_ERRORS as e:
+                ok, retry, outcome.error = False, False, e
+            outcome.latency += time.perf_counter() - started
+            outcome.attempts = attempt + 1
+            outcome.ok = ok
+            if ok or not retry:
+                break
+        return outcome
+
+    def run(self, jobs):
+        """
+        Executes (kind, symbol, ticket) jobs and returns their BatchReport.
+        """
+        started = time.perf_counter()
+        jobs = list(jobs)
+        if self.max_workers <= 1 or len(jobs) <= 1:
+            results = [self._execute(*job) for job in jobs]
+        else:
+            pool = self._executor()
+            results = [future.result() for future in [pool.submit(self._execute, *job) for job in jobs]]
+        return BatchReport(results, time.perf_counter() - started)
+
+    def remove_orders(self, symbol, tickets):
+        """
+        Removes the pending orders 'tickets' of 'symbol'.
+        """
+        return self.run(('remove', symbol, ticket) for ticket in tickets)
+
+    def close_positions(self, symbol, tickets):
+        """
+        Closes the positions 'tickets' of 'symbol'.
+        """
+        return self.run(('close', symbol, ticket) for ticket in tickets)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
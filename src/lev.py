@@ -1,11 +1,14 @@
-import pickle
-
-with open("futures_bracket.pkl", "rb") as f:
-    futures_bracket = pickle.load(f)
-    
-with open("token_info.pkl", "rb") as f:
-    token_info = pickle.load(f)
-    
+import numpy as np
+
+from src.metastore import FuturesBrackets, MetadataStore, TokenInfo
+
+# Lazy views over the SQLite metadata store: nothing is read until a symbol is looked up, and
+# then only that symbol's row. They drop their cache when update_bracket.py writes new data.
+metadata_store = MetadataStore()
+futures_bracket = FuturesBrackets(metadata_store)
+token_info = TokenInfo(metadata_store)
+
+
 def binance_leverage_custom(
     liq_price: float,
     entry_price: float,
@@ -80,3 +83,106 @@ def binance_leverage_custom(
             return L_cand
 
     raise ValueError("Your position size exceeds the max notional of all tiers.")
+
+
+class BracketTable:
+    """
+    The leverage brackets of one symbol compiled into NumPy arrays (one entry per tier, in
+    the order binance_leverage_custom walks them).
+    """
+
+    __slots__ = ('symbol', 'notional_cap', 'maint_margin_ratio', 'cum', 'initial_leverage')
+
+    def __init__(self, symbol, brackets):
+        self.symbol = symbol
+        self.notional_cap = np.array([tier["notionalCap"] for tier in brackets], dtype=np.float64)
+        self.maint_margin_ratio = np.array([tier["maintMarginRatio"] for tier in brackets], dtype=np.float64)
+        self.cum = np.array([tier["cum"] for tier in brackets], dtype=np.float64)
+        self.initial_leverage = np.array([tier["initialLeverage"] for tier in brackets], dtype=np.float64)
+
+    @classmethod
+    def from_bracket_data(cls, symbol, bracket_data):
+        symbol_entries = bracket_data.get(symbol)
+        if not symbol_entries:
+            raise ValueError(f"No bracket data found for symbol '{symbol}'")
+        brackets = symbol_entries[0].get("brackets", [])
+        if not brackets:
+            raise ValueError(f"No 'brackets' key for symbol '{symbol}'")
+        return cls(symbol, brackets)
+
+
+# id(bracket_data) -> (bracket_data, version, {symbol: BracketTable}); holding bracket_data keeps its id valid.
+_compiled = {}
+
+
+def bracket_table(symbol, bracket_data=None):
+    """
+    Compiled BracketTable of 'symbol', built once per bracket dict (futures_bracket by default)
+    and again after the metadata store is rewritten.
+    """
+    if bracket_data is None:
+        bracket_data = futures_bracket
+    # Store-backed mappings change version when the store is rewritten; plain dicts have none.
+    version = getattr(bracket_data, 'version', None)
+    entry = _compiled.get(id(bracket_data))
+    if entry is None or entry[0] is not bracket_data or entry[1] != version:
+        entry = _compiled[id(bracket_data)] = (bracket_data, version, {})
+    tables = entry[2]
+    table = tables.get(symbol)
+    if table is None:
+        table = tables[symbol] = BracketTable.from_bracket_data(symbol, bracket_data)
+    return table
+
+
+def leverage_for(entry_prices, liq_prices, side="BUY", wallet_balance=1000, symbol="ERAUSDT", bracket_data=None):
+    """
+    Vectorized binance_leverage_custom: the leverage (positive for long, negative for short)
+    of every (entry, liquidation) price pair at once.
+
+    The tiers are walked in order as in the scalar loop, but each step solves the candidate
+    leverage of every pair not yet settled in one array operation, so the cost grows with the
+    number of tiers actually reached rather than with the number of pairs. Results are
+    identical to binance_leverage_custom; pairs for which it raises (liquidation price on the
+    wrong side, vanishing denominator, notional beyond every tier) are NaN instead.
+
+    :param entry_prices: Entry prices (scalar or array-like).
+    :param liq_prices: Target liquidation prices, same shape.
+    :param side: "BUY"/"LONG"/"LIMIT_LONG" or "SELL"/"SHORT"/"LIMIT_SHORT", for all pairs or
+                 as an array-like per pair.
+    :param wallet_balance: Margin balance in USDC.
+    :param symbol: e.g. "ERAUSDT"
+    :param bracket_data: dict loaded from your futures_bracket.pkl (futures_bracket by default)
+    """
+    table = bracket_table(symbol, bracket_data)
+    entry = np.asarray(entry_prices, dtype=np.float64)
+    liq = np.asarray(liq_prices, dtype=np.float64)
+    sides = np.char.upper(np.asarray(side, dtype=str))
+    is_long = np.isin(sides, ("BUY", "LONG", "LIMIT_LONG"))
+    is_short = np.isin(sides, ("SELL", "SHORT", "LIMIT_SHORT"))
+    if not (is_long | is_short).all():
+        raise ValueError("side must be one of BUY, SELL, LONG, SHORT, LIMIT_LONG, LIMIT_SHORT")
+    entry, liq, is_long = np.broadcast_arrays(entry, liq, is_long)
+    shape = entry.shape
+    entry, liq, is_long = entry.ravel(), liq.ravel(), is_long.ravel()
+    W = wallet_balance
+
+    # Same tier walk and arithmetic as the scalar loop, run over every pair still unresolved
+    # (most pairs are settled by the first tier or two).
+    result = np.full(entry.shape, np.nan)
+    todo = np.flatnonzero(np.where(is_long, liq < entry, liq > entry))
+    for max_notional, tier_max_leverage, R, A in zip(
+            table.notional_cap, table.initial_leverage, table.maint_margin_ratio, table.cum):
+        if not len(todo):
+            break
+        E, P, long_ = entry[todo], liq[todo], is_long[todo]
+        denom = np.where(long_, E - P * (1 - R), P * (1 + R) - E)
+        bad = np.abs(denom) < 1e-14
+        with np.errstate(divide='ignore', invalid='ignore'):
+            L = (E * (W + A)) / (W * denom)
+        L = np.where(long_, L, -np.abs(L))
+        fits = (W * np.abs(L) <= max_notional) & ~bad
+        L = np.where(np.abs(L) > tier_max_leverage, np.where(long_, tier_max_leverage, -tier_max_leverage), L)
+        result[todo[fits]] = L[fits]
+        # Pairs with a vanishing denominator stop here (the scalar function raises).
+        todo = todo[~(fits | bad)]
+    return result.reshape(shape)
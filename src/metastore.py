@@ -0,0 +1,244 @@
+"""
+Per-symbol exchange metadata (price precision, contract status and leverage brackets) in an
+indexed SQLite file, read one symbol at a time on first access.
+
+update_bracket.py rewrites the store in one transaction after each fetch; open readers notice
+the commit through PRAGMA data_version and drop what they have cached. A missing store, or one
+older than the pickles next to it, is rebuilt from futures_bracket.pkl and token_info.pkl on
+first access, so the pickles remain the interchange format.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import closing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORE_PATH = os.environ.get('SYMBOL_META_DB', os.path.join(ROOT, 'symbol_meta.sqlite'))
+BRACKETS_PATH = os.path.join(ROOT, 'futures_bracket.pkl')
+TOKEN_INFO_PATH = os.path.join(ROOT, 'token_info.pkl')
+
+# The fields kept from exchangeInfo and from each leverage bracket tier.
+TOKEN_FIELDS = ('pricePrecision', 'contractType', 'status', 'quoteAsset')
+TIER_FIELDS = ('notionalCap', 'initialLeverage', 'maintMarginRatio', 'cum')
+# Seconds between two checks for new data; lookups in between are served from the cache.
+CHECK_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    symbol TEXT PRIMARY KEY,
+    price_precision INTEGER,
+    contract_type TEXT,
+    status TEXT,
+    quote_asset TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS brackets (
+    symbol TEXT PRIMARY KEY,
+    tiers TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+def write_store(brackets, token_info, path=STORE_PATH):
+    """
+    Replaces the content of the store at 'path' in one transaction (readers see either the
+    old or the new data, never a mix).
+
+    Parameters:
+        brackets: futures_leverage_bracket responses by symbol (as in futures_bracket.pkl).
+        token_info: exchangeInfo symbol entries by symbol (as in token_info.pkl).
+    """
+    tokens = [(symbol, info.get('pricePrecision'), info.get('contractType'), info.get('status'),
+               info.get('quoteAsset'))
+              for symbol, info in token_info.items()]
+    tiers = []
+    for symbol, entries in brackets.items():
+        # The first entry holds the brackets, as binance_leverage_custom assumes.
+        found = entries[0].get('brackets', []) if entries else []
+        tiers.append((symbol, json.dumps([{k: tier[k] for k in TIER_FIELDS} for tier in found])))
+
+    with closing(sqlite3.connect(path, isolation_level=None)) as conn:
+        conn.executescript(_SCHEMA)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM tokens')
+            conn.execute('DELETE FROM brackets')
+            conn.executemany('INSERT INTO tokens VALUES (?, ?, ?, ?, ?)', tokens)
+            conn.executemany('INSERT INTO brackets VALUES (?, ?)', tiers)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('written_ns', ?)", (str(time.time_ns()),))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class MetadataStore:
+    """
+    Read side of the store. Nothing is opened until the first lookup; rows are then fetched by
+    primary key one symbol at a time and cached until another connection commits new data
+    (checked at most every check_interval seconds).
+    Safe to share between threads (Streamlit sessions).
+    """
+
+    def __init__(self, path=STORE_PATH, brackets_path=BRACKETS_PATH, token_info_path=TOKEN_INFO_PATH,
+                 check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.sources = (brackets_path, token_info_path)
+        self.version = 0
+        self._conn = None
+        self._data_version = None
+        self._checked = 0.0
+        self._tokens = {}
+        self._brackets = {}
+        self._lock = threading.RLock()
+
+    def _source_mtime(self):
+        return max((os.stat(p).st_mtime_ns for p in self.sources if os.path.exists(p)), default=0)
+
+    def _stale(self):
+        """
+        True when the store is missing or was written before the pickles were last modified.
+        """
+        if not os.path.exists(self.path):
+            return True
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'written_ns'").fetchone()
+        except sqlite3.DatabaseError:
+            return True
+        return row is None or int(row[0]) < self._source_mtime()
+
+    def rebuild(self):
+        """
+        Rewrites the store from the pickles.
+        """
+        brackets_path, token_info_path = self.sources
+        with open(brackets_path, 'rb') as f:
+            brackets = pickle.load(f)
+        with open(token_info_path, 'rb') as f:
+            token_info = pickle.load(f)
+        write_store(brackets, token_info, self.path)
+
+    def _check(self):
+        """
+        Open connection, with the caches dropped if the data changed since the last lookup.
+        """
+        if self._conn is None:
+            if self._stale():
+                self.rebuild()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._conn
+        self._checked = now
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            if self._data_version is not None:
+                self._tokens.clear()
+                self._brackets.clear()
+                self.version += 1
+            self._data_version = data_version
+        return self._conn
+
+    def refresh(self, force=False):
+        """
+        Current data version, after dropping the caches if the store was rewritten ('force'
+        checks now rather than at most every check_interval seconds).
+        """
+        with self._lock:
+            if force:
+                self._checked = 0.0
+            self._check()
+            return self.version
+
+    def token(self, symbol):
+        """
+        {field: value} of TOKEN_FIELDS for 'symbol'; KeyError if it is not in the store.
+        """
+        with self._lock:
+            conn = self._check()
+            info = self._tokens.get(symbol)
+            if info is None:
+                row = conn.execute('SELECT price_precision, contract_type, status, quote_asset '
+                                   'FROM tokens WHERE symbol = ?', (symbol,)).fetchone()
+                if row is None:
+                    raise KeyError(symbol)
+                info = self._tokens[symbol] = dict(zip(TOKEN_FIELDS, row))
+            return info
+
+    def brackets(self, symbol):
+        """
+        Leverage bracket tiers of 'symbol' (dicts of TIER_FIELDS, by increasing notionalCap);
+        KeyError if it is not in the store.
+        """
+        with self._lock:
+            conn = self._check()
+            tiers = self._brackets.get(symbol)
+            if tiers is None:
+                row = conn.execute('SELECT tiers FROM brackets WHERE symbol = ?', (symbol,)).fetchone()
+                if row is None:
+                    raise KeyError(symbol)
+                tiers = self._brackets[symbol] = json.loads(row[0])
+            return tiers
+
+    def symbols(self, table='tokens'):
+        """
+        Symbols of the 'tokens' or 'brackets' table, sorted.
+        """
+        if table not in ('tokens', 'brackets'):
+            raise ValueError(f"Unknown table: {table!r}")
+        with self._lock:
+            return [symbol for (symbol,) in self._check().execute(f'SELECT symbol FROM {table} ORDER BY symbol')]
+
+
+class _StoreMapping(Mapping):
+    """
+    Read-only {symbol: ...} view over a MetadataStore; 'version' changes when the store is
+    rewritten (see bracket_table).
+    """
+
+    _table = None
+
+    def __init__(self, store):
+        self._store = store
+
+    @property
+    def version(self):
+        return self._store.refresh()
+
+    def __iter__(self):
+        return iter(self._store.symbols(self._table))
+
+    def __len__(self):
+        return len(self._store.symbols(self._table))
+
+
+class TokenInfo(_StoreMapping):
+    """
+    token_info replacement: {symbol: {field: value}} restricted to TOKEN_FIELDS.
+    """
+
+    _table = 'tokens'
+
+    def __getitem__(self, symbol):
+        return self._store.token(symbol)
+
+
+class FuturesBrackets(_StoreMapping):
+    """
+    futures_bracket replacement in the futures_leverage_bracket layout,
+    {symbol: [{'symbol': symbol, 'brackets': tiers}]}, tiers restricted to TIER_FIELDS.
+    """
+
+    _table = 'brackets'
+
+    def __getitem__(self, symbol):
+        return [{'symbol': symbol, 'brackets': self._store.brackets(symbol)}]
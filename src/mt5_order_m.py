@@ -1,93 +1,130 @@
-import os
-import json
 import MetaTrader5 as mt5
 from loguru import logger
 from datetime import datetime
 from datetime import timedelta
 
-from collections import deque
 import hashlib
+from contextlib import contextmanager
+
+from src.bulk_exec import BulkExecutor
+from src.order_history import OrderHistoryIndex, price_key
+from src.order_metrics import metrics_from_env
+from src.order_wal import OrderKeyLog
+from src.terminal_state import TerminalState
 
 # Configuration
-CACHE_FILE = 'order_cache.json'  # File to persist the cache
-_CACHE_MAX = 1000               # Maximum number of entries to keep in memory
+CACHE_FILE = 'order_cache.wal'          # Append-only log persisting the cache
+LEGACY_CACHE_FILE = 'order_cache.json'  # Old JSON cache, imported into a new log
+_CACHE_MAX = 1000                       # Maximum number of entries to keep in memory
+CACHE_SHARED = True                     # Several processes may share the log
+CACHE_FSYNC = 'interval'                # 'always', 'interval' (background flusher) or 'never'
+
+# Timing spans of the public functions (MT5_METRICS=off disables them, see src/order_metrics.py)
+METRICS = metrics_from_env()
+
+# Load cache when module is imported
+_ORDER_LOG = OrderKeyLog(CACHE_FILE, capacity=_CACHE_MAX, shared=CACHE_SHARED, fsync=CACHE_FSYNC,
+                         legacy_json=LEGACY_CACHE_FILE)
 
-# In-memory structures
-_ORDER_KEY_CACHE = deque()
-_SENT_KEYS = set()
+# In-memory structures (updated in place by _ORDER_LOG)
+_ORDER_KEY_CACHE = _ORDER_LOG.keys
+_SENT_KEYS = _ORDER_LOG.key_set
 
+# Trading history of the last 30 days, synced incrementally by is_duplicate_order
+_HISTORY_INDEX = OrderHistoryIndex(mt5, window=timedelta(days=30))
 
-def _load_cache():
+# Positions and pending orders of all symbols, fetched once per decision cycle and dropped
+# after every order_send/close_position of this module. Outside a cycle each guard reads live
+# state with one positions_get/orders_get call for its symbol, as before; a positive
+# TERMINAL_STATE_MAX_AGE (seconds) opts in to reusing snapshots there too.
+TERMINAL_STATE_MAX_AGE = 0.0
+_TERMINAL_STATE = TerminalState(mt5, max_age=TERMINAL_STATE_MAX_AGE)
+
+
+@contextmanager
+def decision_cycle():
     """
-    Load existing cache from disk into memory.
+    Context manager sharing one positions/orders snapshot between all the
+    guard calls made inside it, e.g. for a burst of signals:
+
+        with decision_cycle():
+            if false_if_double_order(...) and is_order_unique(...):
+                ...
+
+    The whole cycle is timed as the 'decision_cycle' span.
     """
-    global _ORDER_KEY_CACHE, _SENT_KEYS
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # Keep only the most recent _CACHE_MAX entries
-            trimmed = data[-_CACHE_MAX:]
-            _ORDER_KEY_CACHE = deque(trimmed)
-            _SENT_KEYS = set(trimmed)
-        except (json.JSONDecodeError, IOError):
-            # If the file is corrupted or unreadable, start fresh
-            _ORDER_KEY_CACHE = deque()
-            _SENT_KEYS = set()
-
-def _save_cache():
+    with METRICS.span('decision_cycle'), _TERMINAL_STATE.cycle() as state:
+        yield state
+
+
+@METRICS.timed()
+def order_send(request):
     """
-    Persist the current cache to disk as a JSON list.
+    mt5.order_send, invalidating the positions/orders snapshot.
     """
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(list(_ORDER_KEY_CACHE), f)
-    except IOError:
-        # Handle write errors if necessary
-        pass
+        return mt5.order_send(request)
+    finally:
+        _TERMINAL_STATE.invalidate()
+
+
+@METRICS.timed()
+def close_position(symbol: str, ticket: int):
+    """
+    mt5.Close, invalidating the positions/orders snapshot.
+    """
+    try:
+        return mt5.Close(symbol=symbol, ticket=ticket)
+    finally:
+        _TERMINAL_STATE.invalidate()
 
-# Load cache when module is imported
-_load_cache()
 
+# Removals and closes of several tickets, transient retcodes retried twice. They run one after
+# the other on the calling thread: the MetaTrader5 module is not documented as thread-safe, so
+# sending several requests at once (BULK_MAX_WORKERS > 1) is opt-in, for terminals known to
+# accept concurrent calls.
+BULK_MAX_WORKERS = 1
+_BULK = BulkExecutor(mt5, send=order_send, close=close_position, max_workers=BULK_MAX_WORKERS, retries=2)
 
+
+@METRICS.timed()
 def remove_orders_by_comment(symbol: str, comment: str):
     """
     Remove all pending orders for `symbol` whose .comment matches `comment`.
     Assumes MT5 is already initialized elsewhere and will remain open.
+    Returns the BatchReport of the removals (None if nothing was sent).
     """
-    # Fetch all pending orders for the symbol
-    orders = mt5.orders_get(symbol=symbol)
+    # Pending orders of the symbol with a matching comment
+    orders = _TERMINAL_STATE.orders(symbol, comment)
     if orders is None:
         logger.error(f"[Error] orders_get failed for {symbol}: {mt5.last_error()}")
         return
 
-    # Filter tickets by matching comment
-    tickets = [o.ticket for o in orders if o.comment == comment]
+    tickets = [o.ticket for o in orders]
     if not tickets:
         logger.info(f"No orders with comment '{comment}' found for {symbol}.")
         return
 
     logger.info(f"Removing tickets: {tickets}")
-    # Send remove request for each ticket
-    for ticket in tickets:
-        req = {
-            "action": mt5.TRADE_ACTION_REMOVE,
-            "symbol": symbol,
-            "order": ticket,
-        }
-        res = mt5.order_send(req)
-        if res is None:
-            logger.error(f"[Ticket {ticket}] no response, error: {mt5.last_error()}")
-        elif res.retcode != mt5.TRADE_RETCODE_DONE:
-            logger.error(f"[Ticket {ticket}] failed (retcode={res.retcode}): {res.comment}")
+    # Send the remove requests in bulk
+    report = _BULK.remove_orders(symbol, tickets)
+    for r in report.results:
+        if r.ok:
+            logger.success(f"[Ticket {r.ticket}] removed successfully")
+        elif r.result is None:
+            logger.error(f"[Ticket {r.ticket}] no response, error: {r.error}")
         else:
-            logger.success(f"[Ticket {ticket}] removed successfully")
+            logger.error(f"[Ticket {r.ticket}] failed (retcode={r.retcode}): {r.comment}")
+    logger.info(f"Removed {symbol} '{comment}': {report.summary()}")
+    return report
 
 
+@METRICS.timed()
 def close_positions_by_comment(symbol: str, comment: str, action: str):
     """
     Close all positions for `symbol` whose .comment == comment,
     filtered by action: either 'CLOSE_LONG' or 'CLOSE_SHORT'.
+    Returns the BatchReport of the closes (None if nothing was sent).
     """
     if action not in ("CLOSE_LONG", "CLOSE_SHORT"):
         raise ValueError("action must be 'CLOSE_LONG' or 'CLOSE_SHORT'")
@@ -95,28 +132,27 @@ def close_positions_by_comment(symbol: str, comment: str, action: str):
     # map action → required pos.type (0 = long, 1 = short)
     target_type = 0 if action == "CLOSE_LONG" else 1
 
-    # fetch positions for symbol
-    positions = mt5.positions_get(symbol=symbol) or []
-    # filter by side and comment
-    to_close = [pos for pos in positions 
-                if pos.type == target_type and pos.comment == comment]
+    # positions of the symbol on that side with a matching comment
+    to_close = _TERMINAL_STATE.positions(symbol, comment, target_type) or ()
 
     if not to_close:
         logger.info(f"No {action.lower()} positions with comment='{comment}' for {symbol}")
         return
 
-    for pos in to_close:
-        # use mt5.Close (or your wrapper) to close by ticket
-        success = mt5.Close(symbol=symbol, ticket=pos.ticket)
-        if success is not True:
+    # close by ticket in bulk (close_position wraps mt5.Close)
+    report = _BULK.close_positions(symbol, [pos.ticket for pos in to_close])
+    for r in report.results:
+        if not r.ok:
             # result may be an object with .comment
-            err = getattr(success, 'comment', success)
-            logger.error(f"Failed to close position {pos.ticket}: {err}")
+            logger.error(f"Failed to close position {r.ticket}: {r.error}")
         else:
-            logger.success(f"Position {pos.ticket} closed successfully")
+            logger.success(f"Position {r.ticket} closed successfully")
+    logger.info(f"Closed {symbol} '{comment}': {report.summary()}")
+    return report
 
 
 
+@METRICS.timed()
 def false_if_double_order(symbol: str, comment: str, action: str):
     # Determine the target position type based on action
     if action in ("LONG", "LIMIT_LONG"):
@@ -128,13 +164,11 @@ def false_if_double_order(symbol: str, comment: str, action: str):
     else:
         raise ValueError("Action must be 'LONG' or 'SHORT'")
 
-    # Fetch existing positions for the symbol
-    positions = mt5.positions_get(symbol=symbol) or []
-    orders = mt5.orders_get(symbol=symbol) or []
-
-    # Check positions and orders with matching comment
-    matching_positions = [pos for pos in positions if pos.comment == comment]
-    matching_orders = [order for order in orders if order.comment == comment]
+    # Existing positions and orders of the symbol with matching comment, from one snapshot
+    # (the caller's inside a decision cycle); the span includes the terminal fetch
+    with METRICS.span('false_if_double_order.lookup'), _TERMINAL_STATE.cycle():
+        matching_positions = _TERMINAL_STATE.positions(symbol, comment) or ()
+        matching_orders = _TERMINAL_STATE.orders(symbol, comment) or ()
 
     # Combine positions and orders
     existing = matching_positions + matching_orders
@@ -152,19 +186,33 @@ def false_if_double_order(symbol: str, comment: str, action: str):
     return True
 
 
+@METRICS.timed()
 def is_duplicate_order(price_open, sl, tp, comment, from_date=None, to_date=None):
+    """
+    True if the trading history holds an order with `comment` and the same
+    (price_open, sl), both rounded to PRICE_DIGITS decimals. The last 30 days
+    are answered from the incrementally synced history index; an explicit
+    from_date/to_date range is fetched from the terminal.
+    """
+    if from_date is None and to_date is None:
+        with METRICS.span('is_duplicate_order.sync'):
+            _HISTORY_INDEX.sync()
+        return _HISTORY_INDEX.contains(comment, price_open, sl, sync=False)
+
     if from_date is None:
         from_date = datetime.now() - timedelta(days=30)
     if to_date is None:
         to_date = datetime.now()
-    sumnumber = sum([price_open, sl])
     history_orders = mt5.history_orders_get(from_date, to_date)
-    orders_filtered = [order for order in history_orders if order.comment == comment]
-    unique_n = [sum([order.price_open, order.sl]) for order in orders_filtered]
-
-    return sumnumber in unique_n
+    if history_orders is None:
+        logger.error(f"[Error] history_orders_get failed: {mt5.last_error()}")
+        return False
+    key = price_key(price_open, sl)
+    return any(order.comment == comment and price_key(order.price_open, order.sl) == key
+               for order in history_orders)
 
 
+@METRICS.timed()
 def is_order_unique(symbol: str,
                     action: str,
                     price: float,
@@ -173,27 +221,12 @@ def is_order_unique(symbol: str,
                     comment: str) -> bool:
     """
     Returns True if this (symbol, action, price, sl, tp, comment) tuple
-    hasn't been sent in the last _CACHE_MAX calls. Records it if new,
-    and persists the updated cache to disk.
+    hasn't been sent in the last _CACHE_MAX calls (by any process sharing
+    CACHE_FILE). Records it if new by appending it to the log.
     """
     # Construct a unique key string and hash it
     key_src = f"{symbol}|{price}|{sl}|{comment}"
     key = hashlib.sha256(key_src.encode('utf-8')).hexdigest()
 
-    # Check for duplicates
-    if key in _SENT_KEYS:
-        return False
-
-    # Prune oldest if at capacity
-    if len(_ORDER_KEY_CACHE) >= _CACHE_MAX:
-        oldest = _ORDER_KEY_CACHE.popleft()
-        _SENT_KEYS.remove(oldest)
-
-    # Record the new key
-    _ORDER_KEY_CACHE.append(key)
-    _SENT_KEYS.add(key)
-
-    # Persist cache to disk
-    _save_cache()
-
-    return True
\ No newline at end of file
+    # Check for duplicates and record the key (pruning the oldest at capacity) atomically
+    return _ORDER_LOG.add(key)
\ No newline at end of file
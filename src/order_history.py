@@ -0,0 +1,115 @@
+"""
+Local index of the MT5 order history for duplicate checks.
+
+The terminal is only asked for the orders since the last sync (minus an overlap that absorbs
+the offset between local and server time); orders are deduplicated by ticket and indexed by
+comment and by their (price_open, sl) pair rounded to a fixed number of decimals, so a
+duplicate check is a dict lookup instead of a scan of 30 days of history. The whole window is
+refetched every resync_interval to pick up orders that reached the history late (pending
+orders filled or cancelled long after they were placed).
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+PRICE_DIGITS = 8
+
+
+def price_key(price_open, sl, digits=PRICE_DIGITS):
+    """
+    (price_open, sl) rounded to 'digits' decimals, the key orders are matched on.
+    """
+    return round(float(price_open), digits), round(float(sl), digits)
+
+
+class OrderHistoryIndex:
+    """
+    Orders of the last 'window' of trading history by comment and price key.
+    """
+
+    def __init__(self, terminal, window=timedelta(days=30), overlap=timedelta(days=1),
+                 resync_interval=timedelta(hours=1), digits=PRICE_DIGITS):
+        """
+        Parameters:
+            terminal: the MetaTrader5 module (or anything with history_orders_get).
+            window: how far back orders count.
+            overlap: each incremental sync starts this long before the previous one ended
+                and asks for orders up to this long after now.
+            resync_interval: how often the whole window is fetched again.
+            digits: decimals of the price key.
+        """
+        self.terminal = terminal
+        self.window = window
+        self.overlap = overlap
+        self.resync_interval = resync_interval
+        self.digits = digits
+        self._by_comment = {}  # comment -> {price key: number of orders}
+        self._tickets = {}     # ticket -> (comment, price key)
+        self._by_time = []     # heap of (time_setup, ticket), for expiry
+        self._synced_to = None
+        self._resynced_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def _clear(self):
+        self._by_comment.clear()
+        self._tickets.clear()
+        self._by_time.clear()
+
+    def _add(self, order):
+        if order.ticket in self._tickets:
+            return
+        key = price_key(order.price_open, order.sl, self.digits)
+        counts = self._by_comment.setdefault(order.comment, {})
+        counts[key] = counts.get(key, 0) + 1
+        self._tickets[order.ticket] = (order.comment, key)
+        heapq.heappush(self._by_time, (order.time_setup, order.ticket))
+
+    def _expire(self, cutoff):
+        """
+        Drops the orders set up before 'cutoff' (epoch seconds).
+        """
+        while self._by_time and self._by_time[0][0] < cutoff:
+            _, ticket = heapq.heappop(self._by_time)
+            comment, key = self._tickets.pop(ticket)
+            counts = self._by_comment[comment]
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+                if not counts:
+                    del self._by_comment[comment]
+
+    def sync(self, now=None):
+        """
+        Fetches the orders added to the history since the last sync (the whole window on the
+        first call and every resync_interval). Returns False if the terminal returned no data,
+        in which case the index is left as it was.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            full = self._synced_to is None or now - self._resynced_at >= self.resync_interval
+            date_from = now - self.window if full else self._synced_to - self.overlap
+            orders = self.terminal.history_orders_get(date_from, now + self.overlap)
+            if orders is None:
+                return False
+            if full:
+                self._clear()
+                self._resynced_at = now
+            for order in orders:
+                self._add(order)
+            self._synced_to = now
+            self._expire((now - self.window).timestamp())
+            return True
+
+    def contains(self, comment, price_open, sl, sync=True):
+        """
+        True if an order with 'comment' and the same rounded (price_open, sl) is indexed,
+        after an incremental sync unless sync=False.
+        """
+        if sync:
+            self.sync()
+        key = price_key(price_open, sl, self.digits)
+        with self._lock:
+            return key in self._by_comment.get(comment, ())
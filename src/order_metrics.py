@@ -0,0 +1,273 @@
+"""
+Latency spans for the MT5 order path.
+
+Every span keeps its count, total, error count and maximum, cumulative counts over the fixed
+BUCKETS, and a window of the most recent durations from which p50/p95/p99 are computed. The
+buckets are exported as a Prometheus histogram on a local HTTP endpoint (so quantiles can be
+aggregated across workers with histogram_quantile()); the JSONL file appended at a fixed
+interval carries the recent-window quantiles.
+
+Configured from the environment by metrics_from_env(); the exporters start with the first
+observed span, never at import, and a failure to start one is logged rather than raised:
+
+    MT5_METRICS           off | on (collect only, the default) | prometheus | jsonl | prometheus,jsonl
+    MT5_METRICS_PORT      port of the /metrics endpoint (9108, bound to 127.0.0.1; when it is
+                          taken, e.g. by another signal worker, a free port is used instead)
+    MT5_METRICS_FILE      JSONL file (mt5_metrics.jsonl)
+    MT5_METRICS_INTERVAL  seconds between two JSONL snapshots (10)
+"""
+import atexit
+import bisect
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Upper bounds (seconds) of the histogram buckets, 50 us to 10 s; +Inf is implied.
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+
+
+class SpanStats:
+    """
+    Durations (seconds) observed for one span.
+    """
+
+    __slots__ = ('count', 'total', 'errors', 'max', 'buckets', 'window')
+
+    def __init__(self, window=2048):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.window = deque(maxlen=window)
+
+    def observe(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        if seconds > self.max:
+            self.max = seconds
+        i = bisect.bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            self.buckets[i] += 1
+        self.window.append(seconds)
+
+    def cumulative(self):
+        """
+        Observations <= each of BUCKETS (the +Inf bucket is 'count').
+        """
+        return list(itertools.accumulate(self.buckets))
+
+    def snapshot(self):
+        """
+        {count, sum, errors, max, p50, p95, p99}; the quantiles cover the recent window.
+        """
+        recent = sorted(self.window)
+        out = {'count': self.count, 'sum': self.total, 'errors': self.errors, 'max': self.max}
+        for q in QUANTILES:
+            out[f'p{round(q * 100)}'] = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+        return out
+
+
+class OrderMetrics:
+    """
+    Registry of spans. While disabled, span() and timed() cost one attribute check.
+    """
+
+    def __init__(self, enabled=True, window=2048, prefix='mt5_order'):
+        self.enabled = enabled
+        self.window = window
+        self.prefix = prefix
+        self._spans = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._writer = None
+        self._written = {}
+        self._stop = threading.Event()
+        self._exporters = []
+        self._exporters_lock = threading.Lock()
+
+    def start_on_first_use(self, start):
+        """
+        Defers the exporter start-up 'start()' to the first observed span.
+        """
+        self._exporters.append(start)
+
+    def _start_exporters(self):
+        with self._exporters_lock:
+            exporters, self._exporters = self._exporters, []
+            for start in exporters:
+                try:
+                    start()
+                except Exception:
+                    log.warning('Could not start an order metrics exporter', exc_info=True)
+
+    def observe(self, name, seconds, error=False):
+        if self._exporters:
+            self._start_exporters()
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = SpanStats(self.window)
+            stats.observe(seconds, error)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Times the body of a with-block as 'name'; an exception counts as an error.
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, error)
+
+    def timed(self, name=None):
+        """
+        Decorator timing every call of a function as 'name' (its __name__ by default).
+        """
+        def decorator(fn):
+            span_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                error = False
+                try:
+                    return fn(*args, **kwargs)
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    self.observe(span_name, time.perf_counter() - started, error)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """
+        {span: SpanStats.snapshot()} of every span observed so far.
+        """
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in sorted(self._spans.items())}
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+
+    def prometheus_text(self):
+        """
+        The spans in the Prometheus text exposition format, as a histogram over BUCKETS, plus
+        error counters.
+        """
+        metric = f'{self.prefix}_span_seconds'
+        errors = f'{self.prefix}_span_errors_total'
+        with self._lock:
+            spans = [(name, stats.cumulative(), stats.total, stats.count, stats.errors)
+                     for name, stats in sorted(self._spans.items())]
+        lines = [f'# HELP {metric} Duration of the order path spans.', f'# TYPE {metric} histogram']
+        for name, cumulative, total, count, _ in spans:
+            for bound, n in zip(BUCKETS, cumulative):
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {n}')
+            lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {total:.9f}')
+            lines.append(f'{metric}_count{{span="{name}"}} {count}')
+        lines += [f'# HELP {errors} Calls of the order path spans that raised.', f'# TYPE {errors} counter']
+        lines += [f'{errors}{{span="{name}"}} {n}' for name, _, _, _, n in spans]
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, host='127.0.0.1', port=9108):
+        """
+        Serves prometheus_text() on http://host:port/metrics from a daemon thread (once). If
+        the port is taken (another process of the same deployment), a free port is bound
+        instead and logged.
+        """
+        if self._server is None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus_text().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer((host, port), Handler)
+            except OSError as e:
+                self._server = ThreadingHTTPServer((host, 0), Handler)
+                log.warning('Order metrics port %s unavailable (%s); serving on http://%s:%s/metrics',
+                            port, e, host, self._server.server_address[1])
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='mt5-metrics-http', daemon=True).start()
+        return self._server
+
+    def write_jsonl(self, path):
+        """
+        Appends one line per span observed since the previous write: {ts, span, count, sum,
+        errors, max, p50, p95, p99}.
+        """
+        now = time.time()
+        snapshot = self.snapshot()
+        lines = [json.dumps({'ts': now, 'span': name, **s}) for name, s in snapshot.items()
+                 if s['count'] != self._written.get(name)]
+        self._written = {name: s['count'] for name, s in snapshot.items()}
+        if lines:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    def start_jsonl(self, path='mt5_metrics.jsonl', interval=10.0):
+        """
+        Calls write_jsonl(path) every 'interval' seconds from a daemon thread, and at exit.
+        """
+        if self._writer is None:
+            def loop():
+                while not self._stop.wait(interval):
+                    self.write_jsonl(path)
+
+            self._writer = threading.Thread(target=loop, name='mt5-metrics-jsonl', daemon=True)
+            self._writer.start()
+            atexit.register(self.write_jsonl, path)
+        return self._writer
+
+
+def metrics_from_env(environ=os.environ):
+    """
+    OrderMetrics configured from the MT5_METRICS* variables, its exporters set to start with
+    the first observed span.
+    """
+    modes = {m.strip() for m in environ.get('MT5_METRICS', 'on').lower().split(',')}
+    metrics = OrderMetrics(enabled=not modes & {'off', '0', 'false', ''})
+    if metrics.enabled and 'prometheus' in modes:
+        metrics.start_on_first_use(lambda: metrics.start_http_server(port=int(environ.get('MT5_METRICS_PORT', 9108))))
+    if metrics.enabled and 'jsonl' in modes:
+        metrics.start_on_first_use(lambda: metrics.start_jsonl(environ.get('MT5_METRICS_FILE', 'mt5_metrics.jsonl'),
+                                                               float(environ.get('MT5_METRICS_INTERVAL', 10))))
+    return metrics
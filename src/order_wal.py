@@ -0,0 +1,342 @@
+"""
+Append-only log of order keys backing the duplicate-order cache of mt5_order_m.
+
+The file is a 26 byte header ('ORDERWAL <generation>') followed by one record per accepted
+key (64 hex characters and a newline). Accepting a key appends one record instead of
+rewriting the cache; once the log holds compact_factor x capacity records it is compacted in
+place to the last 'capacity' keys and its generation is bumped, which tells the other
+readers to reload it.
+
+With shared=True several processes (signal workers) can use the same log: the check and
+the append happen under an exclusive lock on a side file, after reading the records the
+other processes appended since the last call, so a key is accepted by one process only.
+With shared=False records are buffered and written by a background flusher.
+
+fsync policy: 'always' (after every write), 'interval' (by the background flusher every
+flush_interval seconds) or 'never' (left to the OS).
+
+    python -m src.order_wal --bench
+"""
+import argparse
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 attempts; keep waiting.
+                continue
+
+    def _unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+_MAGIC = b'ORDERWAL '
+_HEADER_SIZE = len(_MAGIC) + 17
+_KEY_SIZE = 64
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+def _header(generation):
+    return _MAGIC + b'%016x\n' % generation
+
+
+class OrderKeyLog:
+    """
+    The last 'capacity' accepted keys, oldest first, in 'keys' (a deque) and 'key_set', both
+    persisted to the log at 'path'. The two containers are updated in place, so references to
+    them stay valid across reloads.
+    """
+
+    def __init__(self, path, capacity=1000, shared=True, fsync='interval', flush_interval=1.0,
+                 compact_factor=4, legacy_json=None):
+        """
+        Parameters:
+            path: log file, created if missing; path + '.lock' is the lock file.
+            capacity: number of keys kept (older keys are forgotten).
+            shared: safe for several processes; otherwise records are buffered.
+            fsync: one of FSYNC_POLICIES.
+            flush_interval: seconds between two runs of the background flusher.
+            compact_factor: compact once the log holds this many times 'capacity' records.
+            legacy_json: JSON list of keys imported into a new, empty log (the old cache file).
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.capacity = capacity
+        self.shared = shared
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.compact_factor = max(compact_factor, 2)
+        self.keys = deque()
+        self.key_set = set()
+        self._generation = None
+        self._offset = _HEADER_SIZE
+        self._records = 0
+        self._torn = False
+        self._pending = []
+        self._dirty = False
+        self._thread_lock = threading.RLock()
+        self._closed = threading.Event()
+
+        binary = getattr(os, 'O_BINARY', 0)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | binary, 0o644)
+        self._lock_fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT | binary, 0o644) if shared else None
+        with self._locked():
+            self._open_log(legacy_json)
+
+        self._flusher = None
+        if not shared or fsync == 'interval':
+            self._flusher = threading.Thread(target=self._flush_loop, name='order-wal-flusher', daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._lock_fd is None:
+                yield
+                return
+            _lock_file(self._lock_fd)
+            try:
+                yield
+            finally:
+                _unlock_file(self._lock_fd)
+
+    def _open_log(self, legacy_json):
+        """
+        Writes the header (and the legacy keys) into an empty log, rewrites an unreadable one,
+        then loads it. Called with the lock held.
+        """
+        size = os.fstat(self._fd).st_size
+        if size and self._read_generation() is not None:
+            self._sync()
+            return
+        keys = []
+        if not size and legacy_json and os.path.exists(legacy_json):
+            try:
+                with open(legacy_json, 'r', encoding='utf-8') as f:
+                    keys = [k for k in json.load(f) if isinstance(k, str) and len(k) == _KEY_SIZE]
+            except (json.JSONDecodeError, OSError):
+                keys = []
+        for key in keys[-self.capacity:]:
+            self._apply(key)
+        self._rewrite(1)
+
+    def _read_generation(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        head = os.read(self._fd, _HEADER_SIZE)
+        if len(head) < _HEADER_SIZE or not head.startswith(_MAGIC) or not head.endswith(b'\n'):
+            return None
+        try:
+            return int(head[len(_MAGIC):-1], 16)
+        except ValueError:
+            return None
+
+    def _apply(self, key):
+        if key in self.key_set:
+            return
+        if len(self.keys) >= self.capacity:
+            self.key_set.discard(self.keys.popleft())
+        self.keys.append(key)
+        self.key_set.add(key)
+
+    def _sync(self):
+        """
+        Applies the records appended by other processes since the last call, reloading the
+        whole log after a compaction. Called with the lock held.
+        """
+        generation = self._read_generation()
+        if generation is None:
+            # Truncated or overwritten behind our back: keep what we know and start over.
+            self._rewrite((self._generation or 0) + 1)
+            return
+        if generation != self._generation:
+            self.keys.clear()
+            self.key_set.clear()
+            self._generation = generation
+            self._offset = _HEADER_SIZE
+            self._records = 0
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        os.lseek(self._fd, self._offset, os.SEEK_SET)
+        data = os.read(self._fd, size - self._offset)
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].split(b'\n')[:-1]:
+            # Records torn by a crash are skipped.
+            if len(line) == _KEY_SIZE:
+                self._apply(line.decode('ascii'))
+                self._records += 1
+        self._offset += end
+        # Bytes after the last newline can only be a torn record: the next append starts on
+        # a new line.
+        self._torn = end < len(data)
+
+    def _write(self, data):
+        """
+        Appends records. Called with the lock held, after _sync in shared mode.
+        """
+        if self._torn:
+            data = b'\n' + data
+            self._torn = False
+        os.lseek(self._fd, 0, os.SEEK_END)
+        os.write(self._fd, data)
+        self._offset = os.lseek(self._fd, 0, os.SEEK_CUR)
+        self._dirty = True
+        if self.fsync == 'always':
+            os.fsync(self._fd)
+            self._dirty = False
+        if self._records >= self.compact_factor * self.capacity:
+            self._rewrite(self._generation + 1)
+
+    def _rewrite(self, generation):
+        """
+        Rewrites the log in place as a new generation holding the current keys. The new
+        content is written over the start of the file before the old tail is cut, so a crash
+        in between leaves valid (older) records behind rather than an empty cache.
+        """
+        self._generation = generation
+        body = b''.join(key.encode('ascii') + b'\n' for key in self.keys)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, _header(generation) + body)
+        os.ftruncate(self._fd, _HEADER_SIZE + len(body))
+        self._offset = _HEADER_SIZE + len(body)
+        self._records = len(self.keys)
+        self._torn = False
+        if self.fsync != 'never':
+            os.fsync(self._fd)
+        self._dirty = False
+
+    def add(self, key):
+        """
+        Records 'key' and returns True, or returns False if it is already among the last
+        'capacity' keys (of any process sharing the log).
+        """
+        with self._locked():
+            if self.shared:
+                self._sync()
+            if key in self.key_set:
+                return False
+            self._apply(key)
+            self._records += 1
+            record = key.encode('ascii') + b'\n'
+            if self.shared:
+                self._write(record)
+            else:
+                self._pending.append(record)
+            return True
+
+    def __contains__(self, key):
+        with self._locked():
+            if self.shared:
+                self._sync()
+            return key in self.key_set
+
+    def __len__(self):
+        return len(self.keys)
+
+    def flush(self):
+        """
+        Writes the buffered records and applies the fsync policy.
+        """
+        with self._locked():
+            if self._fd is None:
+                return
+            if self._pending:
+                data = b''.join(self._pending)
+                self._pending.clear()
+                self._write(data)
+            dirty = self._dirty and self.fsync != 'never'
+            self._dirty = False
+            fd = self._fd
+        # Outside the lock: fsync takes milliseconds and must not hold up the order path
+        # (close() joins this thread before closing the file).
+        if dirty:
+            os.fsync(fd)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stops the flusher, writes what is buffered and closes the files. Idempotent.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+        with self._thread_lock:
+            os.close(self._fd)
+            self._fd = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+        atexit.unregister(self.close)
+
+
+def benchmark(n=20000, capacity=1000, directory=None):
+    """
+    Keys accepted per second for each mode and fsync policy, plus the old behaviour of
+    rewriting the whole JSON cache on every key. Returns [(label, keys per second)].
+    """
+    import hashlib
+
+    keys = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        cache = deque(maxlen=capacity)
+        started = time.perf_counter()
+        for key in keys[:n // 10]:
+            cache.append(key)
+            with open(os.path.join(tmp, 'cache.json'), 'w', encoding='utf-8') as f:
+                json.dump(list(cache), f)
+        results.append(('json rewrite', n // 10 / (time.perf_counter() - started)))
+
+        for shared in (True, False):
+            for fsync in FSYNC_POLICIES:
+                count = n // 10 if fsync == 'always' and shared else n
+                log = OrderKeyLog(os.path.join(tmp, f'{shared}-{fsync}.wal'), capacity=capacity,
+                                  shared=shared, fsync=fsync)
+                started = time.perf_counter()
+                for key in keys[:count]:
+                    log.add(key)
+                elapsed = time.perf_counter() - started
+                log.close()
+                results.append((f"{'shared' if shared else 'buffered'}, fsync={fsync}", count / elapsed))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the order key log.')
+    parser.add_argument('--bench', action='store_true')
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--dir', default=None, help='directory for the temporary logs (its disk is measured)')
+    args = parser.parse_args()
+    if args.bench:
+        for label, rate in benchmark(args.n, directory=args.dir):
+            print(f'{label:>26}: {rate:12,.0f} keys/s')
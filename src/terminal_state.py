@@ -0,0 +1,132 @@
+"""
+Snapshot of the open positions and pending orders of an MT5 terminal, shared by the guard
+functions of mt5_order_m.
+
+One positions_get() plus one orders_get() call covers every symbol; the results are indexed by
+(symbol, comment, type), with None standing for "any" in each slot, so the guards look their
+tickets up instead of filtering lists. Every decision cycle (see cycle()) starts from a fresh
+snapshot and reuses it until invalidate() is called after the module sends an order or closes
+a position. Outside a cycle each lookup fetches only the collection asked for, for its symbol,
+unless max_age opts in to caching the whole snapshot.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _index(items):
+    """
+    {(symbol, comment, type): tuple of items}, including the keys with comment and/or type
+    set to None, in terminal order.
+    """
+    index = {}
+    for item in items:
+        symbol, comment, kind = item.symbol, item.comment, item.type
+        for key in ((symbol, comment, kind), (symbol, comment, None), (symbol, None, kind), (symbol, None, None)):
+            index.setdefault(key, []).append(item)
+    return {key: tuple(found) for key, found in index.items()}
+
+
+class TerminalState:
+    """
+    Cached positions_get()/orders_get() of 'terminal' (the MetaTrader5 module or a fake one).
+    """
+
+    def __init__(self, terminal, max_age=0.0):
+        """
+        Parameters:
+            terminal: the MetaTrader5 module (or anything with positions_get/orders_get).
+            max_age: seconds a snapshot is reused outside of a decision cycle; 0 (the
+                default) reads live state on every lookup, as orders sent by other processes
+                or EAs would otherwise be missed.
+        """
+        self.terminal = terminal
+        self.max_age = max_age
+        self.fetches = 0
+        self._positions = None
+        self._orders = None
+        self._fetched_at = None
+        self._cycles = 0
+        self._lock = threading.RLock()
+
+    def _fresh(self):
+        if self._fetched_at is None:
+            return False
+        return self._cycles > 0 or time.monotonic() - self._fetched_at < self.max_age
+
+    def refresh(self):
+        """
+        Fetches a new snapshot. A failed fetch (None from the terminal) is kept as None and not
+        reused.
+        """
+        with self._lock:
+            positions = self.terminal.positions_get()
+            orders = self.terminal.orders_get()
+            self.fetches += 1
+            self._positions = None if positions is None else _index(positions)
+            self._orders = None if orders is None else _index(orders)
+            failed = positions is None or orders is None
+            self._fetched_at = None if failed else time.monotonic()
+
+    def invalidate(self):
+        """
+        Drops the snapshot; the next lookup fetches a new one.
+        """
+        with self._lock:
+            self._fetched_at = None
+
+    @contextmanager
+    def cycle(self):
+        """
+        Decision cycle: all lookups inside share one snapshot, fetched when the outermost cycle
+        opens (and again after invalidate()). Cycles may be nested.
+        """
+        with self._lock:
+            if self._cycles == 0:
+                self._fetched_at = None
+            self._cycles += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._cycles -= 1
+
+    def _fetch_one(self, attr, symbol, comment, kind):
+        """
+        Live lookup outside of a snapshot: one positions_get/orders_get call for 'symbol'.
+        """
+        getter = self.terminal.positions_get if attr == '_positions' else self.terminal.orders_get
+        items = getter(symbol=symbol)
+        with self._lock:
+            self.fetches += 1
+        if items is None:
+            return None
+        return tuple(item for item in items
+                     if (comment is None or item.comment == comment) and (kind is None or item.type == kind))
+
+    def _lookup(self, attr, symbol, comment, kind):
+        with self._lock:
+            snapshot = self._cycles > 0 or self.max_age > 0
+        if not snapshot:
+            return self._fetch_one(attr, symbol, comment, kind)
+        with self._lock:
+            if not self._fresh():
+                self.refresh()
+            index = getattr(self, attr)
+            if index is None:
+                return None
+            return index.get((symbol, comment, kind), ())
+
+    def positions(self, symbol, comment=None, type=None):
+        """
+        Open positions of 'symbol' (with 'comment' / of 'type' if given), or None if the
+        terminal returned no data.
+        """
+        return self._lookup('_positions', symbol, comment, type)
+
+    def orders(self, symbol, comment=None, type=None):
+        """
+        Pending orders of 'symbol' (with 'comment' / of 'type' if given), or None if the
+        terminal returned no data.
+        """
+        return self._lookup('_orders', symbol, comment, type)
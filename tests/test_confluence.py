@@ -0,0 +1,97 @@
+"""
+ConfluenceIndex against brute-force scans of the OBs alive at each query time.
+"""
+import numpy as np
+import pytest
+
+from confluence import ConfluenceIndex
+from orderblockdetector import ACTIVE_UNTIL, find_stacked_levels
+
+
+def _random_obs(rng, n):
+    # Prices on a coarse grid so that many OBs share edges; some zero-height and NaN rows.
+    a = rng.integers(0, 30, n).astype(float)
+    b = a + rng.integers(0, 6, n)
+    a[rng.random(n) < 0.05] = np.nan
+    starts = rng.integers(0, 1000, n)
+    ends = np.where(rng.random(n) < 0.3, ACTIVE_UNTIL, starts + rng.integers(1, 400, n))
+    # Tops and bottoms in either order.
+    swap = rng.random(n) < 0.5
+    return np.where(swap, a, b), np.where(swap, b, a), starts, ends
+
+
+def _overlapping(tops, bottoms, starts, ends, t0, t1):
+    valid = ~(np.isnan(tops) | np.isnan(bottoms))
+    return valid & (starts <= t1) & ((ends == ACTIVE_UNTIL) | (ends > t0))
+
+
+def _brute_top_bands(index, tops, bottoms, alive, k, min_count):
+    lower = np.minimum(tops, bottoms)[alive]
+    upper = np.maximum(tops, bottoms)[alive]
+    counts = [int(np.sum((lower <= lo) & (upper >= hi))) for lo, hi in zip(index.edges[:-1], index.edges[1:])]
+    ranked = sorted(((c, band) for band, c in enumerate(counts) if c >= min_count), key=lambda cb: (-cb[0], -cb[1]))
+    return ranked[:k]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_bands_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    tops, bottoms, starts, ends = _random_obs(rng, 200)
+    index = ConfluenceIndex(tops, bottoms, starts, ends)
+    for t0, width in [(0, 0), (250, 0), (500, 0), (999, 0), (1500, 0), (400, 100), (700, 300)]:
+        t1 = t0 + width
+        alive = _overlapping(tops, bottoms, starts, ends, t0, t1)
+        for k, min_count in [(2, 2), (5, 1), (50, 3)]:
+            counts, lower, upper = index.top_bands(t0, t1, k=k, min_count=min_count)
+            expected = _brute_top_bands(index, tops, bottoms, alive, k, min_count)
+            assert counts.tolist() == [c for c, _ in expected]
+            assert lower.tolist() == [index.edges[band] for _, band in expected]
+            assert upper.tolist() == [index.edges[band + 1] for _, band in expected]
+
+        # Every band lies inside a find_stacked_levels interval of the same count, and the
+        # most stacked count agrees.
+        sweep_counts, sweep_lower, sweep_upper = find_stacked_levels(tops[alive], bottoms[alive])
+        counts, lower, upper = index.top_bands(t0, t1, k=10, min_count=1)
+        for c, lo, hi in zip(counts, lower, upper):
+            inside = (sweep_lower <= lo) & (sweep_upper >= hi)
+            assert sweep_counts[inside].tolist() == [c]
+        if len(counts):
+            assert counts[0] == sweep_counts.max()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_count_window_matches_brute_force(seed):
+    rng = np.random.default_rng(100 + seed)
+    tops, bottoms, starts, ends = _random_obs(rng, 150)
+    index = ConfluenceIndex(tops, bottoms, starts, ends)
+    lower = np.minimum(tops, bottoms)
+    upper = np.maximum(tops, bottoms)
+    for _ in range(200):
+        price = float(rng.integers(-2, 38)) + rng.choice([0.0, 0.5])
+        t0 = int(rng.integers(-10, 1500))
+        t1 = t0 + int(rng.choice([0, 0, 50, 500]))
+        alive = _overlapping(tops, bottoms, starts, ends, t0, t1)
+        expected = int(np.sum(alive & (lower <= price) & (price < upper)))
+        assert index.count_window(price, t0, t1) == expected
+        if t0 == t1:
+            assert index.count(price, t0) == expected
+
+
+def test_empty_index():
+    index = ConfluenceIndex([], [], [])
+    assert len(index) == 0
+    counts, lower, upper = index.top_bands(0, k=2, min_count=1)
+    assert (len(counts), len(lower), len(upper)) == (0, 0, 0)
+    assert index.count(1.0, 0) == 0
+
+
+def test_single_band():
+    index = ConfluenceIndex([12.0], [10.0], [100], [200])
+    counts, lower, upper = index.top_bands(150, k=2, min_count=1)
+    assert (counts.tolist(), lower.tolist(), upper.tolist()) == ([1], [10.0], [12.0])
+    assert index.top_bands(150, k=2, min_count=2)[0].tolist() == []
+    assert index.top_bands(99, k=2, min_count=1)[0].tolist() == []
+    assert index.top_bands(200, k=2, min_count=1)[0].tolist() == []
+    # The window [150, 250] still overlaps the OB.
+    assert index.top_bands(150, 250, k=2, min_count=1)[0].tolist() == [1]
+    assert [index.count(p, 150) for p in (9.9, 10.0, 11.0, 12.0)] == [0, 1, 1, 0]
@@ -0,0 +1,149 @@
+"""
+datafeed helpers with stub fetches and a fake clock (nothing sleeps).
+"""
+import threading
+
+from datafeed import FetchCache, RateLimiter, fetch_concurrent, fetch_with_retry, next_bar_close
+
+HOUR = 3_600_000
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Flaky:
+    """
+    A fetch that raises for its first 'failures' calls, then returns 'value'.
+    """
+
+    def __init__(self, failures, value='data'):
+        self.failures = failures
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('network down')
+        return self.value
+
+
+def test_retry_until_success():
+    clock = FakeClock()
+    fetch = Flaky(failures=2)
+    assert fetch_with_retry(fetch, max_retries=3, retry_delay=1, sleep=clock.sleep) == 'data'
+    assert fetch.calls == 3
+    assert clock.sleeps == [1, 1]
+
+
+def test_retry_returns_none_once_exhausted():
+    clock = FakeClock()
+    fetch = Flaky(failures=10)
+    assert fetch_with_retry(fetch, max_retries=3, retry_delay=2, sleep=clock.sleep) is None
+    assert fetch.calls == 3
+    assert clock.sleeps == [2, 2, 2]
+
+
+def test_retry_waits_for_the_rate_limiter_on_every_attempt():
+    clock = FakeClock(now=100.0)
+    limiter = RateLimiter(rate=2, clock=clock, sleep=clock.sleep)
+    fetch = Flaky(failures=1)
+    fetch_with_retry(fetch, max_retries=3, retry_delay=0, rate_limiter=limiter, sleep=lambda s: None)
+    # Two attempts: the second one waits half a second for its slot.
+    assert clock.sleeps == [0.5]
+
+
+def test_rate_limiter_spaces_calls():
+    clock = FakeClock(now=10.0)
+    limiter = RateLimiter(rate=4, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.sleeps == [0.25, 0.25]
+    clock.now += 5
+    limiter.acquire()
+    assert clock.sleeps == [0.25, 0.25]
+
+
+def test_fetch_concurrent_keeps_request_order_and_dedups():
+    calls = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def fetch(symbol, interval):
+        with lock:
+            calls.append((symbol, interval))
+        if interval == '1d':
+            # The first request finishes last.
+            release.wait(5)
+        elif interval == '1h':
+            release.set()
+        return f'{symbol}-{interval}'
+
+    requests = [('BTC', '1d'), ('BTC', '4h'), ('BTC', '1h'), ('BTC', '4h')]
+    assert fetch_concurrent(requests, fetch, max_workers=4) == ['BTC-1d', 'BTC-4h', 'BTC-1h', 'BTC-4h']
+    assert sorted(calls) == [('BTC', '1d'), ('BTC', '1h'), ('BTC', '4h')]
+    assert fetch_concurrent([], fetch) == []
+
+
+def test_fetch_concurrent_isolates_failures():
+    def fetch(symbol, interval):
+        if interval == '4h':
+            raise ConnectionError('network down')
+        if interval == '1h':
+            return None
+        return f'{symbol}-{interval}'
+
+    requests = [('BTC', '1d'), ('BTC', '4h'), ('BTC', '1h'), ('BTC', '30m')]
+    expected = ['BTC-1d', None, None, 'BTC-30m']
+    assert fetch_concurrent(requests, fetch, max_workers=4) == expected
+    assert fetch_concurrent(requests, fetch, max_workers=1) == expected
+
+
+def test_next_bar_close():
+    assert next_bar_close(HOUR, 0) == HOUR
+    assert next_bar_close(HOUR, HOUR - 1) == HOUR
+    assert next_bar_close(HOUR, HOUR) == 2 * HOUR
+
+
+def test_fetch_cache_expires_at_bar_close():
+    clock = FakeClock(now=HOUR / 1000 - 30)  # 30 s before the 1h bar closes
+    cache = FetchCache(max_age=60, clock=clock)
+    fetch = Flaky(failures=0)
+    assert cache.get('key', HOUR, fetch) == 'data'
+    clock.now += 29
+    cache.get('key', HOUR, fetch)
+    assert fetch.calls == 1
+    clock.now += 1
+    cache.get('key', HOUR, fetch)
+    assert fetch.calls == 2
+
+
+def test_fetch_cache_caps_entries_at_max_age():
+    clock = FakeClock(now=0.0)  # a daily bar that closes in 24 h
+    cache = FetchCache(max_age=60, clock=clock)
+    fetch = Flaky(failures=0)
+    cache.get('key', 24 * HOUR, fetch)
+    clock.now = 59.9
+    cache.get('key', 24 * HOUR, fetch)
+    assert fetch.calls == 1
+    clock.now = 60.0
+    cache.get('key', 24 * HOUR, fetch)
+    assert fetch.calls == 2
+
+
+def test_fetch_cache_does_not_keep_failures():
+    cache = FetchCache(clock=FakeClock())
+    results = iter([None, 'data'])
+    assert cache.get('key', HOUR, lambda: next(results)) is None
+    assert cache.get('key', HOUR, lambda: next(results)) == 'data'
+    assert cache.get('key', HOUR, lambda: 'other') == 'data'
@@ -0,0 +1,128 @@
+"""
+KlineStore against a fake python-binance client.
+"""
+import os
+
+import numpy as np
+
+from klinestore import KLINE_DTYPE, KlineStore, klines_to_array
+
+HOUR = 3_600_000
+
+
+class FakeClient:
+    """
+    get_historical_klines over bars 0..last of one hour each; bar 'last' is still forming and
+    its close changes with 'tick'. Bars before 'first' are no longer available.
+    """
+
+    def __init__(self, last=99):
+        self.last = last
+        self.first = 0
+        self.tick = 0
+        self.calls = []
+
+    def kline(self, t):
+        close = 100.0 + t + (self.tick if t == self.last else 0)
+        return [t * HOUR, f'{100.0 + t}', f'{close + 1}', f'{99.0 + t}', f'{close}', f'{10.0 + t % 7}',
+                (t + 1) * HOUR - 1, '1.5', t % 50, '0.5', '0.25', '0']
+
+    def get_historical_klines(self, symbol, interval, limit=None, start_str=None, klines_type=None):
+        self.calls.append({'symbol': symbol, 'interval': interval, 'limit': limit, 'start_str': start_str})
+        if limit is not None:
+            start = self.last - limit + 1
+        else:
+            start = start_str // HOUR
+        return [self.kline(t) for t in range(max(start, self.first, 0), self.last + 1)]
+
+
+def _store(tmp_path, client, **kwargs):
+    return KlineStore(root=str(tmp_path), client=client, **kwargs)
+
+
+def _times(arr):
+    return (arr['open_time'] // HOUR).tolist()
+
+
+def test_klines_to_array_matches_the_tuple_conversion():
+    klines = [FakeClient().kline(t) for t in range(20)]
+    expected = np.array([tuple(k[:11]) for k in klines], dtype=KLINE_DTYPE)
+    assert np.array_equal(klines_to_array(klines), expected)
+    assert len(klines_to_array([])) == 0
+
+
+def test_cold_fetch_then_incremental_top_up(tmp_path):
+    client = FakeClient()
+    store = _store(tmp_path, client)
+    assert _times(store.get('BTCUSDT', '1h', 10)) == list(range(90, 100))
+    assert client.calls[-1]['limit'] == 10
+
+    client.last = 102
+    arr = store.get('BTCUSDT', '1h', 10)
+    # Only the bars from the last cached one on are requested; that one is refreshed.
+    assert client.calls[-1] == {'symbol': 'BTCUSDT', 'interval': '1h', 'limit': None, 'start_str': 99 * HOUR}
+    assert _times(arr) == list(range(93, 103))
+    assert arr['close'][-4] == 199.0
+
+    # A new store reads the file written by the first one.
+    reread = _store(tmp_path, client)
+    assert _times(reread.get('BTCUSDT', '1h', 13)) == list(range(90, 103))
+    assert client.calls[-1]['limit'] is None
+
+
+def test_top_up_without_changes_does_not_rewrite(tmp_path):
+    client = FakeClient()
+    store = _store(tmp_path, client)
+    store.get('BTCUSDT', '1h', 10)
+    path = store._path(('BTCUSDT', '1h', 'SPOT'))
+    os.utime(path, ns=(0, 0))
+
+    store.get('BTCUSDT', '1h', 10)
+    assert os.stat(path).st_mtime_ns == 0
+
+    # The forming candle moved: the file is rewritten.
+    client.tick = 5
+    assert store.get('BTCUSDT', '1h', 10)['close'][-1] == 204.0
+    assert os.stat(path).st_mtime_ns != 0
+
+
+def test_gap_discards_the_cache(tmp_path):
+    client = FakeClient()
+    store = _store(tmp_path, client)
+    store.get('BTCUSDT', '1h', 10)
+    # The top-up no longer connects to the cached bars.
+    client.first, client.last = 150, 200
+    arr = store.get('BTCUSDT', '1h', 10)
+    assert _times(arr) == list(range(191, 201))
+    assert np.all(np.diff(arr['open_time']) == HOUR)
+    assert _times(np.load(store._path(('BTCUSDT', '1h', 'SPOT')))) == list(range(161, 201))
+
+
+def test_keep_factor_bounds_the_file(tmp_path):
+    client = FakeClient()
+    store = _store(tmp_path, client, keep_factor=2)
+    store.get('BTCUSDT', '1h', 10)
+    for _ in range(50):
+        client.last += 1
+        arr = store.get('BTCUSDT', '1h', 10)
+    assert _times(arr) == list(range(140, 150))
+    assert len(np.load(store._path(('BTCUSDT', '1h', 'SPOT')))) == 20
+
+    # A larger limit raises the bound.
+    store.get('BTCUSDT', '1h', 30)
+    client.last += 100
+    store.get('BTCUSDT', '1h', 10)
+    assert len(np.load(store._path(('BTCUSDT', '1h', 'SPOT')))) == 60
+
+
+def test_lru_evicts_the_least_recently_used_key(tmp_path):
+    client = FakeClient()
+    store = _store(tmp_path, client, lru_size=2)
+    for symbol in ('A', 'B', 'C'):
+        store.get(symbol, '1h', 5)
+    assert list(store._lru) == [('B', '1h', 'SPOT'), ('C', '1h', 'SPOT')]
+
+    # An evicted key is read back from its file, not fetched again in full.
+    assert _times(store.get('A', '1h', 5)) == list(range(95, 100))
+    assert client.calls[-1]['limit'] is None
+    assert list(store._lru) == [('C', '1h', 'SPOT'), ('A', '1h', 'SPOT')]
@@ -0,0 +1,92 @@
+"""
+Parity of the vectorized leverage_for with the scalar binance_leverage_custom.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from src.lev import bracket_table, binance_leverage_custom, leverage_for
+
+WALLET = 1000.0
+TIERS = [
+    {'notionalCap': 5000, 'initialLeverage': 50, 'maintMarginRatio': 0.01, 'cum': 0.0},
+    {'notionalCap': 25000, 'initialLeverage': 20, 'maintMarginRatio': 0.025, 'cum': 75.0},
+    {'notionalCap': 100000, 'initialLeverage': 10, 'maintMarginRatio': 0.05, 'cum': 700.0},
+    {'notionalCap': 250000, 'initialLeverage': 5, 'maintMarginRatio': 0.1, 'cum': 5700.0},
+]
+BRACKETS = {'TESTUSDT': [{'symbol': 'TESTUSDT', 'brackets': TIERS}]}
+
+
+def _scalar(entry, liq, side):
+    try:
+        return binance_leverage_custom(liq_price=liq, entry_price=entry, wallet_balance=WALLET, side=side,
+                                       symbol='TESTUSDT', bracket_data=BRACKETS)
+    except ValueError:
+        return math.nan
+
+
+def _edge_liq(entry, tier, leverage, long):
+    """
+    Liquidation price at which the candidate leverage of 'tier' is 'leverage'.
+    """
+    R, A = tier['maintMarginRatio'], tier['cum']
+    offset = entry * (WALLET + A) / (WALLET * leverage)
+    return (entry - offset) / (1 - R) if long else (entry + offset) / (1 + R)
+
+
+def _liq_prices(entry, long):
+    prices = []
+    for tier in TIERS:
+        # Exactly on the notional cap of the tier, and one ulp to either side.
+        edge = _edge_liq(entry, tier, tier['notionalCap'] / WALLET, long)
+        prices += [edge, np.nextafter(edge, 0), np.nextafter(edge, np.inf)]
+        # Exactly on the leverage cap of the tier.
+        prices.append(_edge_liq(entry, tier, tier['initialLeverage'], long))
+    step = -1 if long else 1
+    prices += [entry + step * entry * f for f in (0.001, 0.01, 0.05, 0.2, 0.5, 0.9)]
+    # Beyond the top bracket (leverage far above 250x), wrong side, equal, NaN.
+    prices += [entry + step * entry * 1e-6, entry - step * entry * 0.1, entry, math.nan]
+    return prices
+
+
+@pytest.mark.parametrize('side', ['BUY', 'LONG', 'LIMIT_LONG', 'SELL', 'SHORT', 'LIMIT_SHORT', 'buy'])
+@pytest.mark.parametrize('entry', [0.01234, 1.0, 97.3, 64321.5])
+def test_leverage_for_matches_scalar(entry, side):
+    long = side.upper() in ('BUY', 'LONG', 'LIMIT_LONG')
+    liq = _liq_prices(entry, long)
+    expected = np.array([_scalar(entry, p, side) for p in liq])
+    got = leverage_for(entry, liq, side=side, wallet_balance=WALLET, symbol='TESTUSDT', bracket_data=BRACKETS)
+    np.testing.assert_array_equal(got, expected)
+    # The grid reaches uncapped values, the leverage caps and the failures.
+    assert np.isnan(expected).sum() >= 4
+    finite = np.abs(expected[np.isfinite(expected)])
+    assert {20.0, 10.0} <= set(finite.tolist())
+    assert (finite < 5).any()
+
+
+def test_leverage_for_nan_inputs_and_mixed_sides():
+    entries = [100.0, math.nan, 100.0, 100.0, 100.0]
+    liqs = [95.0, 95.0, math.nan, 105.0, 105.0]
+    sides = ['BUY', 'BUY', 'SELL', 'SELL', 'BUY']
+    got = leverage_for(entries, liqs, side=sides, wallet_balance=WALLET, symbol='TESTUSDT', bracket_data=BRACKETS)
+    expected = [_scalar(e, p, s) for e, p, s in zip(entries, liqs, sides)]
+    np.testing.assert_array_equal(got, expected)
+    assert np.isnan(got[[1, 2, 4]]).all()
+    # The apps show 'n/a' for the NaN entries.
+    assert [int(v) if math.isfinite(v) else 'n/a' for v in got.tolist()][1] == 'n/a'
+
+
+def test_leverage_for_shape_and_errors():
+    got = leverage_for(np.full((2, 3), 100.0), 95.0, symbol='TESTUSDT', bracket_data=BRACKETS)
+    assert got.shape == (2, 3)
+    assert np.all(got == _scalar(100.0, 95.0, 'BUY'))
+    with pytest.raises(ValueError):
+        leverage_for(100.0, 95.0, side='HOLD', symbol='TESTUSDT', bracket_data=BRACKETS)
+    with pytest.raises(ValueError):
+        leverage_for(100.0, 95.0, symbol='NOPE', bracket_data=BRACKETS)
+
+
+def test_bracket_table_is_compiled_once_per_dict():
+    assert bracket_table('TESTUSDT', BRACKETS) is bracket_table('TESTUSDT', BRACKETS)
+    assert bracket_table('TESTUSDT', BRACKETS).notional_cap.tolist() == [5000, 25000, 100000, 250000]
@@ -0,0 +1,86 @@
+"""
+MetadataStore on a temporary SQLite file: lazy per-symbol reads and invalidation through
+PRAGMA data_version.
+"""
+import json
+import pickle
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from src.metastore import FuturesBrackets, MetadataStore, TokenInfo, write_store
+
+TIER = {'notionalCap': 5000, 'initialLeverage': 50, 'maintMarginRatio': 0.01, 'cum': 0.0}
+
+
+def _brackets(cap=5000):
+    return {'BTCUSDT': [{'symbol': 'BTCUSDT', 'brackets': [dict(TIER, notionalCap=cap, extra='dropped')]}],
+            'ETHUSDT': [{'symbol': 'ETHUSDT', 'brackets': [TIER]}]}
+
+
+def _token_info(precision=2):
+    return {'BTCUSDT': {'pricePrecision': precision, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+                        'quoteAsset': 'USDT', 'filters': []},
+            'ETHUSDT': {'pricePrecision': 3, 'contractType': 'PERPETUAL', 'status': 'TRADING', 'quoteAsset': 'USDT'}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / 'symbol_meta.sqlite')
+    write_store(_brackets(), _token_info(), path)
+    store = MetadataStore(path, brackets_path=str(tmp_path / 'none.pkl'), token_info_path=str(tmp_path / 'none.pkl'),
+                          check_interval=0)
+    yield store
+    if store._conn is not None:
+        store._conn.close()
+
+
+def test_nothing_is_read_before_the_first_lookup(store):
+    assert store._conn is None
+    assert TokenInfo(store)['BTCUSDT']['pricePrecision'] == 2
+    # Only the symbol looked up is cached, with the kept fields only.
+    assert list(store._tokens) == ['BTCUSDT']
+    assert store._brackets == {}
+    assert FuturesBrackets(store)['BTCUSDT'] == [{'symbol': 'BTCUSDT', 'brackets': [TIER]}]
+    assert list(store._brackets) == ['BTCUSDT']
+    with pytest.raises(KeyError):
+        store.token('NOPEUSDT')
+    assert sorted(TokenInfo(store)) == ['BTCUSDT', 'ETHUSDT']
+
+
+def test_a_write_through_another_connection_is_picked_up(store):
+    tokens, brackets = TokenInfo(store), FuturesBrackets(store)
+    assert tokens['BTCUSDT']['pricePrecision'] == 2
+    assert brackets['BTCUSDT'][0]['brackets'][0]['notionalCap'] == 5000
+    version = tokens.version
+
+    # As update_bracket.py does: one transaction from another connection.
+    write_store(_brackets(cap=7000), _token_info(precision=4), store.path)
+    assert tokens['BTCUSDT']['pricePrecision'] == 4
+    assert brackets['BTCUSDT'][0]['brackets'][0]['notionalCap'] == 7000
+    assert tokens.version == version + 1
+
+    # A plain UPDATE from a raw connection is seen as well.
+    with closing(sqlite3.connect(store.path)) as conn, conn:
+        conn.execute('UPDATE brackets SET tiers = ? WHERE symbol = ?', (json.dumps([dict(TIER, cum=1.5)]), 'ETHUSDT'))
+    assert brackets['ETHUSDT'][0]['brackets'][0]['cum'] == 1.5
+
+
+def test_cached_rows_are_served_between_checks(store):
+    store.check_interval = 3600
+    assert store.token('BTCUSDT')['pricePrecision'] == 2
+    write_store(_brackets(), _token_info(precision=5), store.path)
+    assert store.token('BTCUSDT')['pricePrecision'] == 2
+    store.refresh(force=True)
+    assert store.token('BTCUSDT')['pricePrecision'] == 5
+
+
+def test_missing_store_is_built_from_the_pickles(tmp_path):
+    brackets_path, token_info_path = tmp_path / 'futures_bracket.pkl', tmp_path / 'token_info.pkl'
+    brackets_path.write_bytes(pickle.dumps(_brackets()))
+    token_info_path.write_bytes(pickle.dumps(_token_info()))
+    store = MetadataStore(str(tmp_path / 'meta.sqlite'), str(brackets_path), str(token_info_path))
+    assert store.token('ETHUSDT')['pricePrecision'] == 3
+    assert (tmp_path / 'meta.sqlite').exists()
+    store._conn.close()
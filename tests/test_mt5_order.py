@@ -0,0 +1,435 @@
+"""
+The MT5 order path modules of src/ against a fake MetaTrader5 terminal (they take the terminal
+as a parameter, so neither MetaTrader5 nor a running terminal is needed).
+"""
+import multiprocessing
+import os
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from src.bulk_exec import BulkExecutor
+from src.order_history import OrderHistoryIndex
+from src.order_wal import OrderKeyLog
+from src.terminal_state import TerminalState
+
+
+class FakeTerminal:
+    """
+    The parts of the MetaTrader5 module used by src/: open positions, pending orders and the
+    order history as lists of SimpleNamespace, order_send/Close answering from 'replies', and
+    a count of the calls made.
+    """
+    TRADE_ACTION_REMOVE = 8
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_INVALID = 10013
+
+    def __init__(self):
+        self.positions = []
+        self.orders = []
+        self.history = []
+        self.replies = []
+        self.calls = []
+        self.unavailable = False
+
+    def _get(self, items, symbol=None, ticket=None):
+        if self.unavailable:
+            return None
+        return tuple(item for item in items
+                     if (symbol is None or item.symbol == symbol) and (ticket is None or item.ticket == ticket))
+
+    def positions_get(self, symbol=None, ticket=None):
+        self.calls.append('positions_get')
+        return self._get(self.positions, symbol, ticket)
+
+    def orders_get(self, symbol=None, ticket=None):
+        self.calls.append('orders_get')
+        return self._get(self.orders, symbol, ticket)
+
+    def history_orders_get(self, date_from, date_to):
+        self.calls.append(('history_orders_get', date_from, date_to))
+        if self.unavailable:
+            return None
+        return tuple(o for o in self.history if date_from.timestamp() <= o.time_setup <= date_to.timestamp())
+
+    def last_error(self):
+        return (-10005, 'IPC timeout')
+
+    def _reply(self, items, ticket):
+        """
+        Next scripted reply: a retcode (DONE removes the ticket), 'lost' (no response, nothing
+        done), 'applied' (no response, but the ticket was removed) or an exception to raise.
+        """
+        reply = self.replies.pop(0) if self.replies else self.TRADE_RETCODE_DONE
+        if isinstance(reply, BaseException):
+            raise reply
+        if reply in (self.TRADE_RETCODE_DONE, 'applied'):
+            items[:] = [item for item in items if item.ticket != ticket]
+        if reply in ('lost', 'applied'):
+            return None
+        return SimpleNamespace(retcode=reply, comment=f'retcode {reply}')
+
+    def order_send(self, request):
+        self.calls.append(('order_send', request['order']))
+        return self._reply(self.orders, request['order'])
+
+    def Close(self, symbol, ticket):
+        self.calls.append(('Close', ticket))
+        reply = self._reply(self.positions, ticket)
+        if reply is not None and reply.retcode == self.TRADE_RETCODE_DONE:
+            return True
+        return reply
+
+
+def _position(ticket, symbol='EURUSD', comment='sig', type=0):
+    return SimpleNamespace(ticket=ticket, symbol=symbol, comment=comment, type=type)
+
+
+def _key(i):
+    return f'{i:064x}'
+
+
+# --- OrderKeyLog ---
+
+def test_key_log_accepts_a_key_once_and_persists_it(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    log = OrderKeyLog(path, capacity=10, fsync='never')
+    assert log.add(_key(1))
+    assert not log.add(_key(1))
+    assert log.add(_key(2))
+    log.close()
+
+    reopened = OrderKeyLog(path, capacity=10, fsync='never')
+    assert list(reopened.keys) == [_key(1), _key(2)]
+    assert not reopened.add(_key(2))
+    reopened.close()
+
+
+def test_key_log_keeps_the_last_keys_and_compacts(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    log = OrderKeyLog(path, capacity=3, fsync='never', compact_factor=2)
+    for i in range(10):
+        assert log.add(_key(i))
+    assert list(log.keys) == [_key(7), _key(8), _key(9)]
+    # An evicted key is accepted again.
+    assert log.add(_key(0))
+    log.close()
+    # Compacted: the file never holds more than compact_factor x capacity records.
+    assert os.path.getsize(path) <= 26 + 2 * 3 * 65
+
+    reopened = OrderKeyLog(path, capacity=3, fsync='never')
+    assert list(reopened.keys) == [_key(8), _key(9), _key(0)]
+    reopened.close()
+
+
+def test_key_log_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    first = OrderKeyLog(path, capacity=3, fsync='never', compact_factor=2)
+    second = OrderKeyLog(path, capacity=3, fsync='never', compact_factor=2)
+    assert first.add(_key(1))
+    assert not second.add(_key(1))
+    # The compaction triggered by one instance is picked up by the other.
+    for i in range(2, 10):
+        assert second.add(_key(i))
+    assert _key(9) in first
+    assert list(first.keys) == list(second.keys)
+    first.close()
+    second.close()
+
+
+def test_key_log_skips_a_torn_record(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    log = OrderKeyLog(path, capacity=10, fsync='never')
+    log.add(_key(1))
+    log.close()
+    with open(path, 'ab') as f:
+        f.write(_key(2)[:20].encode())
+
+    log = OrderKeyLog(path, capacity=10, fsync='never')
+    assert list(log.keys) == [_key(1)]
+    assert log.add(_key(3))
+    log.close()
+    log = OrderKeyLog(path, capacity=10, fsync='never')
+    assert list(log.keys) == [_key(1), _key(3)]
+    log.close()
+
+
+def test_key_log_imports_the_legacy_json_cache(tmp_path):
+    legacy = tmp_path / 'order_cache.json'
+    legacy.write_text('["%s", "%s", "not a key"]' % (_key(1), _key(2)))
+    log = OrderKeyLog(str(tmp_path / 'orders.wal'), capacity=10, fsync='never', legacy_json=str(legacy))
+    assert list(log.keys) == [_key(1), _key(2)]
+    log.close()
+
+
+def test_key_log_buffered_mode_writes_on_close(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    log = OrderKeyLog(path, capacity=10, shared=False, fsync='never', flush_interval=60)
+    assert log.add(_key(1))
+    assert not log.add(_key(1))
+    log.close()
+    log = OrderKeyLog(path, capacity=10, fsync='never')
+    assert _key(1) in log
+    log.close()
+
+
+def _add_keys(path, keys, accepted):
+    log = OrderKeyLog(path, capacity=1000, fsync='never')
+    accepted.put([key for key in keys if log.add(key)])
+    log.close()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='needs fork')
+def test_key_log_accepts_a_key_in_one_process_only(tmp_path):
+    path = str(tmp_path / 'orders.wal')
+    keys = [_key(i) for i in range(300)]
+    ctx = multiprocessing.get_context('fork')
+    accepted = ctx.Queue()
+    workers = [ctx.Process(target=_add_keys, args=(path, keys, accepted)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    results = [accepted.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert sorted(key for result in results for key in result) == keys
+
+
+# --- OrderHistoryIndex ---
+
+NOW = datetime(2024, 6, 1, 12)
+
+
+def _history_order(ticket, when, comment='sig', price_open=1.1, sl=1.09):
+    return SimpleNamespace(ticket=ticket, time_setup=when.timestamp(), comment=comment,
+                           price_open=price_open, sl=sl)
+
+
+def test_history_index_matches_comment_and_rounded_prices():
+    terminal = FakeTerminal()
+    terminal.history = [_history_order(1, NOW - timedelta(days=2), price_open=1.1 + 1e-12)]
+    index = OrderHistoryIndex(terminal)
+    assert index.sync(NOW)
+    assert index.contains('sig', 1.1, 1.09, sync=False)
+    assert not index.contains('sig', 1.1, 1.08, sync=False)
+    assert not index.contains('other', 1.1, 1.09, sync=False)
+
+
+def test_history_index_syncs_incrementally_and_dedups_by_ticket():
+    terminal = FakeTerminal()
+    terminal.history = [_history_order(1, NOW - timedelta(days=2))]
+    index = OrderHistoryIndex(terminal, overlap=timedelta(hours=1))
+    index.sync(NOW)
+    later = NOW + timedelta(minutes=5)
+    terminal.history.append(_history_order(2, later, price_open=1.2))
+    assert index.sync(later)
+
+    _, date_from, date_to = terminal.calls[-1]
+    assert (date_from, date_to) == (NOW - timedelta(hours=1), later + timedelta(hours=1))
+    # Order 1 came back in the overlap and is indexed once.
+    assert len(index) == 2
+    assert index.contains('sig', 1.2, 1.09, sync=False)
+
+
+def test_history_index_expires_and_resyncs():
+    terminal = FakeTerminal()
+    terminal.history = [_history_order(1, NOW - timedelta(days=29)), _history_order(2, NOW, price_open=1.2)]
+    index = OrderHistoryIndex(terminal, window=timedelta(days=30), resync_interval=timedelta(days=3))
+    index.sync(NOW)
+    assert len(index) == 2
+
+    # Incremental sync: order 1 is now older than the window.
+    index.sync(NOW + timedelta(days=2))
+    assert not index.contains('sig', 1.1, 1.09, sync=False)
+    assert index.contains('sig', 1.2, 1.09, sync=False)
+
+    # A full resync drops orders the terminal no longer reports.
+    terminal.history = []
+    index.sync(NOW + timedelta(days=3))
+    assert len(index) == 0
+
+
+def test_history_index_keeps_its_state_when_the_terminal_fails():
+    terminal = FakeTerminal()
+    terminal.history = [_history_order(1, NOW)]
+    index = OrderHistoryIndex(terminal)
+    index.sync(NOW)
+    terminal.unavailable = True
+    assert not index.sync(NOW + timedelta(hours=2))
+    assert index.contains('sig', 1.1, 1.09, sync=False)
+
+
+# --- TerminalState ---
+
+def _fetches(terminal):
+    return terminal.calls.count('positions_get')
+
+
+def test_terminal_state_shares_one_snapshot_per_cycle():
+    terminal = FakeTerminal()
+    terminal.positions = [_position(1), _position(2, comment='other', type=1)]
+    state = TerminalState(terminal)
+    with state.cycle():
+        assert [p.ticket for p in state.positions('EURUSD')] == [1, 2]
+        assert [p.ticket for p in state.positions('EURUSD', comment='sig')] == [1]
+        assert [p.ticket for p in state.positions('EURUSD', type=1)] == [2]
+        assert state.orders('EURUSD') == ()
+        with state.cycle():
+            assert state.positions('GBPUSD') == ()
+    assert _fetches(terminal) == 1
+
+
+def test_terminal_state_new_cycle_sees_changes_made_since_the_last_one():
+    # Regression: a cycle used to reuse the snapshot of the previous one, so a position
+    # opened in between (by another process or EA) was missed.
+    terminal = FakeTerminal()
+    state = TerminalState(terminal, max_age=60)
+    with state.cycle():
+        assert state.positions('EURUSD') == ()
+    terminal.positions.append(_position(1))
+    with state.cycle():
+        assert [p.ticket for p in state.positions('EURUSD')] == [1]
+    assert _fetches(terminal) == 2
+
+
+def test_terminal_state_reads_live_state_outside_a_cycle():
+    terminal = FakeTerminal()
+    state = TerminalState(terminal)
+    assert state.positions('EURUSD') == ()
+    terminal.positions += [_position(1), _position(2, comment='other'), _position(3, symbol='GBPUSD')]
+    assert [p.ticket for p in state.positions('EURUSD')] == [1, 2]
+    assert [p.ticket for p in state.positions('EURUSD', comment='sig', type=0)] == [1]
+    # Only the collection asked for is fetched.
+    assert terminal.calls == ['positions_get'] * 3
+    assert state.fetches == 3
+
+    cached = TerminalState(terminal, max_age=60)
+    cached.positions('EURUSD')
+    cached.positions('EURUSD')
+    assert _fetches(terminal) == 4
+
+
+def test_terminal_state_refetches_after_invalidate():
+    terminal = FakeTerminal()
+    state = TerminalState(terminal)
+    with state.cycle():
+        state.positions('EURUSD')
+        terminal.positions.append(_position(1))
+        state.invalidate()
+        assert len(state.positions('EURUSD')) == 1
+    assert _fetches(terminal) == 2
+
+
+def test_terminal_state_does_not_cache_a_failed_fetch():
+    terminal = FakeTerminal()
+    terminal.unavailable = True
+    state = TerminalState(terminal)
+    with state.cycle():
+        assert state.positions('EURUSD') is None
+        terminal.unavailable = False
+        terminal.positions.append(_position(1))
+        assert len(state.positions('EURUSD')) == 1
+    terminal.unavailable = True
+    assert state.orders('EURUSD') is None
+
+
+# --- BulkExecutor ---
+
+def _executor(terminal, **kwargs):
+    return BulkExecutor(terminal, backoff=0, **kwargs)
+
+
+def _orders(*tickets):
+    return [SimpleNamespace(ticket=ticket, symbol='EURUSD', comment='sig', type=2) for ticket in tickets]
+
+
+def test_bulk_runs_on_the_calling_thread_by_default():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1, 2, 3)
+    threads = set()
+    send = terminal.order_send
+
+    def order_send(request):
+        threads.add(threading.current_thread())
+        return send(request)
+
+    report = BulkExecutor(terminal, send=order_send).remove_orders('EURUSD', [1, 2, 3])
+    assert threads == {threading.current_thread()}
+    assert [r.ticket for r in report.ok] == [1, 2, 3]
+    assert terminal.orders == []
+
+
+def test_bulk_pool_keeps_submission_order():
+    terminal = FakeTerminal()
+    terminal.positions = [_position(t) for t in range(10)]
+    executor = _executor(terminal, max_workers=4)
+    report = executor.close_positions('EURUSD', range(10))
+    executor.shutdown()
+    assert [r.ticket for r in report.results] == list(range(10))
+    assert report.stats()['ok'] == 10
+
+
+def test_bulk_retries_transient_retcodes_only():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1, 2)
+    terminal.replies = [terminal.TRADE_RETCODE_REQUOTE, terminal.TRADE_RETCODE_DONE, terminal.TRADE_RETCODE_INVALID]
+    report = _executor(terminal).remove_orders('EURUSD', [1, 2])
+    first, second = report.results
+    assert (first.ok, first.attempts) == (True, 2)
+    assert (second.ok, second.attempts, second.retcode) == (False, 1, terminal.TRADE_RETCODE_INVALID)
+
+
+def test_bulk_does_not_resend_a_request_that_went_through_without_response():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1)
+    terminal.replies = ['applied']
+    result = _executor(terminal).remove_orders('EURUSD', [1]).results[0]
+    assert (result.ok, result.attempts) == (True, 1)
+    assert result.error == terminal.last_error()
+    assert terminal.calls.count(('order_send', 1)) == 1
+
+
+def test_bulk_resends_a_lost_request_while_the_ticket_is_open():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1)
+    terminal.replies = ['lost']
+    result = _executor(terminal).remove_orders('EURUSD', [1]).results[0]
+    assert (result.ok, result.attempts) == (True, 2)
+    assert terminal.orders == []
+
+
+def test_bulk_gives_up_when_the_ticket_state_is_unknown():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1)
+    terminal.replies = ['lost']
+    send = terminal.order_send
+
+    def order_send(request):
+        result = send(request)
+        terminal.unavailable = True
+        return result
+
+    result = _executor(terminal, send=order_send).remove_orders('EURUSD', [1]).results[0]
+    assert (result.ok, result.attempts) == (False, 1)
+
+
+def test_bulk_does_not_retry_a_failed_close():
+    terminal = FakeTerminal()
+    terminal.positions = [_position(1)]
+    result = _executor(terminal, close=lambda symbol, ticket: False).close_positions('EURUSD', [1]).results[0]
+    assert (result.ok, result.attempts, result.error) == (False, 1, False)
+
+
+def test_bulk_records_terminal_errors_and_raises_the_others():
+    terminal = FakeTerminal()
+    terminal.orders = _orders(1)
+    terminal.replies = [ConnectionResetError('pipe closed')]
+    result = _executor(terminal).remove_orders('EURUSD', [1]).results[0]
+    assert not result.ok
+    assert isinstance(result.error, ConnectionResetError)
+
+    terminal.replies = [KeyError('order')]
+    with pytest.raises(KeyError):
+        _executor(terminal).remove_orders('EURUSD', [1])
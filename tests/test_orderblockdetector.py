@@ -0,0 +1,76 @@
+"""
+Parity of the numpy, multi-length and streaming detectors with the loop reference of
+detect_order_blocks.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from orderblockdetector import OrderBlockDetector, detect_order_blocks, detect_order_blocks_multi
+
+
+def _candles(n=400, seed=0, tz='UTC'):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = rng.uniform(0.1, 2.0, n)
+    return pd.DataFrame({
+        'time': pd.date_range('2024-01-01', periods=n, freq='h', tz=tz),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        # Integer volumes, so equal neighbours exercise the pivot tie rules.
+        'volume': rng.integers(1, 20, n).astype(float),
+    })
+
+
+@pytest.mark.parametrize('mitigation', ['Wick', 'Close'])
+@pytest.mark.parametrize('length', [1, 3, 5])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_numpy_engine_matches_loop(seed, length, mitigation):
+    df = _candles(seed=seed)
+    loop_df, loop_bull, loop_bear = detect_order_blocks(df, length=length, mitigation=mitigation)
+    np_df, np_bull, np_bear = detect_order_blocks(df, length=length, mitigation=mitigation, engine='numpy')
+
+    pd.testing.assert_frame_equal(np_df, loop_df)
+    assert np_bull == loop_bull
+    assert np_bear == loop_bear
+
+
+@pytest.mark.parametrize('mitigation', ['Wick', 'Close'])
+def test_multi_matches_loop(mitigation):
+    df = _candles(seed=2)
+    multi = detect_order_blocks_multi(df, lengths=(1, 2, 3, 4, 5, 6, 7), mitigation=mitigation)
+    for length, (bull, bear) in multi.items():
+        _, loop_bull, loop_bear = detect_order_blocks(df, length=length, mitigation=mitigation)
+        assert (bull, bear) == (loop_bull, loop_bear), length
+
+
+@pytest.mark.parametrize('mitigation', ['Wick', 'Close'])
+@pytest.mark.parametrize('length', [1, 3, 5])
+def test_streaming_matches_loop(length, mitigation):
+    df = _candles(n=250, seed=3)
+    detector = OrderBlockDetector(length=length, mitigation=mitigation)
+    for _, bar in df.iterrows():
+        detector.update(bar)
+    _, loop_bull, loop_bear = detect_order_blocks(df, length=length, mitigation=mitigation)
+
+    assert detector.active_bull_OB == loop_bull
+    assert detector.active_bear_OB == loop_bear
+
+
+def test_streaming_from_dataframe_and_replaced_bar():
+    df = _candles(n=300, seed=4)
+    detector = OrderBlockDetector.from_dataframe(df.iloc[:200], length=3)
+    for j in range(200, len(df)):
+        # The forming candle is sent twice: first a provisional version, then the final one.
+        provisional = df.iloc[j].copy()
+        provisional['high'] += 5
+        provisional['volume'] = 1.0
+        detector.update(provisional)
+        detector.update(df.iloc[j])
+    _, loop_bull, loop_bear = detect_order_blocks(df, length=3)
+
+    assert detector.active_bull_OB == loop_bull
+    assert detector.active_bear_OB == loop_bear
@@ -5,6 +5,8 @@ from typing import Dict
 from binance.client import Client
 from tqdm import tqdm
 
+from src.metastore import write_store
+
 API_KEY = 'oMljnMnvrm4CsQIstONUiHbbhOdsWYjZRkiXMT1nZvP7LKl1kIymQMOq7TeFopkW'
 API_SECRET = '9kK8TwSF7Q0t7qXxzjQThZZZwGd7IP0mDbuk5a4zg7pMGwQIsHwzZWxL3iWehD47'
 
@@ -56,6 +58,10 @@ def main() -> None:
     token_info = fetch_token_info(client)
     save_to_pickle(token_info, "token_info.pkl")
 
+    # Running apps pick the new data up from the store on their next lookup.
+    write_store(brackets, token_info)
+    logging.info("Updated the symbol metadata store")
+
 
 if __name__ == "__main__":
     main()